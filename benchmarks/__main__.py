@@ -0,0 +1,90 @@
+"""
+Runs the roulette, blackjack and slots simulations headlessly and compares them to the saved baseline.
+
+The games are driven through the engines in classes/engines, which don't touch Discord, so nothing needs to connect.
+A change in return to player bigger than the simulation's own noise, or a drop in speed, is reported as a regression.
+
+Run from the repository root with: python -m benchmarks [--rounds N] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import sys
+
+from benchmarks import blackjack, roulette, slots
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+GAMES = {
+    "roulette": roulette.run,
+    "blackjack": blackjack.run,
+    "slots": slots.run,
+}
+
+
+def find_regressions(results: dict, baseline: dict, speed_tolerance: float) -> list[str]:
+    regressions = []
+    for game, result in results.items():
+        if game not in baseline:
+            continue
+        old = baseline[game]
+
+        # Four standard errors of both runs, so random noise alone almost never trips it
+        noise = 4 * ((result["variance"] / result["rounds"]) + (old["variance"] / old["rounds"])) ** 0.5
+        if abs(result["rtp"] - old["rtp"]) > noise:
+            regressions.append(f"{game}: return to player moved from {old['rtp']:.4f} to {result['rtp']:.4f} "
+                               f"(more than the {noise:.4f} expected from chance)")
+
+        if result["rounds_per_second"] < old["rounds_per_second"] * (1 - speed_tolerance):
+            regressions.append(f"{game}: {result['rounds_per_second']:,.0f} rounds/s, "
+                               f"down from {old['rounds_per_second']:,.0f}")
+
+        if result["payout_latency_us"] > old["payout_latency_us"] * (1 + speed_tolerance):
+            regressions.append(f"{game}: payout took {result['payout_latency_us']:.2f}us, "
+                               f"up from {old['payout_latency_us']:.2f}us")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=1_000_000, help="Rounds to simulate per game")
+    parser.add_argument("--games", nargs="+", choices=GAMES, default=list(GAMES))
+    parser.add_argument("--speed-tolerance", type=float, default=0.3,
+                        help="How much slower than the baseline is allowed before it counts as a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="Save these results as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for game in args.games:
+        print(f"Simulating {args.rounds:,} rounds of {game}...")
+        result = GAMES[game](args.rounds)
+        results[game] = result
+        print(f"  {result['rounds_per_second']:>12,.0f} rounds/s   RTP {result['rtp']:.4f}   "
+              f"variance {result['variance']:.2f}   payout {result['payout_latency_us']:.2f}us")
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as file:
+            baseline = json.load(file)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as file:
+            json.dump(baseline, file, indent=4)
+        print(f"Baseline saved to {BASELINE_FILE}")
+        return
+
+    if not baseline:
+        print("No baseline to compare with. Run with --update-baseline to save one.")
+        return
+
+    regressions = find_regressions(results, baseline, args.speed_tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
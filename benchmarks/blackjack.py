@@ -0,0 +1,66 @@
+"""
+Measures how many blackjack hands per second the card engine can deal and settle.
+
+Run from the repository root with: python -m benchmarks.blackjack [--hands N] [--decks N] [--penetration P]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.stats import summarize, latency_us
+from classes.engines import cards
+from classes.engines.cards import Shoe
+
+
+def play_hand(shoe: Shoe, bet: int = 100) -> int:
+    """
+    Plays one hand with the player hitting until 17 like the dealer does. The hand is ended and paid out with the
+    same functions Blackjack uses, so a change to how the bot pays shows up here.
+    :return: The player's net result for the hand
+    """
+    shoe.start_round()
+    player = [shoe.draw(), shoe.draw()]
+    dealer = [shoe.draw(), shoe.draw()]
+
+    result = cards.opening_result(player, dealer)
+    if result is None:
+        player_total = cards.hand_value(player)
+        while player_total < 17:
+            player.append(shoe.draw())
+            player_total = cards.hand_value(player)
+        if player_total > 21:
+            result = "player_bust"
+        else:
+            result = cards.final_result(player_total, cards.dealer_play(dealer, shoe.draw))
+    return cards.payout(result, bet) - bet
+
+
+def run(hands: int, decks: int = Shoe.DECKS, penetration: float = Shoe.PENETRATION, seed: int = 0) -> dict:
+    shoe = Shoe(decks, penetration, random.Random(seed))
+    bet = 100
+
+    start = time.perf_counter()
+    nets = [play_hand(shoe, bet) for _ in range(hands)]
+    elapsed = time.perf_counter() - start
+
+    result = summarize(nets, hands * bet, elapsed)
+    result["payout_latency_us"] = latency_us(lambda: play_hand(shoe, bet))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hands", type=int, default=200_000)
+    parser.add_argument("--decks", type=int, default=Shoe.DECKS)
+    parser.add_argument("--penetration", type=float, default=Shoe.PENETRATION)
+    args = parser.parse_args()
+
+    result = run(args.hands, args.decks, args.penetration)
+    print(f"{result['rounds']} hands in {result['seconds']:.2f}s "
+          f"({result['rounds_per_second']:,.0f} hands/s, {args.decks} decks, {args.penetration:.0%} penetration)")
+    print(f"Return to player: {result['rtp']:.4f}, variance: {result['variance']:.2f}")
+    print(f"Dealing and settling one hand: {result['payout_latency_us']:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
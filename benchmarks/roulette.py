@@ -0,0 +1,48 @@
+"""
+Simulates roulette tables with the payout table engine and reports the return to player and speed.
+
+Run from the repository root with: python -m benchmarks.roulette [--rounds N] [--players N]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.stats import summarize, latency_us
+from classes.engines import roulette as wheel
+
+BET = 100
+
+
+def run(rounds: int, players: int = 8, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    bet_keys = sorted(wheel.PAYOUT_TABLE)
+
+    # Every round is a full table of random bets, settled the way Roulette._handle_payout does it
+    nets = []
+    start = time.perf_counter()
+    for _ in range(rounds // players):
+        table = [(key, BET) for key in rng.choices(bet_keys, k=players)]
+        pocket = rng.randrange(wheel.POCKETS)
+        nets.extend(payout - BET for payout in wheel.settle(table, pocket))
+    elapsed = time.perf_counter() - start
+
+    result = summarize(nets, len(nets) * BET, elapsed)
+    table = [(key, BET) for key in rng.choices(bet_keys, k=players)]
+    result["payout_latency_us"] = latency_us(lambda: wheel.settle(table, 17))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=1_000_000, help="Bets to settle")
+    parser.add_argument("--players", type=int, default=8, help="Bets per table")
+    args = parser.parse_args()
+
+    result = run(args.rounds, args.players)
+    print(f"{result['rounds']} bets in {result['seconds']:.2f}s ({result['rounds_per_second']:,.0f} bets/s)")
+    print(f"Return to player: {result['rtp']:.4f}, variance: {result['variance']:.2f}")
+    print(f"Settling a table of {args.players}: {result['payout_latency_us']:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Simulates slot machine spins with the outcome table engine and reports the return to player and speed.
+
+Run from the repository root with: python -m benchmarks.slots [--rounds N] [--bet N]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.stats import summarize, latency_us
+from classes.engines import slots as reels
+
+BATCH = 10_000  # Spins rolled per batch, like a very long auto spin
+
+
+def run(rounds: int, bet: int = 100, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+
+    nets = []
+    start = time.perf_counter()
+    for done in range(0, rounds, BATCH):
+        nets.extend(reels.settle_batch(reels.spin_batch(min(BATCH, rounds - done), rng), bet))
+    elapsed = time.perf_counter() - start
+
+    result = summarize(nets, len(nets) * bet, elapsed)
+    result["exact_rtp"] = reels.return_to_player(bet)[0]
+    result["payout_latency_us"] = latency_us(lambda: reels.net_result(rng.randrange(reels.OUTCOMES), bet))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=1_000_000, help="Spins to simulate")
+    parser.add_argument("--bet", type=int, default=100)
+    args = parser.parse_args()
+
+    result = run(args.rounds, args.bet)
+    print(f"{result['rounds']} spins in {result['seconds']:.2f}s ({result['rounds_per_second']:,.0f} spins/s)")
+    print(f"Return to player: {result['rtp']:.4f} (exact: {result['exact_rtp']:.4f}), "
+          f"variance: {result['variance']:.2f}")
+    print(f"Settling one spin: {result['payout_latency_us']:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import time
+from typing import Callable, Sequence
+
+
+def summarize(nets: Sequence[int], stakes: int, seconds: float) -> dict:
+    """
+    Turns the net results of a simulation into the numbers the benchmarks report.
+    :param nets: The player's net result of every round
+    :param stakes: The total amount bet over all the rounds
+    :param seconds: How long the rounds took to play
+    """
+    rounds = len(nets)
+    total = sum(nets)
+    # Variance of a round's net result, in bets
+    stake = stakes / rounds
+    mean = total / rounds / stake
+    variance = sum((net / stake) ** 2 for net in nets) / rounds - mean ** 2
+
+    return {
+        "rounds": rounds,
+        "seconds": seconds,
+        "rounds_per_second": rounds / seconds,
+        "rtp": 1 + total / stakes,
+        "variance": variance,
+    }
+
+
+def latency_us(function: Callable[[], object], calls: int = 10_000, repeats: int = 5) -> float:
+    """
+    The average time one call of the function takes, in microseconds.
+    Like timeit, the best of a few repeats is used, since slower repeats are just other things getting in the way.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1_000_000
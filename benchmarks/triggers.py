@@ -0,0 +1,130 @@
+"""
+Runs a synthetic stream of guild messages through the checks on_message makes, the way it used to make them and the
+way it makes them now, and reports the messages per second of both.
+
+Most messages come from users that aren't favoured, which on_message now turns away with one set lookup. The rest are
+scanned by classes/engines/triggers.py, which casefolds the message once and only runs the blessing pattern when
+"bless" is in it, instead of lowercasing the message for each flag and splitting it to look for blessings.
+
+Each check is timed several times, taking turns, and the fastest time of each is reported, so neither gains from
+running second.
+
+Run from the repository root with: python -m benchmarks.triggers [--messages N] [--favoured PERCENT] [--repeats N]
+"""
+import argparse
+import random
+import time
+
+from classes.engines import triggers
+
+FAVOURED = frozenset({1, 2, 3})
+WORDS = ("hey", "everyone", "did", "anyone", "see", "the", "match", "last", "night", "it", "was", "wild", "lol", "so",
+         "hungry", "dinosaur", "berries", "hunting", "later", "tonight", "with", "my", "herd", "stealing", "is", "fun")
+TRIGGERS = ("pagget", "thanks", "love", "you", "suck", "berries pls", "list berries", "bless <@1234> with 50")
+
+
+def make_stream(count: int, favoured_percent: float, seed: int = 0) -> list:
+    """ (author ID, content) of each message. Some of the favoured users' messages have triggers in them """
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(count):
+        author = rng.choice(tuple(FAVOURED)) if rng.random() * 100 < favoured_percent else rng.randrange(10, 10**6)
+        words = rng.choices(WORDS, k=rng.randint(3, 40))
+        if author in FAVOURED and rng.random() < 0.3:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(TRIGGERS))
+        stream.append((author, " ".join(words)))
+    return stream
+
+
+def legacy(author: int, content: str) -> int:
+    """ The checks on_message used to make, without sending anything. Returns how many triggers were found """
+    favored_ones = [1, 2, 3]
+    love_message_flags = ["thx", "thanks", "thank", "love"]
+    hate_message_flags = ["suck", "die", "bozo", "loser", "stupid", "hate"]
+    found = 0
+
+    if content.startswith("-#"):
+        found += 1
+
+    if author in favored_ones:
+        split_message = content.split(" ")
+        if "berries pls" in content.lower():
+            found += 1
+
+        for index, word in enumerate(split_message):
+            if (word == "bless" and index + 2 < len(split_message) and split_message[index + 1].strip() and
+                    split_message[index + 2] == "with"):
+                found += 1
+
+        if "list berries" in content.lower():
+            found += 1
+
+        for mean_word in hate_message_flags:
+            if mean_word in content.lower() and "pagget" in content.lower():
+                found += 1
+                break
+
+        for mean_word in love_message_flags:
+            if mean_word in content.lower() and "pagget" in content.lower():
+                found += 1
+                break
+    return found
+
+
+def current(author: int, content: str) -> int:
+    """ The checks on_message makes now """
+    found = 0
+    if content.startswith("-#"):
+        found += 1
+
+    if author not in FAVOURED:
+        return found
+
+    found_triggers = triggers.scan(content)
+    found += found_triggers.begging + found_triggers.list_berries + len(found_triggers.blessings)
+    if found_triggers.pagget:
+        found += found_triggers.hate + found_triggers.love
+    return found
+
+
+def run(messages: int, favoured_percent: float = 1.0, seed: int = 0, repeats: int = 3) -> dict:
+    stream = make_stream(messages, favoured_percent, seed)
+    favoured = [message for message in stream if message[0] in FAVOURED]
+
+    results = {name: {"found": 0, "elapsed": float("inf"), "favoured_elapsed": float("inf")}
+               for name in ("legacy", "current")}
+    for _ in range(repeats):
+        for name, check in (("legacy", legacy), ("current", current)):
+            result = results[name]
+            start = time.perf_counter()
+            result["found"] = sum(check(author, content) for author, content in stream)
+            result["elapsed"] = min(result["elapsed"], time.perf_counter() - start)
+
+            # The favoured users' messages on their own, where the scanning happens
+            start = time.perf_counter()
+            for author, content in favoured:
+                check(author, content)
+            result["favoured_elapsed"] = min(result["favoured_elapsed"], time.perf_counter() - start)
+
+    return {name: {
+        "found": result["found"],
+        "messages_per_second": len(stream) / result["elapsed"],
+        "favoured_us": result["favoured_elapsed"] / max(1, len(favoured)) * 1_000_000,
+    } for name, result in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000, help="Messages in the stream")
+    parser.add_argument("--favoured", type=float, default=1.0, help="Percent of messages sent by favoured users")
+    parser.add_argument("--repeats", type=int, default=3, help="How many times each check is timed")
+    args = parser.parse_args()
+
+    results = run(args.messages, args.favoured, repeats=args.repeats)
+    for name, result in results.items():
+        print(f"{name:>8}: {result['messages_per_second']:>12,.0f} messages/s   "
+              f"{result['favoured_us']:.2f}us per favoured message   {result['found']} triggers")
+
+
+if __name__ == "__main__":
+    main()
@@ -41,8 +41,8 @@ class AfflictionController:
         return commons + uncommons + rares + ultra_rares
 
     @staticmethod
-    def roll(afflictions: List[Affliction], affliction_chance: float, roll_type: str, season: str) -> (Affliction,
-                                                                                                       bool):
+    def roll(afflictions: List[Affliction], affliction_chance: float, roll_type: str, season: str,
+             rng: random.Random = random) -> (Affliction, bool):
         result = []
         available_afflictions = afflictions.copy()
 
@@ -51,7 +51,7 @@ class AfflictionController:
             if not available_afflictions:
                 break
 
-            if random.random() < affliction_chance / 100:
+            if rng.random() < affliction_chance / 100:
                 commons, uncommons, rares, ultra_rares = AfflictionController._sort_seasonal_rarities(
                     available_afflictions, season)
 
@@ -83,8 +83,8 @@ class AfflictionController:
 
                 # Select a group based on rarity weights, then select random affliction from that group
                 if non_empty_groups:
-                    selected_group = random.choices(non_empty_groups, weights=non_empty_weights, k=1)[0]
-                    selected_affliction = random.choice(selected_group)
+                    selected_group = rng.choices(non_empty_groups, weights=non_empty_weights, k=1)[0]
+                    selected_affliction = rng.choice(selected_group)
 
                     result.append(selected_affliction)
                     available_afflictions.remove(selected_affliction)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from discord import app_commands
+
+from classes.logger import get_logger
+from classes.permissions import has_admin_check
+
+MANIFEST_FILE = os.path.join("data", "command_manifest.json")
+
+log = get_logger("Commands")
+
+
+def _hash(payload) -> str:
+    """ A hash of anything JSON can hold. Keys are sorted, so it doesn't change with the order things were added in """
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+
+
+class CommandManifest:
+    """
+    What the command tree looked like when it was last synced with Discord.
+
+    Every top-level command is serialized the way it's sent to Discord and hashed, and the tree's hash covers all of
+    them, so comparing it with the stored manifest tells if a sync is needed at all and which commands changed. Guilds
+    that were given a copy of the global commands are remembered with the tree hash they were synced with, so only the
+    ones that are out of date are synced again.
+
+    It also keeps each command's description and whether it needs administrator, which the report printed on ready is
+    made from.
+    """
+
+    def __init__(self, commands: Dict[str, str], entries: List[dict], tree_hash: Optional[str],
+                 guilds: Optional[Dict[int, str]] = None):
+        """
+        :param commands: The hash of each top-level command, indexed by name
+        :param entries: Each top-level command's name, description and admin flag, with a group's commands under
+        "commands"
+        :param tree_hash: The hash of every command together
+        :param guilds: The tree hash each guild was last synced with, indexed by guild ID
+        """
+        self.commands = commands
+        self.entries = entries
+        self.tree_hash = tree_hash
+        self.guilds = guilds if guilds is not None else {}
+
+    @classmethod
+    def from_tree(cls, tree: app_commands.CommandTree) -> "CommandManifest":
+        top_level = sorted(tree.get_commands(), key=lambda c: c.name)
+        commands = {command.name: _hash(command.to_dict(tree)) for command in top_level}
+        return cls(commands, [cls._entry(command) for command in top_level], _hash(commands))
+
+    @staticmethod
+    def _entry(command) -> dict:
+        entry = {
+            "name": command.name,
+            "description": getattr(command, "description", ""),  # Context menus don't have one
+            "admin": has_admin_check(command),
+        }
+        if isinstance(command, app_commands.Group):
+            entry["commands"] = [CommandManifest._entry(c) for c in sorted(command.commands, key=lambda c: c.name)]
+        return entry
+
+    def diff(self, synced: Optional["CommandManifest"]) -> Tuple[List[str], List[str], List[str]]:
+        """ The top-level commands that were added, changed and removed since `synced` """
+        old = synced.commands if synced is not None else {}
+        added = [name for name in self.commands if name not in old]
+        changed = [name for name in self.commands if name in old and old[name] != self.commands[name]]
+        removed = [name for name in old if name not in self.commands]
+        return added, changed, removed
+
+    def stale_guilds(self) -> List[int]:
+        """ The guilds that were synced with a different tree than this one """
+        return [guild_id for guild_id, tree_hash in self.guilds.items() if tree_hash != self.tree_hash]
+
+    # --- Saving and loading --- #
+    @classmethod
+    def load(cls, path: str = MANIFEST_FILE) -> Optional["CommandManifest"]:
+        """ The manifest from the last sync, or None if there hasn't been one """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "r") as file:
+                raw = json.load(file)
+        except (OSError, ValueError) as e:
+            log.warning("Couldn't read the command manifest, syncing everything: %s", e)
+            return None
+
+        return cls(raw.get("commands", {}), raw.get("entries", []), raw.get("tree_hash"),
+                   {int(guild_id): tree_hash for guild_id, tree_hash in raw.get("guilds", {}).items()})
+
+    def save(self, path: str = MANIFEST_FILE) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({
+                "tree_hash": self.tree_hash,
+                "commands": self.commands,
+                "guilds": self.guilds,
+                "entries": self.entries,
+            }, file, indent=4)
+        os.replace(temp_path, path)
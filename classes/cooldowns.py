@@ -0,0 +1,84 @@
+import heapq
+import time
+from typing import Dict, List, Tuple
+
+
+class CooldownTracker:
+    """
+    Tracks per user command cooldowns as expiry timestamps.
+
+    Every (command, user) pair is stored as a single integer unix timestamp of when the cooldown ends, so they can be
+    saved next to the rest of the bot data and survive restarts. A heap ordered by expiry is used to drop finished
+    cooldowns, so the tracker only ever holds users that are actually on cooldown.
+    """
+
+    def __init__(self):
+        self._expiries: Dict[str, Dict[int, int]] = {}  # Expiry timestamps, indexed by command then user ID
+        self._heap: List[Tuple[int, str, int]] = []  # (expiry, command, user ID), soonest expiry first
+
+    def __len__(self):
+        return sum(len(users) for users in self._expiries.values())
+
+    def get_retry_after(self, command: str, user_id: int) -> float:
+        """ Returns how many seconds the user has left on the command's cooldown, or 0 if they can use it. """
+        now = time.time()
+        self._expire(now)
+
+        expiry = self._expiries.get(command, {}).get(user_id)
+        if expiry is None or expiry <= now:
+            return 0
+        return expiry - now
+
+    def trigger(self, command: str, user_id: int, per: int) -> None:
+        """ Puts the user on cooldown for the command for `per` seconds. """
+        self.set_expiry(command, user_id, int(time.time()) + per)
+
+    def set_expiry(self, command: str, user_id: int, expiry: int) -> None:
+        """ Puts the user on cooldown for the command until `expiry`, a unix timestamp. """
+        self._expiries.setdefault(command, {})[user_id] = expiry
+        heapq.heappush(self._heap, (expiry, command, user_id))
+
+    def reset(self, command: str, user_id: int) -> None:
+        """ Removes the user's cooldown for the command. The stale heap entry is skipped when it expires. """
+        self._expiries.get(command, {}).pop(user_id, None)
+
+    def _expire(self, now: float) -> None:
+        """ Pops every cooldown that has finished off the heap. """
+        while self._heap and self._heap[0][0] <= now:
+            expiry, command, user_id = heapq.heappop(self._heap)
+            users = self._expiries.get(command)
+            # Only remove it if it wasn't reset or re-triggered after this heap entry was pushed
+            if users is not None and users.get(user_id) == expiry:
+                del users[user_id]
+                if not users:
+                    del self._expiries[command]
+
+    # --- Methods for saving and loading --- #
+    def to_dict(self) -> Dict[int, Dict[str, int]]:
+        """
+        Returns the active cooldowns indexed by user ID, the same way the other data files are indexed.
+        This gets called from the autosave thread, so it only reads and leaves the heap alone.
+        """
+        now = time.time()
+
+        data: Dict[int, Dict[str, int]] = {}
+        for command, users in list(self._expiries.items()):
+            for user_id, expiry in list(users.items()):
+                if expiry > now:
+                    data.setdefault(user_id, {})[command] = expiry
+        return data
+
+    def restore(self, data: Dict[int, Dict[str, int]]) -> None:
+        """ Loads cooldowns saved by `to_dict`, skipping any that have already finished. """
+        now = time.time()
+        self._expiries = {}
+        self._heap = []
+
+        for user_id, commands in data.items():
+            for command, expiry in commands.items():
+                if expiry > now:
+                    self._expiries.setdefault(command, {})[user_id] = expiry
+                    self._heap.append((expiry, command, user_id))
+
+        heapq.heapify(self._heap)
+
@@ -0,0 +1,169 @@
+import random
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Cards are stored as a single small int: suit * 13 + rank
+RANK_NAMES = ("2", "3", "4", "5", "6", "7", "8", "9", "10", "Jack", "Queen", "King", "Ace")
+SUIT_NAMES = ("hearts", "spades", "diamonds", "clubs")
+ACE = 12  # Rank index of the ace
+DECK_SIZE = 52
+
+# The hard value of every card, indexed by card. Aces count as 1 here, hand values work out if they can be 11
+CARD_VALUES = bytes(10 if RANK_NAMES[card % 13] in ("Jack", "Queen", "King") else
+                    1 if card % 13 == ACE else
+                    int(RANK_NAMES[card % 13])
+                    for card in range(DECK_SIZE))
+
+MAX_HARD_TOTAL = 31  # The highest hard total a hand can reach before it's bust (21 + a 10)
+
+# The best total of a hand, indexed by [hard total][has an ace]. An ace counts as 11 whenever that doesn't bust
+HAND_TOTALS = tuple(
+    (hard, hard + 10 if hard + 10 <= 21 else hard) for hard in range(MAX_HARD_TOTAL + 1)
+)
+# Whether the best total is soft (an ace is counted as 11), indexed the same way
+SOFT_HANDS = tuple(
+    (False, hard + 10 <= 21) for hard in range(MAX_HARD_TOTAL + 1)
+)
+
+
+def card_name(card: int) -> str:
+    return f"{RANK_NAMES[card % 13].title()} :{SUIT_NAMES[card // 13]}:"
+
+
+def hand_state(hand: Sequence[int]) -> Tuple[int, bool]:
+    """ Returns the hard total of the hand and whether it holds an ace """
+    hard = 0
+    has_ace = False
+    for card in hand:
+        hard += CARD_VALUES[card]
+        has_ace = has_ace or card % 13 == ACE
+    return hard, has_ace
+
+
+def hand_value(hand: Sequence[int]) -> int:
+    """ The best total of the hand, counting an ace as 11 if that doesn't bust it """
+    hard, has_ace = hand_state(hand)
+    if hard > MAX_HARD_TOTAL:
+        return hard
+    return HAND_TOTALS[hard][has_ace]
+
+
+def is_soft(hand: Sequence[int]) -> bool:
+    hard, has_ace = hand_state(hand)
+    return hard <= MAX_HARD_TOTAL and SOFT_HANDS[hard][has_ace]
+
+
+class Shoe:
+    """
+    One or more decks shuffled together, stored as a bytearray of card ints.
+
+    Cards are dealt by moving a position through the array rather than removing them. Once the position passes the
+    penetration (how much of the shoe gets dealt before it's reshuffled), the next round starts from a fresh shuffle.
+
+    Every shuffle starts from the cards in order, so the order of a shoe only depends on the generator's seed.
+    """
+
+    DECKS = 6
+    PENETRATION = 0.75
+
+    def __init__(self, decks: int = DECKS, penetration: float = PENETRATION, rng: Optional[random.Random] = None,
+                 streams: Optional[Callable[[], random.Random]] = None):
+        """
+        :param decks: How many decks are shuffled together
+        :param penetration: How much of the shoe is dealt before it's reshuffled
+        :param rng: The generator every shuffle uses
+        :param streams: If given, called for a new generator on every shuffle instead, so each shuffle has its own seed
+        """
+        self.decks = decks
+        self.penetration = penetration
+        self.rng = rng or random.Random()
+        self.streams = streams
+
+        self._ordered = bytes(range(DECK_SIZE)) * decks
+        self.cards = bytearray(self._ordered)
+        self.position = 0
+        self._cut = int(len(self.cards) * penetration)
+        self.shuffle()
+
+    def __len__(self):
+        """ Cards left to deal """
+        return len(self.cards) - self.position
+
+    def shuffle(self) -> None:
+        if self.streams is not None:
+            self.rng = self.streams()
+        self.cards[:] = self._ordered
+        self.rng.shuffle(self.cards)
+        self.position = 0
+
+    @property
+    def seed(self) -> Optional[int]:
+        """ The seed of the current shuffle, if it came from a seeded stream """
+        return getattr(self.rng, "seed_value", None)
+
+    def start_round(self) -> None:
+        """ Reshuffles if the cut card has been reached. Called before each hand is dealt """
+        if self.position >= self._cut:
+            self.shuffle()
+
+    def draw(self) -> int:
+        # Should only happen with very low penetration settings, but it's better than running out
+        if self.position >= len(self.cards):
+            self.shuffle()
+
+        card = self.cards[self.position]
+        self.position += 1
+        return card
+
+    def remaining_values(self) -> List[int]:
+        """ How many cards of each value are left to deal, indexed by value. Index 1 is aces, index 10 is tens """
+        counts = [0] * 11
+        for card in self.cards[self.position:]:
+            counts[CARD_VALUES[card]] += 1
+        return counts
+
+
+# What a hand pays back, stake included, as a multiple of the bet, indexed by how it ended. Anything else loses the bet
+PAYOUT_MULTIPLIERS = {"blackjack": 2.5, "player_wins": 2, "dealer_bust": 2, "push": 1}
+
+
+def payout(result: str, bet: int) -> int:
+    """ What a hand that ended with `result` pays back, stake included """
+    return int(bet * PAYOUT_MULTIPLIERS.get(result, 0))
+
+
+def opening_result(player_hand: Sequence[int], dealer_hand: Sequence[int]) -> Optional[str]:
+    """ How the hand ends straight after the deal, if either side has a blackjack. None if it's played out """
+    player_total = hand_value(player_hand)
+    dealer_total = hand_value(dealer_hand)
+    if player_total == 21 and dealer_total == 21:
+        return "push"
+    if player_total == 21:
+        return "blackjack"
+    if dealer_total == 21:
+        return "dealer_blackjack"
+    return None
+
+
+def final_result(player_total: int, dealer_total: int) -> str:
+    """ How the hand ends once the dealer has played, for a player that didn't bust """
+    if dealer_total > 21:
+        return "dealer_bust"
+    if dealer_total > player_total:
+        return "dealer_wins"
+    if dealer_total < player_total:
+        return "player_wins"
+    return "push"
+
+
+def dealer_play(hand: List[int], draw: Callable[[], int]) -> int:
+    """
+    Draws to the dealer's hand until it's on 17 or more. Returns the final total
+    :param draw: Deals the next card, like `Shoe.draw`
+    """
+    hard, has_ace = hand_state(hand)
+    while hard < 17 and HAND_TOTALS[hard][has_ace] < 17:
+        card = draw()
+        hand.append(card)
+        hard += CARD_VALUES[card]
+        has_ace = has_ace or card % 13 == ACE
+    return hand_value(hand)
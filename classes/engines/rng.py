@@ -0,0 +1,54 @@
+import hashlib
+import itertools
+import random
+import secrets
+from typing import Callable, Optional
+
+
+def derive_seed(master_seed: int, index: int) -> int:
+    """ The seed of the `index`th stream handed out under a master seed. Streams never share a seed in practice """
+    digest = hashlib.blake2b(f"{master_seed}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class Stream(random.Random):
+    """ A random number generator that remembers the seed it was started from, so its rolls can be replayed """
+
+    def __init__(self, seed: int):
+        super().__init__(seed)
+        self.seed_value = seed
+
+
+class RngService:
+    """
+    Hands out an independent, seeded random number generator for every game or roll.
+
+    Each stream's seed is derived from the master seed and the order it was handed out in, and is passed to `record`
+    along with what it was used for. Given a recorded seed, `utils/replay.py` rolls the exact same outcome again.
+    """
+
+    def __init__(self, master_seed: Optional[int] = None, record: Optional[Callable[..., None]] = None):
+        """
+        :param master_seed: The seed every stream is derived from. A random one is picked if not given
+        :param record: Called with a message and the fields (kind, seed and context) of each seed that's handed out,
+        normally to write it to the log
+        """
+        self.master_seed = master_seed if master_seed is not None else secrets.randbits(64)
+        self._record = record
+        self._index = itertools.count()
+
+    def stream(self, kind: str, **context) -> Stream:
+        """
+        A new generator for one game or roll.
+        :param kind: What the stream is for, like "roulette" or "affliction"
+        :param context: Anything that helps find the roll again later, like the session or user ID
+        """
+        seed = derive_seed(self.master_seed, next(self._index))
+        self.record(kind, seed, **context)
+        return Stream(seed)
+
+    def record(self, kind: str, seed: int, **context) -> None:
+        """ Writes a seed to the transaction log. Also used for outcomes taken from a shared stream, like a shoe """
+        if self._record is None:
+            return
+        self._record(f"{kind} seed={seed}", kind=kind, seed=seed, **context)
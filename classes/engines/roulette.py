@@ -0,0 +1,154 @@
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+POCKETS = 37  # 0 to 36, single zero wheel
+
+# The red pockets on a real wheel. Every other pocket besides 0 is black
+RED_NUMBERS: FrozenSet[int] = frozenset({1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36})
+
+# How many times the bet is paid back (stake included) when it wins. The bet is taken when it's placed
+PAYOUT_MULTIPLIERS: Dict[str, int] = {
+    "straight": 36,  # 35:1
+    "split": 18,  # 17:1
+    "street": 12,  # 11:1
+    "corner": 9,  # 8:1
+    "line": 6,  # 5:1
+    "column": 3,  # 2:1
+    "dozen": 3,  # 2:1
+    "even money": 2,  # 1:1
+}
+
+# Bets that are placed on specific numbers. They need the numbers picked along with the bet type
+INSIDE_BET_TYPES = ("straight", "split", "street", "corner", "line")
+
+
+def pocket_color(number: int) -> str:
+    """ Returns the color of the pocket, "green", "red" or "black" """
+    if number == 0:
+        return "green"
+    return "red" if number in RED_NUMBERS else "black"
+
+
+def _outside_bets() -> Dict[str, Tuple[FrozenSet[int], int]]:
+    """ Bets that are placed on a group of numbers, indexed by their bet type """
+    numbers = range(1, POCKETS)
+    return {
+        "red": (frozenset(n for n in numbers if n in RED_NUMBERS), PAYOUT_MULTIPLIERS["even money"]),
+        "black": (frozenset(n for n in numbers if n not in RED_NUMBERS), PAYOUT_MULTIPLIERS["even money"]),
+        "green": (frozenset({0}), PAYOUT_MULTIPLIERS["straight"]),
+        "even": (frozenset(n for n in numbers if n % 2 == 0), PAYOUT_MULTIPLIERS["even money"]),
+        "odd": (frozenset(n for n in numbers if n % 2 == 1), PAYOUT_MULTIPLIERS["even money"]),
+        "low": (frozenset(range(1, 19)), PAYOUT_MULTIPLIERS["even money"]),
+        "high": (frozenset(range(19, 37)), PAYOUT_MULTIPLIERS["even money"]),
+        "dozen1": (frozenset(range(1, 13)), PAYOUT_MULTIPLIERS["dozen"]),
+        "dozen2": (frozenset(range(13, 25)), PAYOUT_MULTIPLIERS["dozen"]),
+        "dozen3": (frozenset(range(25, 37)), PAYOUT_MULTIPLIERS["dozen"]),
+        "column1": (frozenset(n for n in numbers if n % 3 == 1), PAYOUT_MULTIPLIERS["column"]),
+        "column2": (frozenset(n for n in numbers if n % 3 == 2), PAYOUT_MULTIPLIERS["column"]),
+        "column3": (frozenset(n for n in numbers if n % 3 == 0), PAYOUT_MULTIPLIERS["column"]),
+    }
+
+
+def _inside_bets() -> Dict[str, Tuple[FrozenSet[int], int]]:
+    """
+    Every bet that can be placed on the layout's numbers, indexed by a key like "split:17-18".
+    The layout has 12 rows of 3 numbers (1 2 3, 4 5 6, ...) with 0 above the first row.
+    """
+    groups: Dict[str, List[Tuple[int, ...]]] = {bet_type: [] for bet_type in INSIDE_BET_TYPES}
+    row_starts = range(1, 37, 3)
+
+    groups["straight"] = [(n,) for n in range(POCKETS)]
+
+    groups["split"] += [(0, 1), (0, 2), (0, 3)]
+    groups["split"] += [(n, n + 1) for n in range(1, 37) if n % 3 != 0]  # Side by side
+    groups["split"] += [(n, n + 3) for n in range(1, 34)]  # One above the other
+
+    groups["street"] += [(0, 1, 2), (0, 2, 3)]
+    groups["street"] += [(n, n + 1, n + 2) for n in row_starts]
+
+    groups["corner"] += [(0, 1, 2, 3)]  # First four
+    groups["corner"] += [(n, n + 1, n + 3, n + 4) for n in range(1, 33) if n % 3 != 0]
+
+    groups["line"] += [tuple(range(n, n + 6)) for n in row_starts if n + 5 <= 36]
+
+    bets = {}
+    for bet_type, number_groups in groups.items():
+        for numbers in number_groups:
+            bets[bet_key(bet_type, numbers)] = (frozenset(numbers), PAYOUT_MULTIPLIERS[bet_type])
+    return bets
+
+
+def bet_key(bet_type: str, numbers: Iterable[int] = ()) -> str:
+    """ Builds the key a bet is stored under in `PAYOUT_TABLE` """
+    numbers = sorted(numbers)
+    if not numbers:
+        return bet_type
+    return f"{bet_type}:{'-'.join(str(n) for n in numbers)}"
+
+
+def _build_payout_table() -> Dict[str, bytes]:
+    """ For every bet, how many times the bet is paid back for each of the 37 pockets """
+    table = {}
+    for key, (numbers, multiplier) in {**_outside_bets(), **_inside_bets()}.items():
+        table[key] = bytes(multiplier if pocket in numbers else 0 for pocket in range(POCKETS))
+    return table
+
+
+# Built once when the module is imported. Each row is 37 bytes, so the whole table is only a few kilobytes
+PAYOUT_TABLE: Dict[str, bytes] = _build_payout_table()
+
+# The bets that can be given by their lowest number alone. It picks out one street, corner or line, but a split's
+# lowest number could go with the number beside it or the one below it
+FIRST_NUMBER_BET_TYPES = ("street", "corner", "line")
+
+# Those bets indexed by their type and lowest number, so "street 13" can be found without typing "13 14 15"
+_INSIDE_BETS_BY_FIRST_NUMBER: Dict[Tuple[str, int], str] = {}
+for _key in PAYOUT_TABLE:
+    if ":" in _key:
+        _type, _numbers = _key.split(":")
+        _first = int(_numbers.split("-")[0])
+        if _type in FIRST_NUMBER_BET_TYPES and _first != 0:
+            _INSIDE_BETS_BY_FIRST_NUMBER[(_type, _first)] = _key
+
+
+def parse_bet(bet_type: str, numbers: Optional[str] = None) -> Optional[str]:
+    """
+    Finds the key of a bet from its bet type and the numbers a player typed in.
+    For inside bets all the numbers can be given ("17 18", "17-18"), or only the lowest one for streets, corners and
+    lines ("13" for the 13-14-15 street).
+    :return: The bet's key in `PAYOUT_TABLE`, or None if that isn't a bet that can be placed
+    """
+    if bet_type not in INSIDE_BET_TYPES:
+        return bet_type if bet_type in PAYOUT_TABLE else None
+
+    picked = [int(n) for n in re.findall(r"\d+", numbers or "")]
+    if not picked:
+        return None
+
+    key = bet_key(bet_type, set(picked))
+    if key in PAYOUT_TABLE:
+        return key
+
+    if len(picked) == 1 and bet_type in FIRST_NUMBER_BET_TYPES:
+        return _INSIDE_BETS_BY_FIRST_NUMBER.get((bet_type, picked[0]))
+    return None
+
+
+def bet_type_of(key: str) -> str:
+    """ "split:17-18" -> "split" """
+    return key.split(":")[0]
+
+
+def bet_numbers_of(key: str) -> str:
+    """ "split:17-18" -> "17-18", or "" for outside bets """
+    return key.split(":")[1] if ":" in key else ""
+
+
+def settle(bets: List[Tuple[str, int]], pocket: int) -> List[int]:
+    """
+    Works out what every bet at the table gets paid in one pass.
+    :param bets: (bet key, amount) for every bet at the table
+    :param pocket: The pocket the ball landed in
+    :return: How much each bet is paid back, stake included. 0 means the bet lost
+    """
+    return [amount * PAYOUT_TABLE[key][pocket] for key, amount in bets]
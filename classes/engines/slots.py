@@ -0,0 +1,113 @@
+import itertools
+import random
+from fractions import Fraction
+from typing import Dict, List, Optional, Sequence, Tuple
+
+REELS = 3
+SYMBOLS = (":moneybag:", ":gem:", ":four_leaf_clover:", ":star:", ":slot_machine:")
+WEIGHTS = (1, 2, 3, 4, 5)  # SYMBOLS[0] is rarest, SYMBOLS[4] is most common
+
+# How many times the bet is won, indexed by (symbol index, how many of it were rolled). The bet is kept on a win
+PAYOUTS: Dict[Tuple[int, int], float] = {
+    (0, 3): 100,  # 3 moneybags
+    (0, 2): 10,  # 2 moneybags
+    (1, 3): 25,  # 3 gems
+    (1, 2): 3,  # 2 gems
+    (2, 3): 8,  # 3 clovers
+    (2, 2): 1.5,  # 2 clovers
+    (3, 3): 3,  # 3 stars
+    (3, 2): 0.5,  # 2 stars
+    (4, 3): 1.5,  # 3 slot machines
+    (4, 2): 0.2  # 2 slot machines
+}
+
+OUTCOMES = len(SYMBOLS) ** REELS
+
+
+def outcome_index(reels: Sequence[int]) -> int:
+    """ Packs the symbol index of each reel into one number, so every spin is an index into the outcome tables """
+    index = 0
+    for symbol in reels:
+        index = index * len(SYMBOLS) + symbol
+    return index
+
+
+def outcome_reels(index: int) -> Tuple[int, ...]:
+    """ The reverse of `outcome_index` """
+    reels = []
+    for _ in range(REELS):
+        index, symbol = divmod(index, len(SYMBOLS))
+        reels.append(symbol)
+    return tuple(reversed(reels))
+
+
+def _multiplier(reels: Sequence[int]) -> Optional[float]:
+    # Checked from the rarest symbol down. With three reels only one symbol can show up more than once anyway
+    for symbol in range(len(SYMBOLS)):
+        count = reels.count(symbol)
+        if (symbol, count) in PAYOUTS:
+            return PAYOUTS[(symbol, count)]
+    return None
+
+
+def _probability(reels: Sequence[int]) -> Fraction:
+    total = sum(WEIGHTS)
+    probability = Fraction(1)
+    for symbol in reels:
+        probability *= Fraction(WEIGHTS[symbol], total)
+    return probability
+
+
+# The multiplier won for each outcome, or None if it loses. Built once when the module is imported
+OUTCOME_MULTIPLIERS: Tuple[Optional[float], ...] = tuple(_multiplier(outcome_reels(i)) for i in range(OUTCOMES))
+# The exact chance of each outcome
+OUTCOME_PROBABILITIES: Tuple[Fraction, ...] = tuple(_probability(outcome_reels(i)) for i in range(OUTCOMES))
+
+
+def net_result(outcome: int, bet: int) -> int:
+    """ How much the player's balance changes for a spin: the winnings on a win, or minus the bet on a loss """
+    multiplier = OUTCOME_MULTIPLIERS[outcome]
+    if multiplier is None:
+        return -bet
+    return round(bet * multiplier)
+
+
+def return_to_player(bet: Optional[int] = None) -> Tuple[float, float]:
+    """
+    The exact expected return and variance of a spin, both in bets.
+    :param bet: If given, winnings are rounded to whole berries like they are when paid out at that bet
+    :return: (return to player, variance of the net result)
+    """
+    mean = Fraction(0)
+    square = Fraction(0)
+    for outcome in range(OUTCOMES):
+        if bet is None:
+            multiplier = OUTCOME_MULTIPLIERS[outcome]
+            net = Fraction(-1) if multiplier is None else Fraction(multiplier)
+        else:
+            net = Fraction(net_result(outcome, bet), bet)
+        mean += OUTCOME_PROBABILITIES[outcome] * net
+        square += OUTCOME_PROBABILITIES[outcome] * net * net
+
+    # A win keeps the bet, so the return is the bet plus the expected net result
+    return float(1 + mean), float(square - mean * mean)
+
+
+RTP, VARIANCE = return_to_player()
+HOUSE_EDGE = 1 - RTP
+HIT_FREQUENCY = float(sum(p for p, m in zip(OUTCOME_PROBABILITIES, OUTCOME_MULTIPLIERS) if m is not None))
+
+# Whole number weight of each outcome (the product of its symbols' weights), as running totals for random.choices
+OUTCOME_CUM_WEIGHTS: Tuple[int, ...] = tuple(
+    itertools.accumulate(int(probability * sum(WEIGHTS) ** REELS) for probability in OUTCOME_PROBABILITIES)
+)
+
+
+def spin_batch(spins: int, rng: random.Random = random) -> List[int]:
+    """ Rolls many spins at once. Each spin is drawn straight from the outcome weights, one draw per spin """
+    return rng.choices(range(OUTCOMES), cum_weights=OUTCOME_CUM_WEIGHTS, k=spins)
+
+
+def settle_batch(outcomes: Sequence[int], bet: int) -> List[int]:
+    """ The net result of every spin in a batch """
+    return [net_result(outcome, bet) for outcome in outcomes]
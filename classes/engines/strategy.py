@@ -0,0 +1,162 @@
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from classes.engines.cards import CARD_VALUES, HAND_TOTALS
+
+BUST = 22  # Dealer outcomes are final totals from 17 to 21, or this for a bust
+COMPOSITION_BUCKETS = 1000  # How finely the shoe composition is rounded before the tables are cached
+
+
+class Rules(NamedTuple):
+    """ The rules the tables are built for. Every rule set gets its own cached tables """
+    dealer_hits_soft_17: bool = False
+    dealer_peeks: bool = True  # The game ends on a dealer blackjack before the player acts
+
+
+class Hint(NamedTuple):
+    stand: float  # Expected value of standing, in bets
+    hit: float  # Expected value of hitting and then playing on perfectly
+    double: float  # Expected value of doubling down (one card, double bet)
+
+    @property
+    def best_action(self) -> str:
+        return "hit" if self.hit > self.stand else "stand"
+
+
+DEFAULT_RULES = Rules()
+
+
+def composition_bucket(counts: Sequence[int]) -> Tuple[int, ...]:
+    """
+    Rounds the number of cards of each value left (index 1 is aces, index 10 is tens) to a share out of
+    `COMPOSITION_BUCKETS`. Shoes that round to the same bucket share their tables, so they only get built once.
+    """
+    total = sum(counts[1:11]) or 1
+    return tuple(round(counts[value] * COMPOSITION_BUCKETS / total) for value in range(1, 11))
+
+
+def _probabilities(bucket: Tuple[int, ...]) -> List[float]:
+    """ The chance of drawing each value, indexed by value """
+    total = sum(bucket) or 1
+    return [0.0] + [count / total for count in bucket]
+
+
+def _is_dealer_done(hard: int, has_ace: bool, rules: Rules) -> bool:
+    if hard >= 17:
+        return True
+    total = HAND_TOTALS[hard][has_ace]
+    if total < 17:
+        return False
+    # A soft 17 is the only total where the rules matter
+    return not (rules.dealer_hits_soft_17 and total == 17 and total != hard)
+
+
+@lru_cache(maxsize=4096)
+def dealer_outcomes(bucket: Tuple[int, ...], upcard: int, rules: Rules = DEFAULT_RULES) -> Dict[int, float]:
+    """
+    The chance of each final dealer total, worked out by dynamic programming over the dealer's hand states.
+    Cards are drawn with the probabilities of the shoe composition.
+    :param bucket: From `composition_bucket`
+    :param upcard: The value of the dealer's face up card, 1 for an ace
+    :param rules: The rule set
+    :return: Chance of each final total, indexed by total. `BUST` holds the chance of the dealer busting
+    """
+    probabilities = _probabilities(bucket)
+    memo: Dict[Tuple[int, bool], Dict[int, float]] = {}
+
+    def finish(hard: int, has_ace: bool) -> Dict[int, float]:
+        if hard > 21:
+            return {BUST: 1.0}
+        if _is_dealer_done(hard, has_ace, rules):
+            return {HAND_TOTALS[hard][has_ace]: 1.0}
+        if (hard, has_ace) in memo:
+            return memo[(hard, has_ace)]
+
+        outcomes: Dict[int, float] = {}
+        for value in range(1, 11):
+            if probabilities[value] == 0:
+                continue
+            for total, chance in finish(hard + value, has_ace or value == 1).items():
+                outcomes[total] = outcomes.get(total, 0.0) + probabilities[value] * chance
+
+        memo[(hard, has_ace)] = outcomes
+        return outcomes
+
+    # The hole card can't make a blackjack if the dealer already checked for one
+    hole_probabilities = probabilities[:]
+    if rules.dealer_peeks and upcard == 1:
+        hole_probabilities[10] = 0.0
+    elif rules.dealer_peeks and upcard == 10:
+        hole_probabilities[1] = 0.0
+    hole_total = sum(hole_probabilities) or 1
+
+    outcomes: Dict[int, float] = {}
+    for value in range(1, 11):
+        if hole_probabilities[value] == 0:
+            continue
+        for total, chance in finish(upcard + value, upcard == 1 or value == 1).items():
+            outcomes[total] = outcomes.get(total, 0.0) + hole_probabilities[value] / hole_total * chance
+    return outcomes
+
+
+@lru_cache(maxsize=4096)
+def hint_table(bucket: Tuple[int, ...], upcard: int, rules: Rules = DEFAULT_RULES) -> Dict[Tuple[int, bool], Hint]:
+    """
+    Expected values of every player hand against the dealer's upcard, indexed by (hard total, holds an ace).
+    Built once per composition bucket, upcard and rule set, so looking up a hint is a dictionary lookup.
+    """
+    probabilities = _probabilities(bucket)
+    dealer = dealer_outcomes(bucket, upcard, rules)
+
+    def stand_value(total: int) -> float:
+        if total > 21:
+            return -1.0
+        win = dealer.get(BUST, 0.0) + sum(chance for final, chance in dealer.items() if final < total)
+        lose = sum(chance for final, chance in dealer.items() if total < final < BUST)
+        return win - lose
+
+    stand_values = {total: stand_value(total) for total in range(2, 22)}
+    hit_values: Dict[Tuple[int, bool], float] = {}
+
+    def best_value(hard: int, has_ace: bool) -> float:
+        if hard > 21:
+            return -1.0
+        return max(stand_values[HAND_TOTALS[hard][has_ace]], hit_value(hard, has_ace))
+
+    def hit_value(hard: int, has_ace: bool) -> float:
+        if (hard, has_ace) in hit_values:
+            return hit_values[(hard, has_ace)]
+        value = sum(probabilities[card] * best_value(hard + card, has_ace or card == 1)
+                    for card in range(1, 11) if probabilities[card])
+        hit_values[(hard, has_ace)] = value
+        return value
+
+    def double_value(hard: int, has_ace: bool) -> float:
+        return 2 * sum(probabilities[card] * (stand_values[HAND_TOTALS[hard + card][has_ace or card == 1]]
+                                              if hard + card <= 21 else -1.0)
+                       for card in range(1, 11) if probabilities[card])
+
+    # Going from the highest totals down means every hit only looks up hands that are already worked out
+    table: Dict[Tuple[int, bool], Hint] = {}
+    for hard in range(21, 1, -1):
+        for has_ace in (False, True):
+            total = HAND_TOTALS[hard][has_ace]
+            table[(hard, has_ace)] = Hint(stand_values[total], hit_value(hard, has_ace),
+                                          double_value(hard, has_ace))
+    return table
+
+
+def get_hint(player_hand: Sequence[int], dealer_upcard: int, counts: Sequence[int],
+             rules: Rules = DEFAULT_RULES) -> Hint:
+    """
+    The expected values of standing, hitting and doubling for a hand.
+    :param player_hand: The player's cards
+    :param dealer_upcard: The dealer's face up card
+    :param counts: How many cards of each value the player can't see, indexed by value (see `Shoe.remaining_values`)
+    :param rules: The rule set
+    """
+    hard = sum(CARD_VALUES[card] for card in player_hand)
+    has_ace = any(CARD_VALUES[card] == 1 for card in player_hand)
+    if hard > 21:
+        return Hint(-1.0, -1.0, -2.0)
+    return hint_table(composition_bucket(counts), CARD_VALUES[dealer_upcard], rules)[(hard, has_ace)]
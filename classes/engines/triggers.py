@@ -0,0 +1,53 @@
+import re
+from typing import List, Tuple
+
+HATE_WORDS = ("suck", "die", "bozo", "loser", "stupid", "hate")
+LOVE_WORDS = ("thx", "thanks", "thank", "love")
+
+# The phrases that set each flag on Triggers
+PHRASES = (
+    ("hate", HATE_WORDS),
+    ("love", LOVE_WORDS),
+    ("pagget", ("pagget",)),
+    ("begging", ("berries pls",)),
+    ("list_berries", ("list berries",)),
+)
+
+# "bless <mention> with <amount>", where each is a whole space separated word. Only "bless " is used up, so blessings
+# that overlap are all found. Whether "bless" starts a word is checked in scan
+_BLESSING = re.compile(r"bless (?=([^ ]+) with ([^ ]*))")
+
+
+class Triggers:
+    """ The triggers found in a message """
+
+    __slots__ = ("hate", "love", "pagget", "begging", "list_berries", "blessings")
+
+    def __init__(self):
+        self.hate = False
+        self.love = False
+        self.pagget = False
+        self.begging = False  # "berries pls"
+        self.list_berries = False
+        self.blessings: List[Tuple[str, str]] = []  # The mention and amount of each blessing, in order
+
+
+def scan(content: str) -> Triggers:
+    """
+    Finds every trigger in a casefolded copy of a message. Phrases are found anywhere, the same as `in` finds them,
+    and each flag stops being looked for once it's set. The blessing pattern is only run when "bless" is in the message
+    """
+    text = content.casefold()
+    triggers = Triggers()
+    for kind, phrases in PHRASES:
+        for phrase in phrases:
+            if phrase in text:
+                setattr(triggers, kind, True)
+                break
+
+    if "bless" in text:
+        for match in _BLESSING.finditer(text):
+            start = match.start()
+            if start == 0 or text[start - 1] == " ":
+                triggers.blessings.append((match.group(1), match.group(2)))
+    return triggers
@@ -1,3 +1,6 @@
 from .roulette import Roulette
 from .blackjack import Blackjack
-from .slots import Slots
\ No newline at end of file
+from .slots import Slots
+from .message_updater import MessageUpdater, EditPriority
+from .game_clock import GameClock
+from .sessions import SessionManager, Session, SessionLimitReached
@@ -1,40 +1,48 @@
-import random
-from typing import Optional, Literal, List
+from typing import Optional, Literal, List, Tuple
 
 import discord
 
-
-class Card:
-    def __init__(self, suit: Literal["hearts", "diamonds", "clubs", "spades"],
-                 rank: Literal["2", "3", "4", "5", "6", "7", "8", "9", "10", "Jack", "Queen", "King", "Ace"]):
-        self.suit = suit
-        self.rank = rank
-
-    def __str__(self):
-        return f"{self.rank.title()} :{self.suit}:"
-
-    def __int__(self):
-        royals = ["jack", "queen", "king"]
-        if self.rank.lower() in royals:
-            return 10
-        elif self.rank.lower() == "ace":
-            return 11
-        return int(self.rank)
+from classes.engines import cards, strategy
+from classes.engines.cards import Shoe
+from classes.engines.rng import RngService
+from classes.gambling.message_updater import MessageUpdater, EditPriority
+from classes.gambling.sessions import SessionManager, Session
+from classes.saving import Data
 
 
 class Blackjack:
-    def __init__(self, user: discord.User, bet: int, users_dict: dict[int, int]):
-        self.users_dict = users_dict
+    def __init__(self, user: discord.User, bet: int, data: Data, updater: MessageUpdater, sessions: SessionManager,
+                 session: Session, rng: RngService, shoe: Optional[Shoe] = None):
+        """
+        :param user: The user playing
+        :param bet: The bet, already held in the session
+        :param data: The data class that the root bot uses for saving data
+        :param updater: The shared message updater that all the game's message edits go through
+        :param sessions: The session manager that holds the bet until the game ends
+        :param session: This game's session
+        :param rng: Hands out the shoe's seeds, and records the cards this game drew
+        :param shoe: The shoe to deal from. Games can share one, otherwise each game gets its own
+        """
+        self.data = data
+        self.updater = updater
+        self.sessions = sessions
+        self.session = session
+        self.rng = rng
         self.user = user
         self.bet = bet
         self.game_over = False
         self.message: Optional[discord.Message] = None
 
-        self.deck: List[Card] = []
-        self.player_hand: List[Card] = []
-        self.dealer_hand: List[Card] = []
+        self.shoe: Shoe = shoe or Shoe(streams=lambda: rng.stream("shoe", session=session.id))
+        self.player_hand: List[int] = []
+        self.dealer_hand: List[int] = []
+        # The seed of the shuffle and the position in it of every card this game drew, in the order it drew them. A
+        # shared shoe deals other games' cards in between, and can be reshuffled partway through a game, so the start
+        # of the deal isn't enough to replay the rest
+        self.draws: List[Tuple[Optional[int], int]] = []
 
-        self._initialize_deck()
+        self.shoe.start_round()
+        sessions.update_state(session, shoe_seed=self.shoe.seed, position=self.shoe.position)
         self._initial_deal()
 
         self.view = discord.ui.View(timeout=180)
@@ -48,37 +56,34 @@ class Blackjack:
         stand_button.callback = self._stand_callback
         self.view.add_item(stand_button)
 
-    def _initialize_deck(self):
-        suits = ["hearts", "spades", "diamonds", "clubs"]
-
-        for suit in suits:
-            for rank in range(2, 11):
-                self.deck.append(Card(suit, str(rank)))
+        hint_button = discord.ui.Button(label="Hint", style=discord.ButtonStyle.secondary)
+        hint_button.callback = self._hint_callback
+        self.view.add_item(hint_button)
+        self.sessions.track_view(self.view)
 
-            for rank in ["jack", "queen", "king", "ace"]:
-                self.deck.append(Card(suit, rank))
+    def _draw(self) -> int:
+        card = self.shoe.draw()
+        # Read after drawing, since the shoe can reshuffle before it deals
+        self.draws.append((self.shoe.seed, self.shoe.position - 1))
+        return card
 
-        random.shuffle(self.deck)
+    def _record_draws(self):
+        """ Writes every card the game drew to the transaction log, in the form `utils/replay.py` takes """
+        draws = ",".join(f"{seed}:{position}" for seed, position in self.draws)
+        self.rng.record("blackjack", self.draws[0][0], draws=draws, player_cards=len(self.player_hand),
+                        session=self.session.id, user=self.user.id)
 
     def _initial_deal(self):
-        self.player_hand.append(self.deck.pop(0))
-        self.player_hand.append(self.deck.pop(0))
+        self.player_hand.append(self._draw())
+        self.player_hand.append(self._draw())
 
-        self.dealer_hand.append(self.deck.pop(0))
-        self.dealer_hand.append(self.deck.pop(0))
+        self.dealer_hand.append(self._draw())
+        self.dealer_hand.append(self._draw())
 
-        player_score = self._get_hand_score(self.player_hand)
-        dealer_score = self._get_hand_score(self.dealer_hand)
-
-        if player_score == 21 and dealer_score == 21:
-            self.game_over = True
-            self.result = "push"
-        elif player_score == 21:
-            self.game_over = True
-            self.result = "blackjack"
-        elif dealer_score == 21:
+        result = cards.opening_result(self.player_hand, self.dealer_hand)
+        if result is not None:
             self.game_over = True
-            self.result = "dealer_blackjack"
+            self.result = result
 
     async def run(self, interaction: discord.Interaction):
         await interaction.response.send_message(embed=self._get_embed("play"), view=self.view)
@@ -86,48 +91,21 @@ class Blackjack:
         if self.game_over:
             if hasattr(interaction, "original_response"):
                 self.message = await interaction.original_response()
-                await self._end_game()
+            # Paid out even if the message couldn't be found, so the bet isn't left held
+            await self._end_game()
 
     @staticmethod
-    def _get_hand_score(hand: List[Card]) -> int:
-        score = sum(int(card) for card in hand)
-
-        ace_count = sum(1 for card in hand if card.rank == "ace")
-
-        while score > 21 and ace_count > 0:
-            score -= 10
-            ace_count -= 1
-
-        return score
+    def _get_hand_score(hand: List[int]) -> int:
+        return cards.hand_value(hand)
 
     def _dealer_play(self):
-        while self._get_hand_score(self.dealer_hand) < 17:
-            self.dealer_hand.append(self.deck.pop(0))
+        dealer_score = cards.dealer_play(self.dealer_hand, self._draw)
+        self.result = cards.final_result(self._get_hand_score(self.player_hand), dealer_score)
 
-        dealer_score = self._get_hand_score(self.dealer_hand)
-        player_score = self._get_hand_score(self.player_hand)
-
-        if dealer_score > 21:
-            self.result = "dealer_bust"
-        elif dealer_score > player_score:
-            self.result = "dealer_wins"
-        elif dealer_score < player_score:
-            self.result = "player_wins"
-        else:
-            self.result = "push"
-
-    def _handle_payout(self):
-        user_id = self.user.id
-
-        if user_id not in self.users_dict:
-            self.users_dict[user_id] = 0
-
-        if self.result == "blackjack":
-            self.users_dict[user_id] += int(self.bet * 2.5)
-        elif self.result in ["player_wins", "dealer_bust"]:
-            self.users_dict[user_id] += self.bet * 2
-        elif self.result == "push":
-            self.users_dict[user_id] += self.bet
+    async def _handle_payout(self):
+        payout = cards.payout(self.result, self.bet)
+        await self.sessions.settle(self.session, {self.user.id: payout})
+        await self.sessions.close(self.session)
 
     def _get_embed(self, status: Literal["play", "ended"]) -> discord.Embed:
         player_score = self._get_hand_score(self.player_hand)
@@ -140,18 +118,18 @@ class Blackjack:
             )
             embed.set_footer(text="Hit to draw another card. Stand to end your turn.")
 
-            dealer_visible_score = int(self.dealer_hand[0])
-            dealer_cards = f"{self.dealer_hand[0]} and 1 hidden card"
+            dealer_visible_score = self._get_hand_score(self.dealer_hand[:1])
+            dealer_cards = f"{cards.card_name(self.dealer_hand[0])} and 1 hidden card"
 
         else:
             dealer_score = self._get_hand_score(self.dealer_hand)
             dealer_visible_score = dealer_score
-            dealer_cards = ", ".join(str(card) for card in self.dealer_hand)
+            dealer_cards = ", ".join(cards.card_name(card) for card in self.dealer_hand)
 
             if hasattr(self, 'result'):
                 if self.result == "blackjack":
                     title = "Blackjack! You Win!"
-                    description = f"You got a blackjack! You won {int(self.bet * 1.5)} extra berries!"
+                    description = f"You got a blackjack! You won {cards.payout('blackjack', self.bet) - self.bet} extra berries!"
                     color = discord.Color.gold()
                 elif self.result == "dealer_blackjack":
                     title = "Dealer Blackjack! You Lose"
@@ -187,18 +165,20 @@ class Blackjack:
         embed.add_field(name="Your Score", value=player_score, inline=True)
         embed.add_field(name="Dealer Score", value=dealer_visible_score, inline=True)
         embed.add_field(name="Your Bet", value=self.bet, inline=True)
-        embed.add_field(name="Your Hand", value=", ".join(str(card) for card in self.player_hand), inline=False)
+        embed.add_field(name="Your Hand", value=", ".join(cards.card_name(card) for card in self.player_hand),
+                        inline=False)
         embed.add_field(name="Dealer's Hand", value=dealer_cards, inline=False)
 
         return embed
 
     async def _update_message(self):
         if self.message:
-            await self.message.edit(embed=self._get_embed("ended"), view=None)
+            await self.updater.edit(self.message, EditPriority.FINAL, embed=self._get_embed("ended"), view=None)
 
     async def _end_game(self):
         self.game_over = True
-        self._handle_payout()
+        self._record_draws()
+        await self._handle_payout()
         await self._update_message()
 
     async def _on_timeout(self):
@@ -218,7 +198,7 @@ class Blackjack:
             await interaction.response.send_message("This game has already ended.", ephemeral=True)
             return
 
-        self.player_hand.append(self.deck.pop(0))
+        self.player_hand.append(self._draw())
         player_score = self._get_hand_score(self.player_hand)
 
         if player_score > 21:
@@ -246,3 +226,26 @@ class Blackjack:
 
         await interaction.response.defer()
         await self._end_game()
+
+    async def _hint_callback(self, interaction: discord.Interaction):
+        if interaction.user.id != self.user.id:
+            await interaction.response.send_message("Only the user that started the game can play.", ephemeral=True)
+            return
+
+        if self.game_over:
+            await interaction.response.send_message("This game has already ended.", ephemeral=True)
+            return
+
+        # The player can't see the dealer's hidden card, so it counts as one of the cards that could still come
+        unseen = self.shoe.remaining_values()
+        unseen[cards.CARD_VALUES[self.dealer_hand[1]]] += 1
+
+        hint = strategy.get_hint(self.player_hand, self.dealer_hand[0], unseen)
+        description = (f"**{hint.best_action.title()}** is your best move.\n\n"
+                       f"-# Expected return of standing: {hint.stand:+.1%} of your bet\n"
+                       f"-# Expected return of hitting: {hint.hit:+.1%} of your bet")
+        if len(self.player_hand) == 2 and hint.double > max(hint.hit, hint.stand):
+            description += "\n-# If you could double down, that would be even better."
+
+        embed = discord.Embed(title="Hint", description=description, color=discord.Color.light_grey())
+        await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -0,0 +1,88 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from classes.logger import get_logger
+
+log = get_logger("GameClock")
+
+
+class ClockedGame(Protocol):
+    def on_clock(self, now: float) -> Optional[float]:
+        """
+        Called by the clock when the game asked to be woken up.
+        :param now: The current `time.monotonic()` time
+        :return: The monotonic time to be woken up again, or None if the game no longer needs the clock
+        """
+        ...
+
+
+class GameClock:
+    """
+    One loop that drives the timers of every running game.
+
+    Instead of each game sleeping in its own loop, games tell the clock when they next need to do something and the
+    clock keeps those times in a heap. It only wakes up when the soonest one is due, so the number of wakeups depends
+    on what the games need, not on how many of them are open.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, ClockedGame]] = []  # (wake time, order, game), soonest first
+        self._wake_times: Dict[ClockedGame, float] = {}  # The current wake time of each active game
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def active_games(self) -> int:
+        return len(self._wake_times)
+
+    def schedule(self, game: ClockedGame, when: float) -> None:
+        """ Adds the game to the clock, or moves its wake up time if it's already on it """
+        self._wake_times[game] = when
+        heapq.heappush(self._heap, (when, next(self._order), game))
+
+        self._start_worker()
+        self._wakeup.set()
+
+    def remove(self, game: ClockedGame) -> None:
+        """ Takes the game off the clock. Its heap entries are skipped when they come up """
+        self._wake_times.pop(game, None)
+
+    def _start_worker(self):
+        if self._worker is not None and not self._worker.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+
+            while self._heap and self._heap[0][0] <= now:
+                when, _, game = heapq.heappop(self._heap)
+                if self._wake_times.get(game) != when:
+                    continue  # Removed or rescheduled since this entry was pushed
+
+                del self._wake_times[game]
+                try:
+                    next_wake = game.on_clock(now)
+                except Exception as e:
+                    log.error("Error while running game clock for %r: %s", game, e)
+                    continue
+
+                if next_wake is not None:
+                    self._wake_times[game] = next_wake
+                    heapq.heappush(self._heap, (next_wake, next(self._order), game))
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._heap[0][0] - now)
+            except asyncio.TimeoutError:
+                pass
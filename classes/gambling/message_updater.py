@@ -0,0 +1,164 @@
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional
+
+import discord
+
+from classes.logger import get_logger
+
+log = get_logger("MessageUpdater")
+
+
+class EditPriority:
+    """ The lower the number, the sooner the edit gets sent """
+    FINAL = 0  # Game results. These are never replaced by a lower priority edit
+    UPDATE = 1  # Player actions, like a new spin or someone joining a table
+    TICK = 2  # Countdown updates. Fine to skip if something newer comes along
+
+
+class _PendingEdit:
+    __slots__ = ("message", "kwargs", "priority", "order", "waiters")
+
+    def __init__(self, message: discord.Message, kwargs: dict, priority: int, order: int):
+        self.message = message
+        self.kwargs = kwargs
+        self.priority = priority
+        self.order = order
+        self.waiters: List[asyncio.Future] = []
+
+
+class MessageUpdater:
+    """
+    Sends message edits for all the running games, so they stay under Discord's per channel rate limits.
+
+    Only the newest state of each message is kept. If a game asks for an edit while an older one is still waiting,
+    the older one is replaced. Each channel gets a small token bucket, and when a channel is out of tokens its edits
+    wait, with final results going out before player updates and countdown ticks.
+    """
+
+    BUCKET_SIZE = 5  # Edits a channel can burst...
+    BUCKET_WINDOW = 5.0  # ...and how many seconds it takes to earn them all back
+
+    def __init__(self):
+        self._pending: Dict[int, _PendingEdit] = {}  # Waiting edits, indexed by message ID
+        self._in_flight: set[int] = set()  # IDs of messages that are being edited right now
+        self._buckets: Dict[int, List[float]] = {}  # [tokens, last refill time], indexed by channel ID
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sends: set[asyncio.Task] = set()  # Keeps the edit tasks referenced until they finish
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def edit(self, message: discord.Message, priority: int = EditPriority.UPDATE, wait: bool = False,
+                   **kwargs) -> None:
+        """
+        Queues an edit of the message. Takes the same keyword arguments as `discord.Message.edit`.
+        :param message: The message to edit
+        :param priority: One of the `EditPriority` values
+        :param wait: If true, this waits until the edit (or a newer one that replaced it) has been sent
+        """
+        pending = self.queue(message, priority, **kwargs)
+
+        if wait:
+            future = asyncio.get_running_loop().create_future()
+            pending.waiters.append(future)
+            await future
+
+    def queue(self, message: discord.Message, priority: int = EditPriority.UPDATE, **kwargs) -> _PendingEdit:
+        """ Same as `edit`, without waiting. Can be called from code that isn't async """
+        pending = self._pending.get(message.id)
+
+        if pending is None:
+            pending = _PendingEdit(message, kwargs, priority, next(self._order))
+            self._pending[message.id] = pending
+        elif priority <= pending.priority or pending.priority != EditPriority.FINAL:
+            # Newer state wins, unless it would replace a final result with something less important
+            pending.message = message
+            pending.kwargs = kwargs
+            pending.priority = min(pending.priority, priority)
+
+        self._start_worker()
+        self._wakeup.set()
+        return pending
+
+    def _start_worker(self):
+        if self._worker is not None and not self._worker.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            wait_time = self._dispatch_ready()
+
+            if wait_time is None:
+                await self._wakeup.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait_time)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _dispatch_ready(self) -> Optional[float]:
+        """
+        Starts every edit that has a token available, most important first.
+        :return: Seconds until a rate limited channel gets a token back, or None if nothing is waiting on a token
+        """
+        now = time.monotonic()
+        wait_time: Optional[float] = None
+
+        for pending in sorted(self._pending.values(), key=lambda p: (p.priority, p.order)):
+            message_id = pending.message.id
+            if message_id in self._in_flight:
+                continue  # Sent when the current edit of this message finishes
+
+            channel_id = pending.message.channel.id
+            tokens = self._refill(channel_id, now)
+            if tokens < 1:
+                refill_in = (1 - tokens) * self.BUCKET_WINDOW / self.BUCKET_SIZE
+                wait_time = refill_in if wait_time is None else min(wait_time, refill_in)
+                continue
+
+            self._buckets[channel_id][0] -= 1
+            del self._pending[message_id]
+            self._in_flight.add(message_id)
+            task = asyncio.get_running_loop().create_task(self._send(pending))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+        if not self._pending:
+            self._forget_full_buckets(now)
+        return wait_time
+
+    def _refill(self, channel_id: int, now: float) -> float:
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = [float(self.BUCKET_SIZE), now]
+        else:
+            bucket[0] = min(float(self.BUCKET_SIZE),
+                            bucket[0] + (now - bucket[1]) * self.BUCKET_SIZE / self.BUCKET_WINDOW)
+            bucket[1] = now
+        return bucket[0]
+
+    def _forget_full_buckets(self, now: float):
+        """ Buckets that have refilled don't need to be remembered, they get recreated full """
+        for channel_id in list(self._buckets):
+            if self._refill(channel_id, now) >= self.BUCKET_SIZE:
+                del self._buckets[channel_id]
+
+    async def _send(self, pending: _PendingEdit):
+        try:
+            await pending.message.edit(**pending.kwargs)
+        except discord.HTTPException as e:
+            log.warning("Failed to edit message %s: %s", pending.message.id, e, channel=pending.message.channel.id)
+        finally:
+            self._in_flight.discard(pending.message.id)
+            for waiter in pending.waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._wakeup.set()
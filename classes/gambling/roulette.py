@@ -1,37 +1,38 @@
 import asyncio
+import math
 import random
+import time
 from typing import Optional, Literal, List
 
 import discord
 
+from classes.engines import roulette as wheel
+from classes.gambling.game_clock import GameClock
+from classes.gambling.message_updater import MessageUpdater, EditPriority
+from classes.gambling.sessions import SessionManager, Session, SessionLimitReached
+from classes.logger import get_logger
 from classes.saving import Data
 
+log = get_logger("Roulette")
+
 class Player:
-    def __init__(self, user: discord.User, bet: int, bet_type: str):
+    def __init__(self, user: discord.User, bet: int, bet_key: str):
+        """
+        A player at a roulette table.
+        :param user: The player
+        :param bet: How much they bet
+        :param bet_key: The key of their bet in the payout table. Either just the bet type ("red") or the bet type
+        followed by the numbers they picked ("split:17-18")
+        """
         self.user: discord.User = user
         self.bet: int = bet
-        self.bet_type: str = bet_type
+        self.bet_key: str = bet_key
+        self.bet_type: str = wheel.bet_type_of(bet_key)
         self.payout: int = 0
 
-    def calculate_payout(self):
-        """
-        Calculate the payout based on the bet type.
-        The payout is calculated as follows:
-        - Straight Up: 35:1
-        - Split: 17:1
-        - Street: 11:1
-        - Corner: 8:1
-        - Line: 5:1
-        - Red/Black, Odd/Even, High/Low, Dozens: 1:1
-        
-        Sets the payout variable to the calculated payout.
-        """
-        if self.bet_type in "red black even odd low high".split():
-            self.payout = self.bet * 2
-        elif self.bet_type in "dozen1 dozen2 dozen3".split():
-            self.payout = self.bet * 3
-        elif self.bet_type == "green":
-            self.payout = self.bet * 35
+    def describe_bet(self, bet_types: dict[str, str]) -> str:
+        numbers = wheel.bet_numbers_of(self.bet_key)
+        return f"{bet_types[self.bet_type]} {numbers}" if numbers else bet_types[self.bet_type]
 
 
 class RouletteJoinView(discord.ui.View):
@@ -54,7 +55,7 @@ class RouletteJoinView(discord.ui.View):
 
     async def _bet_type_callback(self, interaction: discord.Interaction):
         self.values["bet_type"] = interaction.data.get("values")[0]
-        print(self.values)
+        log.debug("Bet type picked: %s", self.values, user=interaction.user.id, guild=interaction.guild_id)
         self.clear_items()
 
         amount_button = discord.ui.Button(label="Enter Bet Amount", style=discord.ButtonStyle.primary)
@@ -68,10 +69,11 @@ class RouletteJoinView(discord.ui.View):
         self.last_message_id = interaction.message.id
         await interaction.response.send_modal(BetAmountModal(self._submit_amount_callback, self.values,
                                                              self.roulette_instance.data.get_user_balance(interaction.user.id),
-                                                             self.roulette_instance.min_bet))
+                                                             self.roulette_instance.min_bet,
+                                                             self.values["bet_type"] in wheel.INSIDE_BET_TYPES))
 
     async def _submit_amount_callback(self):
-        print(self.values)
+        log.debug("Bet amount entered: %s", self.values)
         self.clear_items()
 
         submit_button = discord.ui.Button(label="Submit", style=discord.ButtonStyle.success)
@@ -108,6 +110,8 @@ class RouletteJoinView(discord.ui.View):
                 color=discord.Color.blue()
             )
             embed.add_field(name="Bet Type", value=self.bet_types[self.values["bet_type"]], inline=True)
+            if wheel.bet_numbers_of(self.values["bet_key"]):
+                embed.add_field(name="Numbers", value=wheel.bet_numbers_of(self.values["bet_key"]), inline=True)
             embed.add_field(name="Bet Amount", value=self.values["bet_amount"], inline=True)
             embed.set_footer(text="Click 'Submit' to continue. Click cancel to cancel your bet.")
         elif action == "done":
@@ -133,11 +137,32 @@ class RouletteJoinView(discord.ui.View):
         return embed
 
     async def _submit_callback(self, interaction: discord.Interaction):
-        # Add the player to the game
-        player = Player(interaction.user, int(self.values["bet_amount"]), self.values["bet_type"])
-        player_balance = self.roulette_instance.data.get_user_balance(interaction.user.id)
-        self.roulette_instance.data.set_user_balance(interaction.user.id, player_balance - player.bet)
+        if self.roulette_instance.started or self.roulette_instance.game_over:
+            self.clear_items()
+            await interaction.response.edit_message(embed=self.embed("canceled"), view=self)
+            return
+
+        # They may have had more than one join menu open
+        if interaction.user.id in [player.user.id for player in self.roulette_instance.players]:
+            await interaction.response.send_message("You are already in the game!", ephemeral=True)
+            return
+
+        # Add the player to the game. The balance is checked again here, it may have changed since the modal
+        player = Player(interaction.user, int(self.values["bet_amount"]), self.values["bet_key"])
+        sessions = self.roulette_instance.sessions
+        try:
+            sessions.join(self.roulette_instance.session, interaction.user.id)
+        except SessionLimitReached as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        if not await sessions.hold(self.roulette_instance.session, interaction.user.id, player.bet):
+            # Otherwise they'd count as playing until the table closes, and couldn't start other games
+            await sessions.leave(self.roulette_instance.session, interaction.user.id)
+            await interaction.response.send_message("You don't have enough berries for that bet anymore.",
+                                                    ephemeral=True)
+            return
         self.roulette_instance.players.append(player)
+        self.roulette_instance.checkpoint()
 
         # Update the original message
         await self.roulette_instance.update_message("queue")
@@ -152,12 +177,20 @@ class RouletteJoinView(discord.ui.View):
 
 
 class BetAmountModal(discord.ui.Modal):
-    def __init__(self, callback, values: dict[str, str], user_balance: int, min_bet: int):
+    def __init__(self, callback, values: dict[str, str], user_balance: int, min_bet: int, needs_numbers: bool = False):
         super().__init__(title="Enter Bet Amount")
+        min_bet = max(1, min_bet)  # A guild's minimum bet can be 0, but nothing less than 1 berry can be held
         self.amount = discord.ui.TextInput(label="Bet Amount",
                                            placeholder=f"Balance: {user_balance}, Min Bet: {min_bet}", required=True)
         self.add_item(self.amount)
 
+        # Inside bets are placed on numbers, so we need to know which ones
+        self.numbers: Optional[discord.ui.TextInput] = None
+        if needs_numbers:
+            self.numbers = discord.ui.TextInput(label="Numbers", placeholder="The numbers to bet on, like: 17 18",
+                                                required=True)
+            self.add_item(self.numbers)
+
         self.submit_callback = callback
         self.min_bet = min_bet
         self.user_balance = user_balance
@@ -178,29 +211,46 @@ class BetAmountModal(discord.ui.Modal):
             await interaction.response.send_message("Bet amount must be a number.", ephemeral=True)
             return
 
+        bet_key = wheel.parse_bet(self.values["bet_type"], self.numbers.value if self.numbers else None)
+        if bet_key is None:
+            await interaction.response.send_message("Those numbers aren't a bet you can place.", ephemeral=True)
+            return
+
         await interaction.response.defer()
 
+        self.values["bet_key"] = bet_key
         self.values["bet_amount"] = str(bet_amount)
         await self.submit_callback()
 
 
 class Roulette:
-    def __init__(self, host: discord.User, hosts_bet: int, hosts_bet_type: str, bet_types: dict[str, str],
-                 data: Data, verify_callback: callable, min_bet: int):
+    def __init__(self, host: discord.User, hosts_bet: int, hosts_bet_key: str, bet_types: dict[str, str],
+                 data: Data, verify_callback: callable, min_bet: int, updater: MessageUpdater, clock: GameClock,
+                 sessions: SessionManager, session: Session, rng: random.Random):
         """
         The class that is used to play roulette.
         :param host: The user object that is the person that ran the original command
-        :param hosts_bet: The hosts bet
-        :param hosts_bet_type: The option that host bet on
+        :param hosts_bet: The hosts bet, already held in the session
+        :param hosts_bet_key: The payout table key of the bet the host placed
         :param bet_types: The bet types that are available to the players
         :param data: The data class that the root bot uses for saving data
         :param min_bet: The minimum bet (Per Server)
+        :param updater: The shared message updater that all the game's message edits go through
+        :param clock: The shared game clock that runs the countdown
+        :param sessions: The session manager that holds every bet until the game ends
+        :param session: This game's session
+        :param rng: The game's own seeded generator, so the roll can be replayed from its seed
         """
         self.data = data
-        self.host = Player(host, hosts_bet, hosts_bet_type)  # The person that started the game
+        self.host = Player(host, hosts_bet, hosts_bet_key)  # The person that started the game
         self.players: List[Player] = [self.host]
         self.min_bet = min_bet
         self.verify_callback = verify_callback
+        self.updater = updater
+        self.clock = clock
+        self.sessions = sessions
+        self.session = session
+        self.rng = rng
 
         self.message: discord.Message  # the root message that all updates are sent to
         self.bet_types: dict[str, str] = bet_types
@@ -208,8 +258,11 @@ class Roulette:
         self.rolled_color = ""  # The color that is rolled at the end of the game
         self.rolled_number = 0  # The number that is rolled at the end of the game
         self.game_over = False
+        self.started = False  # Set once the countdown is over and the ball is rolling. No more joining or leaving
 
         self.countdown = 60  # Game Start countdown in seconds
+        self.start_time = 0.0  # The monotonic time the countdown ends at
+        self._finish_task: Optional[asyncio.Task] = None
 
         # Setting up the buttons for start, join, and cancel
         self.view = discord.ui.View(timeout=180)
@@ -229,33 +282,61 @@ class Roulette:
         cancel_button = discord.ui.Button(label="Cancel", style=discord.ButtonStyle.danger)
         cancel_button.callback = self._cancel_callback
         self.view.add_item(cancel_button)
+        self.sessions.track_view(self.view)
 
     async def run(self, interaction: discord.Interaction):
         await interaction.response.send_message(embed=self._get_embed("queue"), view=self.view)
         # Store the message after it's sent
         self.message = await interaction.original_response()
 
-        # Wait for the countdown to finish. If the host presses start it will skip it
-        while self.countdown > 0:
-            # If the game is over we don't want to do anything
-            if self.game_over:
-                return
+        # The game clock runs the countdown from here. If the host presses start it will skip it
+        self.start_time = time.monotonic() + self.countdown
+        self.clock.schedule(self, self._next_display_time())
+        self.checkpoint()
 
-            # Update the displayed countdown every 5 seconds, unless it's the final 5 seconds where we update every second
-            if self.countdown % 5 == 0 or self.countdown < 5:
-                await self.message.edit(embed=self._get_embed("queue"), view=self.view)
-            # Sleeping for one second. We use asyncio.sleep instead of time.sleep to not block the event loop
-            await asyncio.sleep(1)
-            self.countdown -= 1
+    def checkpoint(self):
+        """ Saves who's betting on what, and when the game starts, with the session """
+        self.sessions.update_state(self.session, bets={player.user.id: player.bet_key for player in self.players},
+                                   starts_at=round(time.time() + self.start_time - time.monotonic()))
 
+    def on_clock(self, now: float) -> Optional[float]:
+        """ Called by the game clock when the displayed countdown needs updating, or when the game should start """
+        # If the game is over we don't want to do anything
+        if self.game_over:
+            return None
+
+        self.countdown = max(0, math.ceil(self.start_time - now))
+        if self.countdown <= 0:
+            self.started = True
+            self._finish_task = asyncio.get_running_loop().create_task(self._finish())
+            return None
+
+        self.updater.queue(self.message, EditPriority.TICK, embed=self._get_embed("queue"), view=self.view)
+        return self._next_display_time()
+
+    def _next_display_time(self) -> float:
+        """
+        The displayed countdown is updated every 5 seconds, unless it's the final 5 seconds where we update every
+        second. This works out the next time that happens, so the clock doesn't wake up for the seconds in between.
+        """
+        seconds_left = max(0, math.ceil(self.start_time - time.monotonic()))
+        next_display = seconds_left - 1
+        while next_display >= 5 and next_display % 5 != 0:
+            next_display -= 1
+        return self.start_time - max(0, next_display)
+
+    async def _finish(self):
         # Clear the view so that the buttons are removed
         self.view.clear_items()
         # Roll the values and calculate payouts!
         self._roll_values()
-        self._handle_payout()
+        self.game_over = True
+        await self._handle_payout()
+        await self.sessions.close(self.session)
 
         # Set the old message the ended embed so the user knows that the game is over
-        await self.message.edit(embed=self._get_embed("ended"), view=self.view)
+        await self.updater.edit(self.message, EditPriority.FINAL, wait=True, embed=self._get_embed("ended"),
+                                view=self.view)
 
         # send the message containing results, mentioning the players that participated
         await self.message.reply(content=", ".join([player.user.mention for player in self.players]),
@@ -265,22 +346,21 @@ class Roulette:
         """
         Rolls a random number and color for the roulette game.
         The rolled number is between 0 and 36, inclusive.
-        The rolled color is either "red", "black", or "green".
+        The rolled color is the color of that pocket on a real wheel, "red", "black", or "green".
         """
-        self.rolled_number = random.randint(0, 36)
-        if self.rolled_number == 0:
-            self.rolled_color = "green"
-        elif self.rolled_number % 2 == 0:
-            self.rolled_color = "red"
-        else:
-            self.rolled_color = "black"
+        self.rolled_number = self.rng.randint(0, wheel.POCKETS - 1)
+        self.rolled_color = wheel.pocket_color(self.rolled_number)
 
     async def _cancel_game(self):
         self.game_over = True
+        self.clock.remove(self)
+        # Closing the session refunds every bet still held
+        await self.sessions.close(self.session)
+        self.players.clear()
         await self.update_message("canceled")
 
     async def _on_timeout(self):
-        if not self.game_over:
+        if not self.game_over and not self.started:
             await self._cancel_game()
 
     def _get_embed(self, status: Literal["play", "finished", "canceled", "queue", "ended"]) -> discord.Embed:
@@ -295,7 +375,7 @@ class Roulette:
             for player in self.players:
                 embed.add_field(
                     name=f"{player.user.display_name} {':crown:' if self.players.index(player) == 0 else ''}",
-                    value=f"Bet: {player.bet} on {self.bet_types[player.bet_type]}", inline=False)
+                    value=f"Bet: {player.bet} on {player.describe_bet(self.bet_types)}", inline=False)
             embed.set_footer(text="Click 'Join' to participate.")
         # Canceled Embed
         elif status == "canceled":
@@ -336,50 +416,31 @@ class Roulette:
             )
         return embed
 
-    def _handle_payout(self):
-        # Looping through every player
-        for player in self.players:
-            # if they bet the color
-            player_balance = self.data.get_user_balance(player.user.id)
-            if player.bet_type == self.rolled_color:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet even and it was even
-            elif player.bet_type == "even" and self.rolled_number % 2 == 0:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet odd and it was odd
-            elif player.bet_type == "odd" and self.rolled_number % 2 != 0:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet low, and it was in the low range (lower than 19)
-            elif player.bet_type == "low" and self.rolled_number <= 18:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet high, and it was in the high range (higher than 18)
-            elif player.bet_type == "high" and self.rolled_number > 18:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet dozen1, and it was in the first dozen (1-12)
-            elif player.bet_type == "dozen1" and 1 <= self.rolled_number <= 12:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet dozen2, and it was in the second dozen (13-24)
-            elif player.bet_type == "dozen2" and 13 <= self.rolled_number <= 24:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
-            # If they bet dozen3, and it was in the third dozen (25-36)
-            elif player.bet_type == "dozen3" and 25 <= self.rolled_number <= 36:
-                player.calculate_payout()
-                self.data.set_user_balance(player.user.id, player_balance + player.payout)
+    async def _handle_payout(self):
+        # Every bet at the table is looked up in the payout table in one go
+        payouts = wheel.settle([(player.bet_key, player.bet) for player in self.players], self.rolled_number)
+
+        credits: dict[int, int] = {}
+        for player, payout in zip(self.players, payouts):
+            if payout > 0:
+                player.payout = payout
+                credits[player.user.id] = credits.get(player.user.id, 0) + payout
             # If their bet was not right, set their payout to a negative value. Unused if negative, but may be used later if I want to
             else:
                 player.payout = - player.bet
 
+        # Every held bet is released at once, and the winnings are paid out
+        await self.sessions.settle(self.session, credits)
+
     async def update_message(self, action: Literal["play", "finished", "canceled", "queue"], interaction=None):
-        await self.message.edit(embed=self._get_embed(action), view=self.view)
+        priority = EditPriority.FINAL if action in ["finished", "canceled"] else EditPriority.UPDATE
+        embed = self._get_embed(action)  # Built first, the canceled embed clears the view
+        await self.updater.edit(self.message, priority, embed=embed, view=self.view)
 
     async def _join_callback(self, interaction: discord.Interaction):
+        if self.started or self.game_over:
+            await interaction.response.send_message("This game has already started!", ephemeral=True)
+            return
         if interaction.user.id in [player.user.id for player in self.players]:
             await interaction.response.send_message("You are already in the game!", ephemeral=True)
             return
@@ -393,21 +454,35 @@ class Roulette:
         if interaction.user.id != self.players[0].user.id:
             await interaction.response.send_message("Only host can start the game", ephemeral=True)
             return
-        self.countdown = 0
+        if self.started or self.game_over:
+            await interaction.response.send_message("This game has already started!", ephemeral=True)
+            return
+        # Move the start time to now and let the clock start the game
+        self.start_time = time.monotonic()
+        self.clock.schedule(self, self.start_time)
         # Defer is basically like saying, we got it but, we don't need to send anything
         await interaction.response.defer()
 
     async def _cancel_callback(self, interaction: discord.Interaction):
-        for player in self.players:
-            if interaction.user.id == player.user.id:
-                player_balance = self.data.get_user_balance(player.user.id)
-                self.data.set_user_balance(player.user.id, player_balance + player.bet)
-                self.players.remove(player)
-                await interaction.response.send_message("You left the game. Bet refunded", ephemeral=True)
-                await self.update_message("queue", interaction)
+        if self.started or self.game_over:
+            await interaction.response.send_message("This game has already started, you can't leave now!",
+                                                    ephemeral=True)
+            return
+
+        player = next((player for player in self.players if player.user.id == interaction.user.id), None)
+        if player is None:
+            await interaction.response.send_message("You aren't in this game.", ephemeral=True)
+            return
 
-                break
+        await self.sessions.leave(self.session, player.user.id)
+        self.players.remove(player)
+        self.checkpoint()
+        await interaction.response.send_message("You left the game. Bet refunded", ephemeral=True)
 
         if len(self.players) == 0:
             self.game_over = True
+            self.clock.remove(self)
+            await self.sessions.close(self.session)
             await self.update_message("canceled", interaction)
+        else:
+            await self.update_message("queue", interaction)
@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import sys
+import weakref
+from typing import Dict, Optional, Tuple
+
+import discord
+
+from classes.saving import Data
+
+
+class SessionLimitReached(Exception):
+    """ Raised when a user, or the whole bot, already has as many games open as it's allowed """
+
+
+class Session:
+    """ One running game. Holds every bet placed in it until the game pays out or refunds them """
+
+    def __init__(self, session_id: int, game: str, host_id: int, guild_id: int):
+        self.id = session_id
+        self.game = game
+        self.host_id = host_id
+        self.guild_id = guild_id
+        self.escrow: Dict[int, int] = {}  # Berries held for the game, indexed by user ID
+        self.unsaved: Dict[int, int] = {}  # The part of the escrow taken since balances.json was last saved
+        self.state: dict = {}  # What the game needs checkpointed to explain a refund, like bets or the shoe seed
+        self.players: set[int] = {host_id}
+        self.closed = False
+
+    def checkpoint(self) -> dict:
+        """
+        The session as it's stored in active_games.json. The escrow, unsaved and state dictionaries are shared rather
+        than copied, so the checkpoint always matches the session.
+        """
+        return {"game": self.game, "guild": self.guild_id, "host": self.host_id, "escrow": self.escrow,
+                "unsaved": self.unsaved, "state": self.state}
+
+    def __repr__(self):
+        return f"<Session {self.id} {self.game} players={len(self.players)} held={sum(self.escrow.values())}>"
+
+
+class SessionManager:
+    """
+    Keeps track of every gambling game that's running, and is the only thing that moves berries in and out of them.
+
+    Bets are taken from the player's balance and held in the session's escrow. When the game ends the escrow is paid
+    out (or refunded), so a bet is never in the balance and in a game at the same time. Every balance change for a user
+    happens while holding that user's lock, so two games can't both spend the same berries.
+
+    Every open session is checkpointed to active_games.json whenever its escrow changes. The checkpoints are written
+    off the event loop by `Data.checkpoint_changed`, so a bet never waits on the disk. If the bot goes down with games
+    running, `recover` refunds those bets the next time it starts.
+    """
+
+    MAX_SESSIONS_PER_USER = 3
+    MAX_SESSIONS = 500
+
+    def __init__(self, data: Data):
+        self.data = data
+        self.sessions: Dict[int, Session] = {}  # Open sessions, indexed by session ID
+        self._user_sessions: Dict[int, set[int]] = {}  # IDs of the sessions each user is playing in
+        self._locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+        self._views: weakref.WeakSet[discord.ui.View] = weakref.WeakSet()
+        self._ids = itertools.count(1)
+        self.accepting = True  # Set to false when shutting down, so no new games start
+        self._recovered = False
+
+    # --- Opening and closing sessions --- #
+    def open(self, game: str, host_id: int, guild_id: int) -> Session:
+        """ Starts a session for a new game. Raises `SessionLimitReached` if the host or the bot are at their limit """
+        if not self.accepting:
+            raise SessionLimitReached("The bot is shutting down, no new games can be started.")
+        if len(self.sessions) >= self.MAX_SESSIONS:
+            raise SessionLimitReached("There are too many games running right now, try again in a bit.")
+        self._check_user_limit(host_id)
+
+        session = Session(next(self._ids), game, host_id, guild_id)
+        self.sessions[session.id] = session
+        self._user_sessions.setdefault(host_id, set()).add(session.id)
+        self.data.active_games[session.id] = session.checkpoint()
+        return session
+
+    def join(self, session: Session, user_id: int) -> None:
+        """ Adds a player to a multiplayer session """
+        if user_id in session.players:
+            return
+        self._check_user_limit(user_id)
+        session.players.add(user_id)
+        self._user_sessions.setdefault(user_id, set()).add(session.id)
+
+    async def leave(self, session: Session, user_id: int) -> int:
+        """ Takes a player out of a multiplayer session before it starts, refunding what they put in """
+        refunded = await self.refund(session, user_id)
+        if user_id != session.host_id:
+            session.players.discard(user_id)
+            self._forget(user_id, session.id)
+        return refunded
+
+    async def close(self, session: Session) -> None:
+        """ Ends the session. Anything still held gets refunded, so closing early never loses anyone's berries """
+        if session.closed:
+            return
+        await self.refund(session)
+
+        session.closed = True
+        self.sessions.pop(session.id, None)
+        self.data.active_games.pop(session.id, None)
+        self.data.checkpoint_changed()
+        for user_id in session.players:
+            self._forget(user_id, session.id)
+
+    async def drain(self, grace: float) -> Tuple[int, int]:
+        """
+        Stops new games from starting, and gives the running ones up to `grace` seconds to finish on their own.
+        Whatever is still running after that is closed and refunded.
+        :return: (how many games were refunded, how many berries were refunded)
+        """
+        self.accepting = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + grace
+        while self.sessions and loop.time() < deadline:
+            await asyncio.sleep(min(0.25, deadline - loop.time()))
+
+        games, berries = len(self.sessions), self.held_total
+        for session in list(self.sessions.values()):
+            await self.close(session)
+        return games, berries
+
+    def _forget(self, user_id: int, session_id: int):
+        user_sessions = self._user_sessions.get(user_id)
+        if user_sessions is not None:
+            user_sessions.discard(session_id)
+            if not user_sessions:
+                del self._user_sessions[user_id]
+
+    def _check_user_limit(self, user_id: int):
+        if len(self._user_sessions.get(user_id, ())) >= self.MAX_SESSIONS_PER_USER:
+            raise SessionLimitReached(
+                f"You already have {self.MAX_SESSIONS_PER_USER} games going. Finish one before starting another.")
+
+    # --- Moving berries --- #
+    def lock(self, user_id: int) -> asyncio.Lock:
+        """ The lock for a user's balance. Locks only live while something is using them """
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[user_id] = lock
+        return lock
+
+    async def hold(self, session: Session, user_id: int, amount: int) -> bool:
+        """
+        Takes a bet out of the user's balance and holds it in the session.
+        :return: False if the user doesn't have enough berries, in which case nothing is taken
+        """
+        async with self.lock(user_id):
+            balance = self.data.get_user_balance(user_id)
+            if session.closed or amount > balance:
+                return False
+            self.data.set_user_balance(user_id, balance - amount)
+            session.escrow[user_id] = session.escrow.get(user_id, 0) + amount
+            session.unsaved[user_id] = session.unsaved.get(user_id, 0) + amount
+            self.data.checkpoint_changed()
+            return True
+
+    async def settle(self, session: Session, payouts: Dict[int, int]) -> None:
+        """
+        Pays out the end of a round. Everything held in the session is released, and each user in `payouts` is given
+        their payout (stake included). Held bets with no payout are lost.
+        Does nothing if the session was already closed, since its bets have been refunded.
+        """
+        if session.closed:
+            return
+        for user_id in set(payouts) | set(session.escrow):
+            async with self.lock(user_id):
+                session.escrow.pop(user_id, None)
+                session.unsaved.pop(user_id, None)
+                if payouts.get(user_id):
+                    self.data.add_user_balances({user_id: payouts[user_id]})
+        self.data.checkpoint_changed()
+
+    async def refund(self, session: Session, user_id: Optional[int] = None) -> int:
+        """
+        Gives held bets back, either to one user or to everyone in the session.
+        :return: How many berries were refunded
+        """
+        user_ids = [user_id] if user_id is not None else list(session.escrow)
+        refunded = 0
+        for refund_id in user_ids:
+            async with self.lock(refund_id):
+                amount = session.escrow.pop(refund_id, 0)
+                session.unsaved.pop(refund_id, None)
+                if amount:
+                    self.data.add_user_balances({refund_id: amount})
+                    refunded += amount
+        if refunded:
+            self.data.checkpoint_changed()
+        return refunded
+
+    def update_state(self, session: Session, **state) -> None:
+        """ Adds to what's checkpointed about the game, and has the checkpoint saved """
+        session.state.update(state)
+        self.data.checkpoint_changed()
+
+    def recover(self) -> Tuple[int, int]:
+        """
+        Refunds every bet held by games that were still running when the bot last stopped, in one balance update.
+        Only bets that made it into the saved balances are refunded. Anything taken after the last save was never
+        saved as taken, so the player already has it back.
+        Only does anything the first time it's called, since after that the checkpoints are this run's games.
+        :return: (how many games were refunded, how many berries were refunded)
+        """
+        if self._recovered:
+            return 0, 0
+        self._recovered = True
+
+        refunds: Dict[int, int] = {}
+        games = 0
+        for game in self.data.active_games.values():
+            unsaved = {int(user_id): amount for user_id, amount in game.get("unsaved", {}).items()}
+            for user_id, amount in game.get("escrow", {}).items():
+                refund = amount - unsaved.get(int(user_id), 0)
+                if refund > 0:
+                    refunds[int(user_id)] = refunds.get(int(user_id), 0) + refund
+            games += 1
+
+        self.data.add_user_balances(refunds)
+        self.data.active_games.clear()
+        self.data.checkpoint_changed()
+        return games, sum(refunds.values())
+
+    # --- Stats --- #
+    def track_view(self, view: discord.ui.View) -> None:
+        """ Remembers a game's view, only for as long as something else keeps it alive """
+        self._views.add(view)
+
+    @property
+    def live_views(self) -> int:
+        return len(self._views)
+
+    def view_memory(self) -> int:
+        """ A rough count of the bytes held by live views and their buttons and menus """
+        total = 0
+        for view in list(self._views):
+            total += sys.getsizeof(view) + sys.getsizeof(view.__dict__)
+            for item in view.children:
+                total += sys.getsizeof(item) + sys.getsizeof(getattr(item, "__dict__", {}))
+        return total
+
+    def active_sessions(self, game: Optional[str] = None) -> int:
+        if game is None:
+            return len(self.sessions)
+        return sum(1 for session in self.sessions.values() if session.game == game)
+
+    @property
+    def held_total(self) -> int:
+        """ Every berry currently held by a game """
+        return sum(sum(session.escrow.values()) for session in self.sessions.values())
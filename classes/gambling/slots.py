@@ -1,22 +1,35 @@
+import itertools
 import random
 from typing import List
 
 import discord
 
+from classes.engines import slots as reels
+from classes.gambling.message_updater import MessageUpdater, EditPriority
+from classes.gambling.sessions import SessionManager, Session
 from classes.saving import Data
 
 
 class SlotsView(discord.ui.View):
-    def __init__(self, spin_callback: callable):
+    AUTO_SPIN_COUNTS = [10, 50, 100]
+
+    def __init__(self, spin_callback: callable, auto_spin_callback: callable, timeout_callback: callable):
         super().__init__(timeout=180)
+        self.timeout_callback = timeout_callback
 
         spin_button = discord.ui.Button(style=discord.ButtonStyle.success, label="Spin!")
         spin_button.callback = spin_callback
         self.add_item(spin_button)
 
-    def on_timeout(self) -> None:
+        for spins in self.AUTO_SPIN_COUNTS:
+            auto_spin_button = discord.ui.Button(style=discord.ButtonStyle.secondary, label=f"Auto x{spins}")
+            auto_spin_button.callback = lambda interaction, spins=spins: auto_spin_callback(interaction, spins)
+            self.add_item(auto_spin_button)
+
+    async def on_timeout(self) -> None:
         self.clear_items()
         self.stop()
+        await self.timeout_callback()
 
 
 class Slots:
@@ -26,15 +39,19 @@ class Slots:
 
     message: discord.Message
 
-    def __init__(self, user: discord.User, bet: int, data: Data, minimum_bet: int):
+    def __init__(self, user: discord.User, bet: int, data: Data, minimum_bet: int, updater: MessageUpdater,
+                 sessions: SessionManager, session: Session, rng: random.Random):
         self.user: discord.User = user
+        self.updater = updater
+        self.sessions = sessions
+        self.session = session  # Each spin's bet is held here until it's settled
+        self.rng = rng  # Every spin of the game comes from this one seeded generator, in order
+        self.sessions.update_state(self.session, bet=bet, seed=getattr(rng, "seed_value", None))
         self.bet: int = bet
         self.data = data
         self.minimum_bet: int = minimum_bet
 
-        self.slot_emoji = [
-            ":moneybag:", ":gem:", ":four_leaf_clover:", ":star:", ":slot_machine:"
-        ]
+        self.slot_emoji = list(reels.SYMBOLS)
         self.special_emoji = [
             ":star2:"
         ]
@@ -42,31 +59,78 @@ class Slots:
         self.round_income = 0
         self.user_gross_income = 0
         self.rolled_slots: List[str] = []
-        self.view = SlotsView(self._spin_callback)
+        self.rolled_outcome: int = 0  # The rolled symbols packed into an index of the payout tables
+        self.view = SlotsView(self._spin_callback, self._auto_spin_callback, self._on_timeout)
+        self.sessions.track_view(self.view)
 
     async def run(self, interaction):
-        self._spin()
+        if not await self._spin():
+            await self.sessions.close(self.session)
+            await interaction.response.send_message("You don't have enough berries to bet that much.", ephemeral=True)
+            return
         await interaction.response.send_message(embed=self._get_embed(), view=self.view)
         self.message: discord.Message = await interaction.original_response()
 
+    async def _on_timeout(self):
+        await self.sessions.close(self.session)
+
     async def _spin_callback(self, interaction: discord.Interaction):
         if interaction.user.id != self.user.id:
             await interaction.response.send_message("Only the user that started the game can play.", ephemeral=True)
             return
 
-        if self.data.get_user_balance(interaction.user.id) < self.minimum_bet:
+        if not await self._spin():
+            await interaction.response.send_message("Huh, looks like your all out of money.", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        # Only the newest spin is shown if the player clicks faster than the channel can be edited
+        await self.updater.edit(self.message, EditPriority.UPDATE, embed=self._get_embed(), view=self.view)
+
+    async def _auto_spin_callback(self, interaction: discord.Interaction, spins: int):
+        if interaction.user.id != self.user.id:
+            await interaction.response.send_message("Only the user that started the game can play.", ephemeral=True)
+            return
+
+        # Only spin as many times as the player could afford to lose every single one
+        spins = min(spins, self.data.get_user_balance(interaction.user.id) // self.bet)
+        if spins < 1 or self.data.get_user_balance(interaction.user.id) < self.minimum_bet:
+            await interaction.response.send_message("Huh, looks like your all out of money.", ephemeral=True)
+            return
+
+        # Every bet of the batch is held up front, then every spin is rolled and settled at once
+        stake = spins * self.bet
+        if not await self.sessions.hold(self.session, self.user.id, stake):
             await interaction.response.send_message("Huh, looks like your all out of money.", ephemeral=True)
             return
-        self._spin()
+        outcomes = reels.spin_batch(spins, self.rng)
+        results = reels.settle_batch(outcomes, self.bet)
+        net = sum(results)
+        await self.sessions.settle(self.session, {self.user.id: stake + net})
+
+        self.rolled_outcome = outcomes[-1]
+        self.rolled_slots = [self.slot_emoji[symbol] for symbol in reels.outcome_reels(outcomes[-1])]
+        self.round_income = net
+        self.user_gross_income += sum(result for result in results if result > 0)
 
-        await self.message.edit(embed=self._get_embed(), view=self.view)
         await interaction.response.defer()
+        await self.updater.edit(self.message, EditPriority.UPDATE, embed=self._get_auto_spin_embed(outcomes, results),
+                                view=self.view)
+
+    async def _spin(self) -> bool:
+        """ Holds the bet and spins once. Returns False if the player can't afford the bet """
+        if not await self.sessions.hold(self.session, self.user.id, self.bet):
+            return False
 
-    def _spin(self):
-        weights = [1, 2, 3, 4, 5]  # emoji[0] is rarest, emoji[3] is most common
-        self.rolled_slots = random.choices(self.slot_emoji, weights=weights, k=3)
+        self.rolled_outcome = reels.spin_batch(1, self.rng)[0]
+        self.rolled_slots = [self.slot_emoji[symbol] for symbol in reels.outcome_reels(self.rolled_outcome)]
         self._calculate_payout()
 
+        # A win pays the bet back along with the winnings
+        payout = self.bet + self.round_income if reels.OUTCOME_MULTIPLIERS[self.rolled_outcome] is not None else 0
+        await self.sessions.settle(self.session, {self.user.id: payout})
+        return True
+
     def _get_embed(self) -> discord.Embed:
         embed_description: str = "Press the button to spin the slots!"
         slots_padding: int = round((len(embed_description) / 2 - len(" | ".join('⠀'))) + 1)
@@ -82,52 +146,57 @@ class Slots:
         embed.set_footer(text="Click 'Spin!' to play.")
         return embed
 
+    def _get_auto_spin_embed(self, outcomes: List[int], results: List[int]) -> discord.Embed:
+        net = sum(results)
+        wins = sum(1 for outcome in outcomes if reels.OUTCOME_MULTIPLIERS[outcome] is not None)
+
+        embed = discord.Embed(
+            title=f"Slots (Auto x{len(outcomes)})",
+            description=f"You {'won' if net >= 0 else 'lost'} **{abs(net)}** berries over {len(outcomes)} spins.",
+            color=discord.Color.green() if net > 0 else discord.Color.red() if net < 0 else discord.Color.blue()
+        )
+
+        # The three biggest wins of the batch
+        best = sorted(range(len(results)), key=lambda i: results[i], reverse=True)[:3]
+        best_hits = "\n".join(
+            f"{' | '.join(self.slot_emoji[symbol] for symbol in reels.outcome_reels(outcomes[i]))} +{results[i]}"
+            for i in best if results[i] > 0)
+        embed.add_field(name="Best Hits", value=best_hits or "No wins this time", inline=False)
+        embed.add_field(name="Profit Over Time", value=f"`{self._profit_curve(results)}`", inline=False)
+
+        embed.add_field(name="Bet Amount", value=self.bet)
+        embed.add_field(name="Wins", value=f"{wins}/{len(outcomes)}")
+        embed.add_field(name="Total Income", value=self.user_gross_income, inline=False)
+        embed.set_footer(text="Click 'Spin!' to play, or an auto spin button to spin many times at once.")
+        return embed
+
+    @staticmethod
+    def _profit_curve(results: List[int], width: int = 25) -> str:
+        """ Draws the running total of a batch of spins as a line of block characters """
+        blocks = "▁▂▃▄▅▆▇█"
+        running = list(itertools.accumulate(results))
+
+        # Squash long batches down to `width` points
+        step = max(1, len(running) / width)
+        points = [running[min(len(running) - 1, int(i * step))] for i in range(min(width, len(running)))]
+        points[-1] = running[-1]
+
+        low, high = min(points), max(points)
+        spread = (high - low) or 1
+        return "".join(blocks[round((point - low) / spread * (len(blocks) - 1))] for point in points)
+
     def _calculate_payout(self):
-        """
-        3 of highest symbol: 50-100x bet
-        3 of high symbol: 20-30x bet
-        3 of medium symbol: 10-15x bet
-        3 of low symbols: 2-5x bet
-        2 of highest: 2x bet
-        Mixed combinations: 0.5x bet (or nothing)
-        :return: 
-        """
+        """ Looks the rolled symbols up in the outcome table. The multipliers are in `classes.engines.slots.PAYOUTS` """
         if len(self.rolled_slots) == 0:
             return
 
-        # Define payouts for each symbol (index) and count combination
-        payouts = {
-            (0, 3): 100,  # 3 moneybags
-            (0, 2): 10,  # 2 moneybags
-            (1, 3): 25,  # 3 gems
-            (1, 2): 3,  # 2 gems
-            (2, 3): 8,  # 3 clovers
-            (2, 2): 1.5,  # 2 clovers
-            (3, 3): 3,  # 3 stars
-            (3, 2): 0.5,  # 2 stars
-            (4, 3): 1.5,  # 3 slot machines
-            (4, 2): 0.2  # 2 slot machines
-        }
-
         # Check for winning combinations
-        won = False
-        for emoji_index, (symbol, count) in enumerate(
-                [(emoji, self.rolled_slots.count(emoji)) for emoji in self.slot_emoji]):
-            if (emoji_index, count) in payouts:
-                multiplier = payouts[(emoji_index, count)]
-                profit = round(self.bet * multiplier)
-                self._update_money(profit)
-                won = True
-                break
-
+        if reels.OUTCOME_MULTIPLIERS[self.rolled_outcome] is not None:
+            self._update_money(reels.net_result(self.rolled_outcome, self.bet))
         # If no winning combination found
-        if not won:
+        else:
             self.round_income = 0
-            user_balance = self.data.get_user_balance(self.user.id)
-            self.data.set_user_balance(self.user.id, user_balance - self.bet)
 
     def _update_money(self, profit):
         self.user_gross_income += profit
         self.round_income = profit
-        user_balance = self.data.get_user_balance(self.user.id)
-        self.data.set_user_balance(self.user.id, user_balance + profit)
@@ -1,18 +1,303 @@
 import datetime
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from typing import List, Optional
+
+# Log levels, the same numbers the standard library uses
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+
+# Arguments and fields of these types can't change after they're logged, so they're left for the writer thread.
+# Anything else is turned into text when it's logged, so the line shows it as it was then
+IMMUTABLE_TYPES = (str, int, float, bytes, type(None))
+
+
+def _apply_args(message: str, args: tuple) -> str:
+    """ `message % args`. Never raises, if they don't fit together or can't be turned into text, says so instead """
+    try:
+        return message % args
+    except Exception:
+        pass
+    try:
+        return f"{message} {args!r}"
+    except Exception as e:
+        return f"{message} (its arguments couldn't be shown: {type(e).__name__})"
+
+
+def _snapshot(value):
+    """ A copy of a field's value in the form it's written in """
+    try:
+        return json.loads(json.dumps(value, default=str))
+    except Exception as e:
+        return f"(couldn't be shown: {type(e).__name__})"
+
 
 class Logger:
-    def __init__(self, path: str):
+    """
+    Writes structured log lines to a file from a background thread.
+
+    Each line is a JSON object with the time, level, component and message, plus any fields passed along, like the
+    guild, user, command or duration. Lines below the logger's level are dropped before anything is formatted, and
+    messages are only formatted with their arguments once they're known to be written, so disabled debug lines cost
+    a single comparison. Arguments that could change before then, like lists or game objects, are the exception, and
+    are formatted when they're logged.
+
+    Logging only puts the record on a queue, so it never waits on the disk. The writer thread takes everything that's
+    queued, formats it and writes it in one go. The file is rotated once it's too big or too old, and rotated files
+    are gzipped. Warnings and errors are also written to stderr.
+
+    The queue has a size limit. If the disk can't keep up and the queue fills, new lines are dropped and counted
+    instead of using more and more memory, and the count is written once there's room again.
+    """
+
+    MAX_BYTES = 5 * 1024 * 1024  # Rotate once the log is bigger than this
+    MAX_AGE = 24 * 60 * 60  # Rotate once the log is older than this, in seconds
+    BACKUP_COUNT = 7  # How many rotated logs are kept
+    QUEUE_SIZE = 10000  # How many lines can be waiting to be written
+    FLUSH_INTERVAL = 1.0  # The longest a line waits before it's written, in seconds
+
+    root: Optional["Logger"] = None  # The logger `get_logger` writes to, set with `set_root_logger`
+
+    def __init__(self, path: str, level: int = INFO, echo_level: int = WARNING, max_bytes: int = MAX_BYTES,
+                 max_age: float = MAX_AGE, backup_count: int = BACKUP_COUNT, queue_size: int = QUEUE_SIZE):
+        """
+        :param path: The log file
+        :param level: Lines below this level aren't logged
+        :param echo_level: Lines at or above this level are also written to stderr
+        """
         self.path = path
+        self.level = level
+        self.echo_level = echo_level
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
 
-        with open(self.path, "a") as file:
-            file.write(f"===== Logging Started at {datetime.datetime.now()} =====\n")
+        self._queue: queue.Queue[Optional[tuple]] = queue.Queue(maxsize=queue_size)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._opened_at = self._started_at()  # Rotation goes by the age of the file, not of this run
+
+        self.info("Logging started", component="Logger", log_level=LEVEL_NAMES.get(level, level))
+
+        self._thread = threading.Thread(target=self._run, name="Logger", daemon=True)
+        self._thread.start()
+
+    # --- Logging --- #
+    def is_enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def emit(self, level: int, component: str, message: str, args: tuple = (), fields: Optional[dict] = None):
+        """
+        Queues a record. `message % args` is only worked out on the writer thread, if the record gets written, unless
+        an argument could change before then.
+        :param fields: Extra fields for the line, like guild, user, command or duration
+        """
+        if level < self.level:
+            return
+        if args and not all(isinstance(arg, IMMUTABLE_TYPES) for arg in args):
+            message, args = _apply_args(message, args), ()
+        if fields and not all(isinstance(value, IMMUTABLE_TYPES) for value in fields.values()):
+            fields = {key: value if isinstance(value, IMMUTABLE_TYPES) else _snapshot(value)
+                      for key, value in fields.items()}
+        try:
+            self._queue.put_nowait((time.time(), level, component, message, args, fields))
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+
+    def debug(self, message: str, *args, component: str = "", **fields):
+        if DEBUG >= self.level:
+            self.emit(DEBUG, component, message, args, fields)
+
+    def info(self, message: str, *args, component: str = "", **fields):
+        self.emit(INFO, component, message, args, fields)
+
+    def warning(self, message: str, *args, component: str = "", **fields):
+        self.emit(WARNING, component, message, args, fields)
+
+    def error(self, message: str, *args, component: str = "", **fields):
+        self.emit(ERROR, component, message, args, fields)
 
     def log(self, message: str = "", component: str = ""):
-        with open(self.path, "a") as file:
-            file.write(f"[{datetime.datetime.now().time()}] ({component}) -> {message}\n")
+        """ Logs an info line. Kept for anything still using the old interface """
+        self.emit(INFO, component, message)
+
+    def close(self, timeout: float = 5.0):
+        """ Writes everything that's queued and stops the writer thread. Waits at most `timeout` seconds """
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    @property
+    def pending(self) -> int:
+        """ How many lines are waiting to be written """
+        return self._queue.qsize()
+
+    # --- Writer thread --- #
+    def _run(self):
+        running = True
+        while running:
+            try:
+                records = [self._queue.get(timeout=self.FLUSH_INTERVAL)]
+            except queue.Empty:
+                records = []
+
+            # Take everything else that's already waiting, so it's all written at once
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in records:
+                running = False
+                records = [record for record in records if record is not None]
+
+            with self._dropped_lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                records.append((time.time(), WARNING, "Logger", "%d lines were dropped, the log couldn't keep up",
+                                (dropped,), None))
+
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    # The writer thread has to keep going, or every line after this one is lost
+                    sys.stderr.write(f"Failed to write {len(records)} lines to {self.path}: {e!r}\n")
+
+    @staticmethod
+    def _format(record: tuple) -> str:
+        timestamp, level, component, message, args, fields = record
+        if args:
+            message = _apply_args(message, args)
+
+        line = {
+            "time": datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds"),
+            "level": LEVEL_NAMES.get(level, str(level)),
+            "component": component,
+            "message": message,
+        }
+        if fields:
+            # Fields can't replace the time, level, component or message
+            line.update((key, value) for key, value in fields.items() if key not in line)
+        return json.dumps(line, default=str) + "\n"
+
+    def _write(self, records: List[tuple]):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self._format(record))
+            except Exception as e:
+                # A field that can't be turned into text. The line is still written, without the fields
+                lines.append(self._format((record[0], record[1], record[2], "A line couldn't be written",
+                                           (), {"error": type(e).__name__})))
+        echoed = [line for record, line in zip(records, lines) if record[1] >= self.echo_level]
+        if echoed:
+            sys.stderr.write("".join(echoed))
+
+        try:
+            if self._should_rotate():
+                self._rotate()
+            with open(self.path, "a") as file:
+                file.write("".join(lines))
+        except OSError as e:
+            # Nowhere else to log it, and the bot shouldn't go down because the log couldn't be written
+            sys.stderr.write(f"Failed to write to {self.path}: {e}\n")
+
+    def _started_at(self) -> float:
+        """
+        When the log file was started, from the time on its first line, so restarting doesn't make an old log look new.
+        Not every file system keeps creation times, and the modification and change times move with every line
+        written. A missing or unreadable log counts as starting now
+        """
+        try:
+            with open(self.path, "r") as file:
+                first_line = json.loads(file.readline())
+            return datetime.datetime.fromisoformat(first_line["time"]).timestamp()
+        except (OSError, ValueError, KeyError, TypeError):
+            return time.time()
+
+    def _should_rotate(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        return os.path.getsize(self.path) >= self.max_bytes or time.time() - self._opened_at >= self.max_age
+
+    def _rotate(self):
+        """ Gzips the current log next to it with a timestamp in the name, and deletes the oldest rotated logs """
+        base, extension = os.path.splitext(self.path)
+        rotated_path = f"{base}.{datetime.datetime.now():%Y%m%d-%H%M%S-%f}{extension}.gz"
+
+        with open(self.path, "rb") as source, gzip.open(rotated_path, "wb") as destination:
+            shutil.copyfileobj(source, destination)
+        os.remove(self.path)
+        self._opened_at = time.time()
+
+        # The timestamps sort in the order the logs were rotated
+        rotated = sorted(glob.glob(f"{glob.escape(base)}.*{extension}.gz"))
+        for old_path in rotated[:-self.backup_count] if self.backup_count else rotated:
+            os.remove(old_path)
+
+
+class ComponentLogger:
+    """
+    Logs to the root logger under one component, for modules that don't have the bot's logger handed to them.
+    Before a root logger is set, warnings and errors go to stderr and everything else is dropped.
+    """
+
+    __slots__ = ("component",)
+
+    def __init__(self, component: str):
+        self.component = component
+
+    def _emit(self, level: int, message: str, args: tuple, fields: dict):
+        root = Logger.root
+        if root is not None:
+            root.emit(level, self.component, message, args, fields)
+        elif level >= WARNING:
+            sys.stderr.write(Logger._format((time.time(), level, self.component, message, args, fields)))
+
+    def debug(self, message: str, *args, **fields):
+        root = Logger.root
+        if root is not None and DEBUG >= root.level:
+            root.emit(DEBUG, self.component, message, args, fields)
+
+    def info(self, message: str, *args, **fields):
+        self._emit(INFO, message, args, fields)
+
+    def warning(self, message: str, *args, **fields):
+        self._emit(WARNING, message, args, fields)
+
+    def error(self, message: str, *args, **fields):
+        self._emit(ERROR, message, args, fields)
+
+
+def get_logger(component: str) -> ComponentLogger:
+    return ComponentLogger(component)
+
+
+def set_root_logger(logger: Optional[Logger]) -> None:
+    """ Sends everything logged through `get_logger` to this logger """
+    Logger.root = logger
 
 
 if __name__ == "__main__":
-    logger = Logger("../log.txt")
+    logger = Logger("../log.txt", level=DEBUG)
 
-    logger.log("Hello World", "Logging Test")
\ No newline at end of file
+    logger.info("Hello World", component="Logging Test")
+    logger.debug("Formatted only when written: %s", "lazy", component="Logging Test", user=1234)
+    logger.close()
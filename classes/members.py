@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+from classes.logger import get_logger
+
+log = get_logger("Members")
+
+# --member-cache=<policy>. "all" holds every member of every guild, fetched when the bot connects, the way it always
+# has. "lazy" only holds the members Discord sends on its own, like ones who join or are in voice, and finds the rest
+# when they're needed. "none" doesn't hold any, and relies on MemberCache alone
+MEMBER_CACHE_POLICIES = ("all", "lazy", "none")
+DEFAULT_MEMBER_CACHE = "lazy"
+
+
+def member_cache_flags(policy: str, intents: discord.Intents) -> Tuple[discord.MemberCacheFlags, bool]:
+    """ The client's member cache flags for a policy, and whether it should chunk every guild when it connects """
+    if policy == "all":
+        return discord.MemberCacheFlags.from_intents(intents), True
+    if policy == "none":
+        return discord.MemberCacheFlags.none(), False
+    return discord.MemberCacheFlags.from_intents(intents), False
+
+
+class MemberCache:
+    """
+    Finds guild members without every member of every guild being held in memory.
+
+    `guild.get_member` is tried first, since it's a dictionary lookup. Members it doesn't have are found through
+    Discord, one at a time with `fetch_member` or up to `QUERY_LIMIT` at a time with a gateway member query, and kept
+    for `ttl` seconds. Users that aren't in the guild are remembered too, so they aren't asked for again. Only the
+    `max_size` most recently used lookups are kept.
+    """
+
+    TTL = 300.0
+    MAX_SIZE = 4096
+    QUERY_LIMIT = 100  # The most user IDs Discord takes in one member query
+
+    def __init__(self, ttl: float = TTL, max_size: int = MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # (expiry, member or None if they aren't in the guild), indexed by (guild ID, user ID), oldest use first
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[float, Optional[discord.Member]]]" = OrderedDict()
+        self.lookups: Dict[str, int] = {"guild": 0, "cache": 0, "discord": 0}  # Where each lookup was answered
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def fetch(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        """ The member, asking Discord if they aren't cached. None if they aren't in the guild """
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.lookups["guild"] += 1
+            return member
+        found, member = self._lookup(guild.id, user_id)
+        if found:
+            self.lookups["cache"] += 1
+            return member
+
+        self.lookups["discord"] += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        except discord.HTTPException as e:
+            # Not remembered, so it's asked for again next time
+            log.warning("Couldn't fetch a member: %s", e, guild=guild.id, user=user_id)
+            return None
+        self._store(guild.id, user_id, member)
+        return member
+
+    async def resolve(self, guild: discord.Guild, user_ids: Iterable[int]) -> Dict[int, discord.Member]:
+        """ The members of the guild out of `user_ids`, indexed by user ID. Users that aren't members are left out """
+        members: Dict[int, discord.Member] = {}
+        missing = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member is not None:
+                self.lookups["guild"] += 1
+                members[user_id] = member
+                continue
+            found, member = self._lookup(guild.id, user_id)
+            if found:
+                self.lookups["cache"] += 1
+                if member is not None:
+                    members[user_id] = member
+            else:
+                missing.append(user_id)
+
+        # A chunked guild already has every member, so anyone missing isn't in it
+        if guild.chunked:
+            return members
+
+        for start in range(0, len(missing), self.QUERY_LIMIT):
+            batch = missing[start:start + self.QUERY_LIMIT]
+            self.lookups["discord"] += len(batch)
+            try:
+                found_members = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                log.warning("Couldn't query members: %s", e, guild=guild.id, users=len(batch))
+                continue
+
+            by_id = {member.id: member for member in found_members}
+            for user_id in batch:
+                member = by_id.get(user_id)
+                self._store(guild.id, user_id, member)
+                if member is not None:
+                    members[user_id] = member
+        return members
+
+    def forget(self, guild_id: int, user_id: int) -> None:
+        """ Drops a cached lookup, like when the member leaves or changes """
+        self._entries.pop((guild_id, user_id), None)
+
+    def _lookup(self, guild_id: int, user_id: int) -> Tuple[bool, Optional[discord.Member]]:
+        """ Whether the lookup is cached and hasn't expired, and the member if it is """
+        key = (guild_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[1]
+
+    def _store(self, guild_id: int, user_id: int, member: Optional[discord.Member]) -> None:
+        self._entries[(guild_id, user_id)] = (time.monotonic() + self.ttl, member)
+        self._entries.move_to_end((guild_id, user_id))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,295 @@
+import asyncio
+import functools
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+
+class LatencyHistogram:
+    """
+    Counts latencies in log-linear buckets, the way HDR histograms do.
+
+    Every power of two is split into `SUB_BUCKETS` equal buckets, so any recorded value is within about 3% of the
+    bucket it's counted in, from a microsecond up to `MAX_SECONDS`. The memory used never grows, however many values
+    are recorded.
+    """
+
+    SUB_BUCKETS = 32
+    MAX_SECONDS = 60.0
+
+    def __init__(self):
+        self._max_micros = int(self.MAX_SECONDS * 1_000_000)
+        self.counts: List[int] = [0] * (self._index(self._max_micros) + 1)
+        self.count = 0
+        self.total = 0.0  # Sum of every recorded value, in seconds
+        self.max = 0.0
+
+    def _index(self, micros: int) -> int:
+        if micros < 2 * self.SUB_BUCKETS:
+            return micros
+        # Keep the top 6 bits of the value, the rest only picks the power of two
+        shift = micros.bit_length() - 6
+        return 2 * self.SUB_BUCKETS + (shift - 1) * self.SUB_BUCKETS + ((micros >> shift) - self.SUB_BUCKETS)
+
+    def _bucket_value(self, index: int) -> float:
+        """ The middle of a bucket, in seconds """
+        if index < 2 * self.SUB_BUCKETS:
+            return index / 1_000_000
+        shift, sub_bucket = divmod(index - 2 * self.SUB_BUCKETS, self.SUB_BUCKETS)
+        shift += 1
+        low = (sub_bucket + self.SUB_BUCKETS) << shift
+        return (low + (1 << shift) / 2) / 1_000_000
+
+    def record(self, seconds: float) -> None:
+        micros = min(max(0, int(seconds * 1_000_000)), self._max_micros)
+        self.counts[self._index(micros)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """ The value that `percent` percent of recorded values are at or below, in seconds """
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+
+# When each response being watched was acknowledged, indexed by the id() of the interaction's response object.
+# None until the command acknowledges the interaction
+_acknowledged_at: Dict[int, Optional[float]] = {}
+
+
+def _track_acknowledgements():
+    """
+    Wraps the ways an interaction can be acknowledged, so the time it happened can be noted for commands that are
+    being timed. Only done once, however many CommandStats there are.
+    """
+    for name in ("defer", "send_message", "edit_message", "send_modal"):
+        original = getattr(discord.InteractionResponse, name, None)
+        if original is None or getattr(original, "__tracks_acknowledgement__", False):
+            continue
+
+        def wrap(original):
+            @functools.wraps(original)
+            async def tracked(self, *args, **kwargs):
+                result = await original(self, *args, **kwargs)
+                if _acknowledged_at.get(id(self), 0.0) is None:
+                    _acknowledged_at[id(self)] = time.perf_counter()
+                return result
+
+            tracked.__tracks_acknowledgement__ = True
+            return tracked
+
+        setattr(discord.InteractionResponse, name, wrap(original))
+
+
+class CommandStats:
+    """
+    Times every command. For each one it keeps how long it took to acknowledge the interaction (Discord gives up after
+    3 seconds), how long the whole handler took, and how many calls raised an error.
+    """
+
+    ACK_DEADLINE = 3.0  # Seconds Discord waits for an interaction to be acknowledged
+
+    def __init__(self):
+        self.ack: Dict[str, LatencyHistogram] = {}
+        self.total: Dict[str, LatencyHistogram] = {}
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.late_acks: Dict[str, int] = {}  # Calls acknowledged after the deadline
+        _track_acknowledgements()
+
+    def timed(self, func):
+        """ Decorator for a command's callback. Goes right above the function, under the other command decorators """
+
+        @functools.wraps(func)
+        async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+            name = interaction.command.qualified_name if interaction.command else func.__name__
+            key = id(interaction.response)
+            _acknowledged_at[key] = None
+            started = time.perf_counter()
+            failed = False
+            try:
+                return await func(interaction, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                acknowledged = _acknowledged_at.pop(key, None)
+                self.record(name, time.perf_counter() - started,
+                            acknowledged - started if acknowledged is not None else None, failed)
+
+        return wrapper
+
+    def record(self, command: str, total: float, ack: Optional[float], failed: bool = False) -> None:
+        if command not in self.calls:
+            self.ack[command] = LatencyHistogram()
+            self.total[command] = LatencyHistogram()
+            self.calls[command] = 0
+            self.errors[command] = 0
+            self.late_acks[command] = 0
+
+        self.calls[command] += 1
+        self.total[command].record(total)
+        if ack is not None:
+            self.ack[command].record(ack)
+            if ack > self.ACK_DEADLINE:
+                self.late_acks[command] += 1
+        if failed:
+            self.errors[command] += 1
+
+    def percentiles(self, command: str, percents: Tuple[float, ...] = (50, 95, 99)) -> Tuple[List[float], List[float]]:
+        """ The acknowledgement and total time percentiles of a command, in seconds """
+        return ([self.ack[command].percentile(p) for p in percents],
+                [self.total[command].percentile(p) for p in percents])
+
+    def busiest(self, limit: int = 25) -> List[str]:
+        """ The commands with the most calls """
+        return sorted(self.calls, key=self.calls.get, reverse=True)[:limit]
+
+
+class StartupProfile:
+    """
+    Times each phase of starting the bot, from main.py's first import to the bot being ready. Printed with
+    --profile-startup, so restart-to-ready time can be measured and each phase's share of it seen.
+    """
+
+    def __init__(self, started: float):
+        """
+        :param started: `time.perf_counter()` when startup began
+        """
+        self.started = started
+        self.phases: List[Tuple[str, float]] = []  # Each phase and how long it took, in seconds, in order
+        self.finished = False
+        self._last = started
+
+    def mark(self, phase: str, at: Optional[float] = None) -> None:
+        """ Ends a phase, which began when the last one ended. Does nothing once startup is finished """
+        if self.finished:
+            return
+        at = time.perf_counter() if at is None else at
+        self.phases.append((phase, at - self._last))
+        self._last = at
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def finish(self) -> List[str]:
+        """ Ends startup, and returns a line for each phase and one for the total """
+        self.finished = True
+        total = self.total or 1e-9
+        lines = [f"{phase:<28}{seconds * 1000:>9.1f} ms {seconds / total:>7.1%}" for phase, seconds in self.phases]
+        lines.append(f"{'total':<28}{self.total * 1000:>9.1f} ms")
+        return lines
+
+
+# --- Prometheus exposition --- #
+# A metric for the exposition: its name, type ("gauge" or "counter"), help text, and its samples as (labels, value)
+Metric = Tuple[str, str, str, Iterable[Tuple[Dict[str, str], float]]]
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_metrics(metrics: Iterable[Metric]) -> str:
+    """ Writes metrics in the Prometheus text format """
+    lines = []
+    for name, kind, description, samples in metrics:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value!r}" if label_text else f"{name} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop is. A task asks to be woken up every `interval` seconds, and anything past that
+    is time the loop spent busy with something else, like a blocking call. Only runs while the metrics are served.
+    """
+
+    INTERVAL = 0.5
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.lag = 0.0  # How late the last wake up was, in seconds
+        self._max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def take_max_lag(self) -> float:
+        """ The worst lag since this was last called, so a short stall isn't missed between scrapes """
+        worst, self._max_lag = max(self._max_lag, self.lag), 0.0
+        return worst
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - started - self.interval)
+            self._max_lag = max(self._max_lag, self.lag)
+
+
+class MetricsServer:
+    """
+    Serves `/metrics` in the Prometheus text format from the bot's own event loop, on localhost only.
+    aiohttp comes with discord.py, and is only imported once the server is started.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, collect: Callable[[], Iterable[Metric]], port: int, host: str = "127.0.0.1"):
+        """
+        :param collect: Called on every scrape for the current metrics
+        """
+        self.collect = collect
+        self.port = port
+        self.host = host
+        self._runner = None
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    async def start(self) -> None:
+        if self._runner is not None:
+            return
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        self._runner = runner
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        body = format_metrics(self.collect())
+        return web.Response(body=body.encode(), headers={"Content-Type": self.CONTENT_TYPE})
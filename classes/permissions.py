@@ -1,6 +1,11 @@
 import inspect
+
+from discord import Interaction, app_commands
 from discord.app_commands import Command
 
+from classes.cooldowns import CooldownTracker
+
+
 def has_admin_check(command: Command) -> bool:
     """Check if a command has the admin check."""
     if not hasattr(command, 'checks') or not command.checks:
@@ -12,4 +17,22 @@ def has_admin_check(command: Command) -> bool:
             for cell in check.__closure__ or []:
                 if cell.cell_contents == {'administrator': True}:
                     return True
-    return False
\ No newline at end of file
+    return False
+
+
+def cooldown(tracker: CooldownTracker, command: str, per: int):
+    """
+    A replacement for `app_commands.checks.cooldown(1, per, key=lambda i: i.user.id)` that keeps its cooldowns in a
+    `CooldownTracker`, so they are saved with the rest of the data. It raises the same `CommandOnCooldown` error, so
+    the error handlers reply the same way they always have.
+    """
+
+    def predicate(interaction: Interaction) -> bool:
+        retry_after = tracker.get_retry_after(command, interaction.user.id)
+        if retry_after > 0:
+            raise app_commands.CommandOnCooldown(app_commands.Cooldown(1, per), retry_after)
+
+        tracker.trigger(command, interaction.user.id, per)
+        return True
+
+    return app_commands.check(predicate)
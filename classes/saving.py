@@ -1,15 +1,25 @@
+import asyncio
+import concurrent.futures
 import json
 import os
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONEncoder
-from typing import List, Dict, Type, TypeVar
+from typing import Any, List, Dict, Optional, Tuple, Type, TypeVar
 
+from classes.cooldowns import CooldownTracker
+from classes.logger import get_logger
 from classes.typepairs import *
 
 # Type variable for generic loading
 T = TypeVar('T')
 
+log = get_logger("Data")
+
+# What a guild that hasn't set a config uses. It isn't saved for the guild until the guild changes it
+DEFAULT_GUILD_CONFIG = GuildConfig(species="Parasaurolophus", chance=25)
+
 
 class Data:
     # Data Directories
@@ -18,6 +28,35 @@ class Data:
     balances: dict[int, int]  # User balances, indexed by user ID
     _hunt_outcomes: dict[int, List[GatherOutcome]]  # Hunt outcomes, indexed by guild ID
     _steal_outcomes: dict[int, List[GatherOutcome]]  # Steal outcomes, indexed by guild ID
+    cooldowns: CooldownTracker  # Command cooldowns, saved so they survive restarts
+    active_games: dict[int, dict]  # Checkpoints of the gambling games that are running, indexed by session ID
+    _dirty: dict[str, set[int]]  # Keys changed since the last save, indexed by the file they're saved to
+
+    # Config versions. Every config change takes the next number of the counter, so anything built from a config can
+    # keep the version it was built from and tell when it's out of date
+    config_changes: int = 0  # How many times a config has changed, or the configs were loaded
+    _config_versions: dict[int, int]  # The counter when each guild's config last changed, indexed by guild ID
+    _configs_loaded_version: int = 0  # The counter when the configs were last loaded, older than every guild's
+
+    # Caches, rebuilt when what they're built from changes
+    _samplers: dict[tuple[str, int], tuple]  # Rarity groups and weights for rolling, indexed by (file name, guild ID)
+    _affliction_names: dict[int, dict[str, int]]  # Where each affliction is in its list, by guild ID then name
+
+    # Save Statistics
+    loaded_at: float | None = None  # When the data was last loaded, as a Unix timestamp
+    last_saved_at: float | None = None  # When the last save finished, as a Unix timestamp
+    last_save_duration: float = 0.0  # How long the last save took, in seconds
+    last_save_bytes: int = 0  # How big the saved files were, all together
+
+    # Saving Across Threads. The data is only changed on the event loop once it's running, so everything that's saved
+    # is copied there, and only the writing happens on other threads
+    loop: Optional[asyncio.AbstractEventLoop] = None  # The event loop that changes the data, set once it's running
+    LOOP_COPY_TIMEOUT = 30.0  # The longest a save waits for the event loop to copy the data, in seconds
+    _write_lock: threading.Lock  # Held while writing the checkpoints, so only one thread writes them at a time
+    _checkpoint_copies: int = 0  # How many copies of the checkpoints have been taken, the last one numbers the newest
+    _checkpoint_written: int = 0  # The number of the newest copy that's been written, older ones aren't written
+    _checkpoints_changed: bool = False  # Whether the checkpoints changed since the last copy was taken to write
+    _checkpoint_task: Optional[asyncio.Task] = None
 
     # Autosave Thread Variables
     _autosave_thread: threading.Thread = None
@@ -25,43 +64,303 @@ class Data:
     _autosave_running: bool = False  # Flag to control autosave thread
     autosave_interval: int = 1800  # Autosave interval in seconds (default: 1/2 hour)
 
+    # The files holding guild and user data: the attribute each is loaded into, the type of its values, and the encoder
+    # it's saved with
+    FILES = {
+        "guild_configs.json": ("_configs", GuildConfig, GuildConfigEncoder),
+        "afflictions.json": ("_afflictions", List[Affliction], AfflictionEncoder),
+        "balances.json": ("balances", int, None),
+        "hunt_outcomes.json": ("_hunt_outcomes", List[GatherOutcome], GatherOutcomeEncoder),
+        "steal_outcomes.json": ("_steal_outcomes", List[GatherOutcome], GatherOutcomeEncoder),
+    }
+
     def __init__(self):
         self._autosave_stop_event = threading.Event()
-        pass
+        self.cooldowns = CooldownTracker()
+        self.active_games = {}
+        self._dirty = {"balances.json": set(), "guild_configs.json": set(), "afflictions.json": set()}
+        self._samplers = {}
+        self._affliction_names = {}
+        self._config_versions = {}
+        self._write_lock = threading.Lock()
 
     # --- Methods for saving and loading --- #
     def load(self):
-        self._configs = self._load_json("guild_configs.json", GuildConfig)
-        self._afflictions = self._load_json("afflictions.json", List[Affliction])
-        self.balances = self._load_json("balances.json", int)
-        self._hunt_outcomes = self._load_json("hunt_outcomes.json", List[GatherOutcome])
-        self._steal_outcomes = self._load_json("steal_outcomes.json", List[GatherOutcome])
+        """ Loads every data file, each one on its own thread """
+        files = {file_name: value_type for file_name, (_, value_type, _) in self.FILES.items()}
+        files["cooldowns.json"] = dict
+        files["active_games.json"] = dict
+        with ThreadPoolExecutor(max_workers=len(files), thread_name_prefix="Load") as pool:
+            loading = {file_name: pool.submit(self._load_json, file_name, value_type)
+                       for file_name, value_type in files.items()}
+        loaded = {file_name: future.result() for file_name, future in loading.items()}
+
+        for file_name, (attribute, _, _) in self.FILES.items():
+            setattr(self, attribute, loaded[file_name])
+        self.cooldowns.restore(loaded["cooldowns.json"])
+        self.active_games = loaded["active_games.json"]
+        self._samplers.clear()
+        self._configs_loaded()
+        self._affliction_names.clear()
+        self.loaded_at = time.time()
+
+    def warm(self) -> None:
+        """ Builds every guild's rolling samplers and affliction name index, so the first command doesn't have to """
+        for guild_id in self._afflictions:
+            self.get_afflictions_and_weights(guild_id)
+            self._affliction_index(guild_id)
+        for guild_id in self._hunt_outcomes:
+            self.get_hunt_outcomes_and_weights(guild_id)
+        for guild_id in self._steal_outcomes:
+            self.get_steal_outcomes_and_weights(guild_id)
+
+    # --- Methods for handing data to other processes --- #
+    def to_raw(self) -> Dict[str, dict]:
+        """ The guild and user data and the cooldowns, in the form they're saved in """
+        raw = {file_name: json.loads(json.dumps(getattr(self, attribute), cls=encoder))
+               for file_name, (attribute, _, encoder) in self.FILES.items()}
+        raw["cooldowns.json"] = json.loads(json.dumps(self.cooldowns.to_dict()))
+        return raw
+
+    def restore_raw(self, raw: Dict[str, dict]) -> None:
+        """ Loads data from `to_raw`, in place of reading the files """
+        for file_name, (attribute, value_type, _) in self.FILES.items():
+            setattr(self, attribute, self._convert(raw.get(file_name, {}), value_type))
+        self.cooldowns.restore(self._convert(raw.get("cooldowns.json", {}), dict))
+        self._samplers.clear()
+        self._affliction_names.clear()
+        self._configs_loaded()
+        self.loaded_at = time.time()
+
+    def entry_to_raw(self, file_name: str, key: int) -> Any:
+        """ One entry of a file in the form it's saved in, or None if there isn't one """
+        attribute, _, encoder = self.FILES[file_name]
+        value = getattr(self, attribute).get(key)
+        return json.loads(json.dumps(value, cls=encoder)) if value is not None else None
+
+    def apply_raw_entry(self, file_name: str, key: int, raw_value: Any) -> None:
+        """ Replaces one entry with one from `entry_to_raw`, or removes it if that's None. Isn't counted as a change """
+        attribute, value_type, _ = self.FILES[file_name]
+        collection = getattr(self, attribute)
+        if raw_value is None:
+            collection.pop(key, None)
+        else:
+            collection[key] = self._convert({key: raw_value}, value_type)[key]
+        self._forget(file_name, key)
 
     def save(self):
-        """ Saves all data to JSON files. """
-        print("Saving data...")
-        self._save_json("guild_configs.json", self._configs, GuildConfigEncoder)
-        self._save_json("afflictions.json", self._afflictions, AfflictionEncoder)
-        self._save_json("balances.json", self.balances)
-        self._save_json("hunt_outcomes.json", self._hunt_outcomes, GatherOutcomeEncoder)
-        self._save_json("steal_outcomes.json", self._steal_outcomes, GatherOutcomeEncoder)
-        print("Data saved successfully.")
+        """ Saves all data to JSON files. The data is copied on the event loop, and written on this thread """
+        log.debug("Saving data")
+        started = time.perf_counter()
+        files, checkpoints, unsaved = self.on_loop(self.snapshot)
+        try:
+            size = self.write_snapshot(files, checkpoints)
+        except Exception:
+            self.on_loop(lambda: self.restore_unsaved(unsaved))
+            raise
+        self.record_save(started, size)
+
+    def snapshot(self) -> Tuple[Dict[str, Any], Tuple[int, dict], Dict[Any, Dict[Any, int]]]:
+        """
+        Copies everything `save` writes: each file's contents and a copy of the checkpoints from
+        `snapshot_active_games`. Also returns the unsaved bets it cleared, indexed by game, for `restore_unsaved` if the
+        copy can't be written. Has to be called where the data is changed, which is the event loop once it's running.
+        """
+        # Anything changed after this is counted towards the next save
+        for keys in self._dirty.values():
+            keys.clear()
+        files = self.to_raw()
+        # The copied balances have every held bet taken out of them, so a restart has to give those bets back
+        unsaved = {}
+        for game_id, game in self.active_games.items():
+            if game["unsaved"]:
+                unsaved[game_id] = dict(game["unsaved"])
+                game["unsaved"].clear()
+        return files, self.snapshot_active_games(), unsaved
+
+    def write_snapshot(self, files: Dict[str, Any], checkpoints: Tuple[int, dict]) -> int:
+        """
+        Writes a copy from `snapshot`. Safe to call from any thread. Returns how big the files were.
+
+        The balances go first, and the checkpoints only once they've been written, so the checkpoints never say a bet
+        was saved when it wasn't. Raises OSError, without writing anything else, if the balances couldn't be written.
+        The other files failing is only logged, since the balances and checkpoints on disk still agree.
+        """
+        size = self._save_json("balances.json", files["balances.json"])
+        if not size:
+            raise OSError("balances.json couldn't be written")
+        try:
+            size += self.write_active_games(*checkpoints)
+        except OSError as e:
+            log.error("Couldn't save the running games' checkpoints: %s", e)
+
+        for file_name, contents in files.items():
+            if file_name == "balances.json":
+                continue
+            try:
+                size += self._save_json(file_name, contents)
+            except OSError as e:
+                log.error("Couldn't save %s: %s", file_name, e)
+        return size
+
+    def restore_unsaved(self, unsaved: Dict[Any, Dict[Any, int]]) -> None:
+        """
+        Puts back the unsaved bets `snapshot` cleared, once its copy couldn't be written, and has the checkpoints
+        saved again. Each is capped at what the game still holds for the user, since bets paid out since then aren't
+        held anymore. Has to be called where the checkpoints are changed.
+        """
+        for game_id, amounts in unsaved.items():
+            game = self.active_games.get(game_id)
+            if game is None:
+                continue
+            for user_id, amount in amounts.items():
+                held = game["escrow"].get(user_id, 0)
+                if held:
+                    game["unsaved"][user_id] = min(held, game["unsaved"].get(user_id, 0) + amount)
+        self.checkpoint_changed()
+
+    def record_save(self, started: float, size: int) -> None:
+        """ Updates the save statistics once a save started at `started` (`time.perf_counter()`) has finished """
+        self.last_save_duration = time.perf_counter() - started
+        self.last_save_bytes = size
+        self.last_saved_at = time.time()
+        log.info("Data saved", duration=round(self.last_save_duration, 3), size=size)
+
+    def on_loop(self, func):
+        """
+        Calls `func` on the event loop that changes the data and returns what it returns, waiting for it from other
+        threads. When there's no loop running, or this is the loop, it's called straight away.
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return func()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return func()
+        except RuntimeError:
+            pass
+
+        future = concurrent.futures.Future()
+
+        def call():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+
+        loop.call_soon_threadsafe(call)
+        try:
+            return future.result(self.LOOP_COPY_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # Only given up on if it hasn't started, otherwise it's about to finish
+            if future.cancel():
+                raise
+            return future.result()
 
     @staticmethod
-    def _save_json(file_name: str, data: dict, cls: type[JSONEncoder] | None = None) -> None:
-        """ Saves data to JSON file in the specified directory. """
+    def _save_json(file_name: str, data: dict, cls: type[JSONEncoder] | None = None) -> int:
+        """ Saves data to JSON file in the specified directory. Returns the file's size, or 0 if it wasn't saved """
         file_path = os.path.join("data", file_name)
 
         if not Data._validate_directory(os.path.dirname(file_path)):
-            print(f"Failed to create directory for {file_path}. Data not saved.")
-            return
+            log.error("Failed to create the directory for %s, data not saved", file_path)
+            return 0
 
-        with open(file_path, "w") as file:
+        # Written to a temporary file first and then swapped in, so a crash mid-save can't leave half a file behind
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "w") as file:
             try:
                 json.dump(data, file, indent=4, cls=cls)
-                # print(f"Data saved to {file_path}: {len(data)} entries.")
+                log.debug("Saved data to %s", file_path, entries=len(data))
             except (IOError, TypeError) as e:
-                print(f"Error saving JSON to {file_path}: {e}")
+                log.error("Error saving JSON to %s: %s", file_path, e)
+                return 0
+            size = file.tell()
+        os.replace(temp_path, file_path)
+        return size
+
+    # --- Methods for saving the running games' checkpoints --- #
+    @property
+    def active_games_file(self) -> str:
+        return "active_games.json"
+
+    def snapshot_active_games(self) -> Tuple[int, dict]:
+        """ A numbered copy of the checkpoints, for `write_active_games`. Has to be called where they're changed """
+        self._checkpoint_copies += 1
+        return self._checkpoint_copies, json.loads(json.dumps(self.active_games))
+
+    def write_active_games(self, number: int, checkpoints: dict) -> int:
+        """
+        Writes a copy from `snapshot_active_games`, unless a newer copy was already written. Safe to call from any
+        thread. Returns how big the file was, or 0 if it wasn't written
+        """
+        with self._write_lock:
+            if number < self._checkpoint_written:
+                return 0
+            self._checkpoint_written = number
+            return self._save_json(self.active_games_file, checkpoints)
+
+    def save_active_games(self) -> int:
+        """ Saves the checkpoints straight away. Only for when nothing else can be changing them, like at startup """
+        return self.write_active_games(*self.snapshot_active_games())
+
+    def checkpoint_changed(self) -> None:
+        """
+        Notes that the checkpoints changed, which they do every time a game's held bets do. On the event loop they're
+        copied there and written on another thread, and changes made while a copy is being written are written
+        together once it's done. Without a running loop they're saved straight away.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save_active_games()
+            return
+
+        self._checkpoints_changed = True
+        if self._checkpoint_task is None or self._checkpoint_task.done():
+            self._checkpoint_task = loop.create_task(self._write_checkpoints())
+
+    async def _write_checkpoints(self):
+        while self._checkpoints_changed:
+            self._checkpoints_changed = False
+            try:
+                await asyncio.to_thread(self.write_active_games, *self.snapshot_active_games())
+            except OSError as e:
+                log.error("Couldn't save the running games' checkpoints: %s", e)
+
+    # --- Methods for tracking unsaved changes --- #
+    def mark_dirty(self, file_name: str, key: int) -> None:
+        """
+        Notes that an entry has changed since the last save. The setters do this themselves, it's only needed after
+        changing something in place, like a list from `get_affliction_list`
+        """
+        self._dirty[file_name].add(key)
+        if file_name != "balances.json":
+            self._forget(file_name, key)
+
+    def _forget(self, file_name: str, guild_id: int) -> None:
+        """
+        Drops the caches built from a guild's list, they're rebuilt the next time they're needed. For a config, moves
+        its version on instead
+        """
+        if file_name == "guild_configs.json":
+            self.config_changes += 1
+            self._config_versions[guild_id] = self.config_changes
+            return
+        self._samplers.pop((file_name, guild_id), None)
+        if file_name == "afflictions.json":
+            self._affliction_names.pop(guild_id, None)
+
+    def _configs_loaded(self) -> None:
+        self.config_changes += 1
+        self._configs_loaded_version = self.config_changes
+        self._config_versions.clear()
+
+    def dirty_counts(self) -> dict[str, int]:
+        """ How many entries have changed since the last save, indexed by the file they're saved to """
+        return {file_name: len(keys) for file_name, keys in self._dirty.items()}
 
     @staticmethod
     def _load_json(file_name: str, value_type: Type[T]) -> Dict[int, T]:
@@ -69,70 +368,74 @@ class Data:
         file_path = os.path.join("data", file_name)
 
         if not os.path.exists(file_path):
-            print(f"Directory '{file_path}' does not exist. Returning empty dictionary.")
+            log.info("%s does not exist, starting with no entries", file_path)
             return {}
 
         with open(file_path, "r") as file:
             try:
                 raw_data = json.load(file)
-                print(f"Loaded data from {file_path}: {len(raw_data)} entries.")
-
-                # Convert the raw data to the expected format
-                typed_data: Dict[int, T] = {}
-
-                for key, value in raw_data.items():
-                    # Convert string keys to integers
-                    int_key = int(key)
-
-                    # Convert value to the specified type
-                    if value_type == int:
-                        typed_data[int_key] = value
-                    elif hasattr(value_type, '__origin__') and value_type.__origin__ is list:
-                        # Handle List types (e.g., List[Affliction], List[GatherOutcome])
-                        list_item_type = value_type.__args__[0] if value_type.__args__ else dict
-                        if isinstance(value, list):
-                            typed_data[int_key] = [list_item_type(**item) if isinstance(item, dict) else item for item
-                                                   in value]
-                        else:
-                            typed_data[int_key] = []
-                    else:
-                        # Handle single object types (e.g., GuildConfig)
-                        if isinstance(value, dict):
-                            typed_data[int_key] = value_type(**value)
-                        else:
-                            typed_data[int_key] = value_type(value)
-
-                return typed_data
+                log.debug("Loaded data from %s", file_path, entries=len(raw_data))
+                return Data._convert(raw_data, value_type)
 
             except json.JSONDecodeError as e:
-                print(f"Error loading JSON from {file_path}: {e}")
+                log.error("Error loading JSON from %s: %s", file_path, e)
                 return {}
             except (ValueError, TypeError) as e:
-                print(f"Error converting data types from {file_path}: {e}")
+                log.error("Error converting data types from %s: %s", file_path, e)
                 return {}
 
+    @staticmethod
+    def _convert(raw_data: dict, value_type: Type[T]) -> Dict[int, T]:
+        """ Converts loaded JSON to the expected format """
+        typed_data: Dict[int, T] = {}
+
+        for key, value in raw_data.items():
+            # Convert string keys to integers
+            int_key = int(key)
+
+            # Convert value to the specified type
+            if value_type == int:
+                typed_data[int_key] = value
+            elif hasattr(value_type, '__origin__') and value_type.__origin__ is list:
+                # Handle List types (e.g., List[Affliction], List[GatherOutcome])
+                list_item_type = value_type.__args__[0] if value_type.__args__ else dict
+                if isinstance(value, list):
+                    typed_data[int_key] = [list_item_type(**item) if isinstance(item, dict) else item for item
+                                           in value]
+                else:
+                    typed_data[int_key] = []
+            else:
+                # Handle single object types (e.g., GuildConfig)
+                if isinstance(value, dict):
+                    typed_data[int_key] = value_type(**value)
+                else:
+                    typed_data[int_key] = value_type(value)
+
+        return typed_data
+
     @staticmethod
     def _initialize_afflictions() -> List[Affliction]:
         default_affliction_path = os.path.join("defaults/", "afflictions.default.json")
 
         if not os.path.exists(default_affliction_path):
-            print(f"Default afflictions file '{default_affliction_path}' does not exist. Returning empty list.")
+            log.warning("Default afflictions file %s does not exist, starting with no afflictions",
+                        default_affliction_path)
             return []
 
         with open(default_affliction_path, "r") as file:
             try:
                 raw_data = json.load(file)
-                print(f"Loaded default afflictions from {default_affliction_path}: {len(raw_data)} entries.")
+                log.debug("Loaded default afflictions from %s", default_affliction_path, entries=len(raw_data))
 
                 # Convert each dictionary to an Affliction object
                 afflictions = [Affliction(**affliction_data) for affliction_data in raw_data]
                 return afflictions
 
             except json.JSONDecodeError as e:
-                print(f"Error loading JSON from {default_affliction_path}: {e}")
+                log.error("Error loading JSON from %s: %s", default_affliction_path, e)
                 return []
             except (ValueError, TypeError) as e:
-                print(f"Error converting affliction data from {default_affliction_path}: {e}")
+                log.error("Error converting affliction data from %s: %s", default_affliction_path, e)
                 return []
 
     # --- Autosave thread methods --- #
@@ -141,17 +444,21 @@ class Data:
         self._autosave_running = True
 
         while self._autosave_running:
-            self.save()
-            print("Autosave completed at", time.ctime())
+            try:
+                self.save()
+                log.debug("Autosave completed")
+            except Exception as e:
+                # Tried again next time, rather than never autosaving again
+                log.error("Autosave failed: %s", e)
             if self._autosave_stop_event.wait(self.autosave_interval):
                 break  # Stop even was set, exit immediately
 
     def start_autosave_thread(self):
         """ Starts the autosave thread if not already running. """
         if self._autosave_running:
-            print("Autosave thread is already running.")
+            log.warning("Autosave thread is already running")
             return
-        print("Starting autosave thread...")
+        log.info("Starting autosave thread", interval=self.autosave_interval)
         self._autosave_stop_event.clear()  # Resetting stop event
         self._autosave_thread = threading.Thread(target=self._autosave, daemon=True)
         self._autosave_thread.start()
@@ -159,27 +466,30 @@ class Data:
     def stop_autosave_thread(self):
         """ Stops the autosave thread if it is running. """
         if not self._autosave_running:
-            print("Autosave thread is not running.")
+            log.warning("Autosave thread is not running")
             return
         self._autosave_running = False
         self._autosave_stop_event.set()  # Signal to stop autosave
         if self._autosave_thread is not None:
             self._autosave_thread.join()
             self._autosave_thread = None
-        print("Autosave thread stopped.")
+        log.info("Autosave thread stopped")
 
     # --- Methods for getting information --- #
     def get_guild_config(self, guild_id: int) -> GuildConfig:
-        if guild_id not in self._configs:
-            print(f"Guild ID {guild_id} not found in configs. Initializing default config.")
-            self._configs[guild_id] = GuildConfig(species="Parasaurolophus", chance=25)
-        return self._configs[guild_id]
+        """ The guild's config, or the default one if it hasn't set one. Either way it's frozen, so it's shared """
+        return self._configs.get(guild_id, DEFAULT_GUILD_CONFIG)
+
+    def config_version(self, guild_id: int) -> int:
+        """ Goes up whenever the guild's config changes, so anything built from it can tell when to rebuild """
+        return max(self._config_versions.get(guild_id, 0), self._configs_loaded_version)
 
     def get_affliction_list(self, guild_id: int) -> List[Affliction]:
         if guild_id in self._afflictions.keys():
             return self._afflictions[guild_id]
 
         self._afflictions[guild_id] = self._initialize_afflictions()
+        self.mark_dirty("afflictions.json", guild_id)
         return self._afflictions[guild_id]
 
     def get_hunt_outcome_list(self, guild_id: int) -> List[GatherOutcome]:
@@ -188,37 +498,72 @@ class Data:
     def get_steal_outcome_list(self, guild_id: int) -> List[GatherOutcome]:
         return self._hunt_outcomes[guild_id]
 
+    def guild_count(self) -> int:
+        """ How many guilds have a config or an affliction list """
+        return len(self._configs.keys() | self._afflictions.keys())
+
+    def find_affliction(self, guild_id: int, name: str) -> Optional[Tuple[Affliction, int]]:
+        """ The affliction with this name, ignoring case, and its index in the guild's list. None if there isn't one """
+        index = self._affliction_index(guild_id).get(name.lower())
+        if index is None:
+            return None
+        return self._afflictions[guild_id][index], index
+
+    def _affliction_index(self, guild_id: int) -> dict[str, int]:
+        names = self._affliction_names.get(guild_id)
+        if names is None:
+            names = {}
+            for index, affliction in enumerate(self.get_affliction_list(guild_id)):
+                names.setdefault(affliction.name.lower(), index)  # The first one wins, the same as searching the list
+            self._affliction_names[guild_id] = names
+        return names
+
     def get_user_balance(self, user_id: int) -> int:
         """ Returns the user's balance, or the guild default if not found. """
         return self.balances.get(user_id, 0)
 
     # --- Methods for editing information --- #
     def set_guild_config(self, guild_id: int, config: GuildConfig) -> bool:
-        if guild_id in self._configs:
-            self._configs[guild_id] = config
-            return True
-        else:
-            print(f"Guild ID {guild_id} not found in configs.")
+        """ Stores the guild's config, whether or not it had one. Returns whether it changed """
+        if self._configs.get(guild_id) == config:
             return False
+        self._configs[guild_id] = config
+        self.mark_dirty("guild_configs.json", guild_id)
+        return True
+
+    def update_guild_config(self, guild_id: int, **changes) -> GuildConfig:
+        """ Changes some of the guild's config, leaving the fields given as None alone. Returns the new config """
+        config = self.get_guild_config(guild_id).replace(**changes)
+        self.set_guild_config(guild_id, config)
+        return config
 
     def set_affliction_list(self, guild_id: int, afflictions: List[Affliction]) -> bool:
         if guild_id in self._afflictions:
             self._afflictions[guild_id] = afflictions
+            self.mark_dirty("afflictions.json", guild_id)
             return True
         else:
-            print(f"Guild ID {guild_id} not found in afflictions.")
+            log.warning("Guild not found in afflictions", guild=guild_id)
             return False
 
     def set_gather_outcome_list(self, guild_id: int, gather_outcomes: List[GatherOutcome]) -> bool:
         if guild_id in self._hunt_outcomes:
             self._hunt_outcomes[guild_id] = gather_outcomes
+            self._forget("hunt_outcomes.json", guild_id)
             return True
         else:
-            print(f"Guild ID {guild_id} not found in hunt outcomes.")
+            log.warning("Guild not found in hunt outcomes", guild=guild_id)
             return False
 
     def set_user_balance(self, user_id: int, new_balance: int):
         self.balances[user_id] = new_balance
+        self.mark_dirty("balances.json", user_id)
+
+    def add_user_balances(self, changes: dict[int, int]) -> None:
+        """ Adds each amount to the matching user's balance. Used to pay out a whole game at once """
+        for user_id, amount in changes.items():
+            self.balances[user_id] = self.balances.get(user_id, 0) + amount
+            self.mark_dirty("balances.json", user_id)
 
     # --- Methods for appending information to dictionaries --- #
     def append_affliction(self, guild_id: int, new_affliction: Affliction) -> None:
@@ -226,43 +571,56 @@ class Data:
             self._afflictions[guild_id].append(new_affliction)
         else:
             self._afflictions[guild_id] = [new_affliction]
+        self.mark_dirty("afflictions.json", guild_id)
 
     def append_hunt_outcome(self, guild_id: int, hunt_outcome: GatherOutcome) -> None:
         if self._hunt_outcomes[guild_id]:
             self._hunt_outcomes[guild_id].append(hunt_outcome)
         else:
             self._hunt_outcomes[guild_id] = [hunt_outcome]
+        self._forget("hunt_outcomes.json", guild_id)
 
     def append_steal_outcome(self, guild_id: int, steal_outcome: GatherOutcome) -> None:
         if self._steal_outcomes[guild_id]:
             self._steal_outcomes[guild_id].append(steal_outcome)
         else:
             self._steal_outcomes[guild_id] = [steal_outcome]
+        self._forget("steal_outcomes.json", guild_id)
 
     # --- Methods for removing information from dictionaries --- #
     def remove_affliction(self, index) -> None:
         self._afflictions.pop(index)
+        self.mark_dirty("afflictions.json", index)
 
     def remove_hunt_outcome(self, index) -> None:
         self._hunt_outcomes.pop(index)
+        self._forget("hunt_outcomes.json", index)
 
     def remove_steal_outcome(self, index) -> None:
         self._steal_outcomes.pop(index)
+        self._forget("steal_outcomes.json", index)
 
     # --- Methods for getting rarities and weights for rolling --- #
+    # These are cached, so the lists they return must not be changed
     def get_hunt_outcomes_and_weights(self, guild_id: int):
-        return self._organise_rarities(self._hunt_outcomes[guild_id])
+        return self._sampler("hunt_outcomes.json", self._hunt_outcomes, guild_id)
 
     def get_steal_outcomes_and_weights(self, guild_id: int):
-        return self._organise_rarities(self._steal_outcomes[guild_id])
+        return self._sampler("steal_outcomes.json", self._steal_outcomes, guild_id)
 
     def get_afflictions_and_weights(self, guild_id: int):
-        return self._organise_rarities(self._afflictions[guild_id])
+        return self._sampler("afflictions.json", self._afflictions, guild_id)
 
     def get_minor_afflictions_and_weights(self, guild_id: int):
-        afflictions, _ = self._organise_rarities(self._afflictions[guild_id])
+        afflictions, _ = self.get_afflictions_and_weights(guild_id)
         return [afflictions[0]], [100]
 
+    def _sampler(self, file_name: str, collection: dict[int, list], guild_id: int):
+        sampler = self._samplers.get((file_name, guild_id))
+        if sampler is None:
+            sampler = self._samplers[(file_name, guild_id)] = self._organise_rarities(collection[guild_id])
+        return sampler
+
     # ---------------------- Static methods ---------------------- #
     @staticmethod
     def _organise_rarities(collection: list[Affliction | GatherOutcome]):
@@ -277,7 +635,7 @@ class Data:
     @staticmethod
     def _validate_directory(directory: str) -> bool:
         if not os.path.exists(directory):
-            print(f"Directory '{directory}' does not exist. Attempting to create it.")
+            log.info("Directory %s does not exist, creating it", directory)
             try:
                 os.makedirs(directory)
                 return True
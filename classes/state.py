@@ -0,0 +1,589 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from classes.cooldowns import CooldownTracker
+from classes.logger import get_logger
+from classes.saving import Data
+from classes.typepairs import GatherOutcome
+
+log = get_logger("State")
+
+SOCKET_PATH = os.path.join("data", "state.sock")
+REQUEST_TIMEOUT = 30.0  # The longest a request to the state service is waited on, in seconds
+MAX_MESSAGE = 16 * 1024 * 1024  # The longest line the state service reads, in bytes
+
+
+class StateError(Exception):
+    """ The state service couldn't be reached, or turned a request down """
+
+
+class StateStore:
+    """
+    The one copy of the shared data that's written to disk.
+
+    Changes arrive as operations, plain dictionaries with an "op" key. Each one is applied to the store's Data, and
+    turned into the update every other process is sent so its copy stays the same:
+    - "add_balances" adds amounts to balances. Amounts are sent rather than new balances, so two processes changing
+      the same balance at once both count. The update has the balances they came to.
+    - "entry" replaces one guild's entry in a file (guild_configs.json, afflictions.json, hunt_outcomes.json or
+      steal_outcomes.json) with the form it's saved in, or removes it if the value is None.
+    - "cooldown" puts a user on cooldown for a command until a unix timestamp, 0 to take them off it.
+    - "snapshot" changes nothing, and replies with all the data in the form `Data.to_raw` gives.
+    """
+
+    def __init__(self, data: Data):
+        self.data = data
+
+    def apply(self, op: dict) -> Tuple[dict, Optional[dict]]:
+        """ Applies an operation. Returns the reply to whoever sent it, and the update to send on, if there is one """
+        kind = op.get("op")
+
+        if kind == "snapshot":
+            return {"data": self.data.to_raw()}, None
+
+        if kind == "add_balances":
+            changes = {int(user_id): int(amount) for user_id, amount in op["changes"].items()}
+            self.data.add_user_balances(changes)
+            return {}, {"op": "balances", "values": {user_id: self.data.balances[user_id] for user_id in changes}}
+
+        if kind == "entry":
+            file_name, key = op["file"], int(op["key"])
+            if file_name not in Data.FILES or file_name == "balances.json":
+                raise ValueError(f"Entries can't be replaced in {file_name}")
+            self.data.apply_raw_entry(file_name, key, op.get("value"))
+            if file_name in self.data.dirty_counts():
+                self.data.mark_dirty(file_name, key)
+            return {}, op
+
+        if kind == "cooldown":
+            self.data.cooldowns.set_expiry(op["command"], int(op["user"]), int(op["expiry"]))
+            return {}, op
+
+        raise ValueError(f"Unknown operation {kind!r}")
+
+
+class StateServer:
+    """
+    The state service. Bot processes connect to it over a Unix socket, and it applies every change they send to its
+    StateStore and passes it on to the other processes. It's the only process that writes the shared data files, so
+    processes never save over each other's changes.
+
+    Messages are JSON objects, one per line. A message with an "id" is a request, and gets a reply with the same "id"
+    (and "error" if it failed). "save" asks for the data to be saved, and is replied to once it has been. After every
+    save each process is sent a "saved" update with how many messages it had sent when the save started, so it knows
+    which of its changes made it to disk.
+
+    Balance updates go to every process, the one that made the change too, so everyone ends up with the total the
+    service has. Other updates only go to the processes that didn't make them.
+    """
+
+    def __init__(self, store: StateStore, path: str = SOCKET_PATH):
+        self.store = store
+        self.path = path
+        self._clients: Dict[asyncio.StreamWriter, int] = {}  # How many messages have come from each process
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._save_lock: Optional[asyncio.Lock] = None
+
+    async def serve(self) -> None:
+        """ Serves until `stop` is called, then saves """
+        self._stopping = asyncio.Event()
+        self._save_lock = asyncio.Lock()
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left behind by a service that didn't stop cleanly
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_MESSAGE)
+        log.info("State service listening on %s", self.path)
+
+        autosave = asyncio.create_task(self._autosave())
+        try:
+            await self._stopping.wait()
+        finally:
+            autosave.cancel()
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self.save()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            log.info("State service stopped")
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def save(self) -> Optional[int]:
+        """
+        Copies the data here, between operations, and writes the copy on another thread, so changes keep being applied
+        while it writes. Returns how big the files were, or None if they couldn't be saved
+        """
+        data = self.store.data
+        async with self._save_lock:
+            started = time.perf_counter()
+            sent = dict(self._clients)
+            unsaved = {}
+            try:
+                files, checkpoints, unsaved = data.snapshot()
+                size = await asyncio.to_thread(data.write_snapshot, files, checkpoints)
+            except Exception as e:
+                # The processes aren't told it saved, so they keep the checkpoints that refund what it didn't
+                data.restore_unsaved(unsaved)
+                log.error("Couldn't save the data: %s", e)
+                return None
+            data.record_save(started, size)
+        for writer, count in sent.items():
+            if writer in self._clients:
+                self._write(writer, {"op": "saved", "seq": count})
+        return size
+
+    async def _autosave(self):
+        while True:
+            await asyncio.sleep(self.store.data.autosave_interval)
+            try:
+                await self.save()
+            except Exception as e:
+                # Tried again next time, rather than never autosaving again
+                log.error("Autosave failed: %s", e)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients[writer] = 0
+        log.info("Process connected", processes=len(self._clients))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._clients[writer] += 1
+
+                try:
+                    op = json.loads(line)
+                    request_id = op.pop("id", None)
+                except (ValueError, AttributeError) as e:
+                    log.warning("Ignoring a message that isn't a JSON object: %s", e)
+                    continue
+
+                try:
+                    if op.get("op") == "save":
+                        size = await self.save()
+                        reply = {"size": size} if size is not None else {"error": "The data couldn't be saved"}
+                        update = None
+                    else:
+                        reply, update = self.store.apply(op)
+                except (KeyError, TypeError, ValueError) as e:
+                    log.warning("Couldn't apply an operation: %s", e, op=op.get("op"))
+                    reply, update = {"error": str(e)}, None
+
+                if request_id is not None:
+                    self._write(writer, {"id": request_id, **reply})
+                if update is not None:
+                    self._broadcast(update, None if update["op"] == "balances" else writer)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            log.warning("Dropped a process: %s", e)
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+            log.info("Process disconnected", processes=len(self._clients))
+
+    def _broadcast(self, update: dict, origin: Optional[asyncio.StreamWriter]):
+        line = _encode(update)
+        for writer in list(self._clients):
+            if writer is not origin:
+                writer.write(line)
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, message: dict):
+        if not writer.is_closing():
+            writer.write(_encode(message))
+
+
+def _encode(message: dict) -> bytes:
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+# --- Links from a bot process to the state service --- #
+class StateLink(ABC):
+    """
+    How SharedData talks to the state service. `send` is for changes and doesn't wait, `request` waits for the reply.
+    `on_update` is called with every update the service sends, in the order they were sent, from the link's own thread.
+    """
+
+    def __init__(self):
+        self.on_update: Callable[[dict], None] = lambda update: None
+        self.sent = 0  # Messages sent, compared with the count in "saved" updates
+
+    def connect(self) -> None:
+        pass
+
+    @abstractmethod
+    def send(self, op: dict) -> None:
+        """ Sends a change to the service. Failures are logged rather than raised """
+
+    @abstractmethod
+    def request(self, op: dict, timeout: float = REQUEST_TIMEOUT) -> dict:
+        """ Sends an operation and waits for the reply. Raises StateError if it fails or there's no reply in time """
+
+    def close(self) -> None:
+        pass
+
+
+class SocketStateLink(StateLink):
+    """ A link to a StateServer over its Unix socket. Replies and updates are read on a background thread """
+
+    def __init__(self, path: str = SOCKET_PATH, connect_timeout: float = 30.0):
+        """
+        :param connect_timeout: How long to keep trying to connect for, while the service starts up
+        """
+        super().__init__()
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.connected = False
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, list] = {}  # [event, reply] of each request waiting on a reply, indexed by its ID
+        self._ids = itertools.count(1)
+
+    def connect(self) -> None:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                break
+            except OSError as e:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise StateError(f"Couldn't connect to the state service at {self.path}: {e}") from e
+                time.sleep(0.2)
+
+        self._sock = sock
+        self.connected = True
+        threading.Thread(target=self._read, name="State", daemon=True).start()
+        log.info("Connected to the state service", path=self.path)
+
+    def send(self, op: dict) -> None:
+        try:
+            self._write(op)
+        except StateError as e:
+            log.error("Couldn't send a change to the state service, only this process has it: %s", e,
+                      op=op.get("op"))
+
+    def request(self, op: dict, timeout: float = REQUEST_TIMEOUT) -> dict:
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[request_id] = waiter
+        try:
+            self._write({**op, "id": request_id})
+            if not waiter[0].wait(timeout):
+                raise StateError(f"The state service didn't reply to {op.get('op')} in time")
+        finally:
+            self._pending.pop(request_id, None)
+
+        reply = waiter[1]
+        if reply is None:
+            raise StateError("Lost the connection to the state service")
+        if "error" in reply:
+            raise StateError(reply["error"])
+        return reply
+
+    def close(self) -> None:
+        self.connected = False
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+
+    def _write(self, message: dict):
+        line = _encode(message)
+        with self._send_lock:
+            if not self.connected:
+                raise StateError("Not connected to the state service")
+            try:
+                self._sock.sendall(line)
+            except OSError as e:
+                raise StateError(str(e)) from e
+            self.sent += 1
+
+    def _read(self):
+        try:
+            with self._sock.makefile("rb") as stream:
+                for line in stream:
+                    try:
+                        message = json.loads(line)
+                    except ValueError as e:
+                        log.warning("Ignoring a message from the state service that isn't JSON: %s", e)
+                        continue
+
+                    if "id" in message:
+                        waiter = self._pending.get(message["id"])
+                        if waiter is not None:
+                            waiter[1] = message
+                            waiter[0].set()
+                        continue
+                    try:
+                        self.on_update(message)
+                    except Exception as e:
+                        log.error("Couldn't apply an update from the state service: %s", e, op=message.get("op"))
+        except OSError:
+            pass
+
+        if self.connected:
+            log.error("Lost the connection to the state service, changes are only kept in this process")
+        self.connected = False
+        for waiter in list(self._pending.values()):
+            waiter[0].set()
+
+
+class LocalStateService:
+    """
+    The state service without the socket, for running several SharedData in one process, like when testing. Every
+    operation is applied to the store straight away, and updates are handed to the other links before `send`
+    returns.
+    """
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self.links: List["LocalStateLink"] = []
+        self._lock = threading.Lock()
+
+    def connect(self) -> "LocalStateLink":
+        link = LocalStateLink(self)
+        self.links.append(link)
+        return link
+
+    def save(self) -> int:
+        with self._lock:
+            sent = {link: link.sent for link in self.links}
+            self.store.data.save()
+        for link, count in sent.items():
+            link.on_update({"op": "saved", "seq": count})
+        return self.store.data.last_save_bytes
+
+    def handle(self, origin: "LocalStateLink", op: dict) -> dict:
+        if op.get("op") == "save":
+            return {"size": self.save()}
+
+        with self._lock:
+            try:
+                reply, update = self.store.apply(json.loads(json.dumps(op)))
+            except (KeyError, TypeError, ValueError) as e:
+                raise StateError(str(e)) from e
+        if update is not None:
+            # Sent through JSON, so the links see the same types they would over the socket
+            update = json.loads(json.dumps(update))
+            for link in self.links:
+                if link is not origin or update["op"] == "balances":
+                    link.on_update(update)
+        return reply
+
+
+class LocalStateLink(StateLink):
+    def __init__(self, service: LocalStateService):
+        super().__init__()
+        self.service = service
+
+    def send(self, op: dict) -> None:
+        self.request(op)
+
+    def request(self, op: dict, timeout: float = REQUEST_TIMEOUT) -> dict:
+        self.sent += 1
+        return self.service.handle(self, op)
+
+
+# --- Data for a bot process --- #
+class SharedCooldowns(CooldownTracker):
+    """ Cooldowns that are sent to the state service when they're set, so they apply in every process """
+
+    def __init__(self, link: StateLink):
+        super().__init__()
+        self.link = link
+
+    def set_expiry(self, command: str, user_id: int, expiry: int) -> None:
+        super().set_expiry(command, user_id, expiry)
+        self.link.send({"op": "cooldown", "command": command, "user": user_id, "expiry": expiry})
+
+    def reset(self, command: str, user_id: int) -> None:
+        super().reset(command, user_id)
+        self.link.send({"op": "cooldown", "command": command, "user": user_id, "expiry": 0})
+
+    def apply(self, command: str, user_id: int, expiry: int) -> None:
+        """ Sets a cooldown another process set, without sending it back """
+        super().set_expiry(command, user_id, expiry)
+
+
+class SharedData(Data):
+    """
+    Data for one of several bot processes that share their data through the state service.
+
+    Everything is read from this process's copy, which is loaded from the service rather than the files. Every change
+    is made to the copy and sent to the service as well, and changes other processes make are handed to the event loop
+    as they arrive, and applied to the copy there, like every other change. Balances are sent as amounts added, so they add up even when two processes
+    change one at the same time. A guild's config, afflictions or outcomes are sent whole whenever they change.
+
+    Only the service writes the shared files. Saving asks it to save, and the running games, which only this process
+    knows about, are checkpointed to their own active_games.<name>.json.
+    """
+
+    def __init__(self, link: StateLink, name: str):
+        """
+        :param name: This process's name, which its checkpoint file is named after
+        """
+        super().__init__()
+        self.link = link
+        self.name = name
+        self.cooldowns = SharedCooldowns(link)
+        # Updates that arrive while the data is loading, applied once it has. None once it's loaded
+        self._held_updates: Optional[List[dict]] = None
+        self._updates_lock = threading.Lock()
+        link.on_update = self.apply_update
+
+    def load(self):
+        """ Connects to the state service and loads the data it has, and this process's checkpoints from disk """
+        with self._updates_lock:
+            self._held_updates = []
+        self.link.connect()
+        self.restore_raw(self.link.request({"op": "snapshot"})["data"])
+        self.active_games = self._load_json(self.active_games_file, dict)
+
+        # Updates from before the snapshot are already in it, and applying them again leaves it the same, since each
+        # one has the whole new value. The rest are applied in order, before any that arrive from now on
+        with self._updates_lock:
+            held, self._held_updates = self._held_updates, None
+            if held:
+                self._call_on_loop(self._apply_updates, held)
+
+    def save(self):
+        """ Asks the state service to save, and saves this process's checkpoints """
+        log.debug("Saving data")
+        started = time.perf_counter()
+        self.on_loop(self._clear_dirty)
+
+        try:
+            size = self.link.request({"op": "save"}).get("size", 0)
+        except StateError as e:
+            # The checkpoints keep what hasn't been saved, so a restart still refunds the right amounts
+            log.error("The state service couldn't save: %s", e)
+            size = 0
+        size += self.write_active_games(*self.on_loop(self.snapshot_active_games))
+        self.record_save(started, size)
+
+    def _clear_dirty(self) -> None:
+        for keys in self._dirty.values():
+            keys.clear()
+
+    @property
+    def active_games_file(self) -> str:
+        return f"active_games.{self.name}.json"
+
+    # --- Applying changes from the state service --- #
+    def apply_update(self, update: dict) -> None:
+        """
+        Takes a change another process made, or the service saving, from the link's thread. It's applied on the event
+        loop, or straight away when there isn't one running
+        """
+        with self._updates_lock:
+            if self._held_updates is not None:
+                self._held_updates.append(update)
+                return
+            self._call_on_loop(self._apply_update, update)
+
+    def _call_on_loop(self, func, *args) -> None:
+        """ Calls `func` on the event loop without waiting for it, or straight away if there isn't one running """
+        loop = self.loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            func(*args)
+        else:
+            loop.call_soon_threadsafe(func, *args)
+
+    def _apply_updates(self, updates: List[dict]) -> None:
+        for update in updates:
+            self._apply_update(update)
+
+    def _apply_update(self, update: dict) -> None:
+        kind = update.get("op")
+        try:
+            if kind == "balances":
+                for user_id, balance in update["values"].items():
+                    self.balances[int(user_id)] = balance
+            elif kind == "entry":
+                self.apply_raw_entry(update["file"], int(update["key"]), update.get("value"))
+            elif kind == "cooldown":
+                self.cooldowns.apply(update["command"], int(update["user"]), int(update["expiry"]))
+            elif kind == "saved":
+                # Only once the service has everything this process sent is the held money in the saved balances
+                if update["seq"] >= self.link.sent:
+                    for game in self.active_games.values():
+                        game["unsaved"].clear()
+                    self.checkpoint_changed()
+        except (KeyError, TypeError, ValueError) as e:
+            log.error("Couldn't apply an update from the state service: %s", e, op=kind)
+
+    # --- Sending changes --- #
+    def _send_entry(self, file_name: str, key: int) -> None:
+        self.link.send({"op": "entry", "file": file_name, "key": key, "value": self.entry_to_raw(file_name, key)})
+
+    def mark_dirty(self, file_name: str, key: int) -> None:
+        super().mark_dirty(file_name, key)
+        if file_name != "balances.json":
+            self._send_entry(file_name, key)
+
+    def set_user_balance(self, user_id: int, new_balance: int):
+        change = new_balance - self.balances.get(user_id, 0)
+        super().set_user_balance(user_id, new_balance)
+        self.link.send({"op": "add_balances", "changes": {user_id: change}})
+
+    def add_user_balances(self, changes: dict[int, int]) -> None:
+        super().add_user_balances(changes)
+        self.link.send({"op": "add_balances", "changes": changes})
+
+    def set_gather_outcome_list(self, guild_id: int, gather_outcomes: List[GatherOutcome]) -> bool:
+        changed = super().set_gather_outcome_list(guild_id, gather_outcomes)
+        if changed:
+            self._send_entry("hunt_outcomes.json", guild_id)
+        return changed
+
+    def append_hunt_outcome(self, guild_id: int, hunt_outcome: GatherOutcome) -> None:
+        super().append_hunt_outcome(guild_id, hunt_outcome)
+        self._send_entry("hunt_outcomes.json", guild_id)
+
+    def append_steal_outcome(self, guild_id: int, steal_outcome: GatherOutcome) -> None:
+        super().append_steal_outcome(guild_id, steal_outcome)
+        self._send_entry("steal_outcomes.json", guild_id)
+
+    def remove_hunt_outcome(self, index) -> None:
+        super().remove_hunt_outcome(index)
+        self._send_entry("hunt_outcomes.json", index)
+
+    def remove_steal_outcome(self, index) -> None:
+        super().remove_steal_outcome(index)
+        self._send_entry("steal_outcomes.json", index)
+
+
+def serve(path: str = SOCKET_PATH) -> None:
+    """ Loads the data and runs the state service until it's sent SIGTERM or SIGINT """
+    import signal
+    from classes.gambling import SessionManager
+
+    data = Data()
+    data.load()
+    # Games left in active_games.json by a single process bot are refunded here, the bot processes only keep track of
+    # their own
+    games, refunded = SessionManager(data).recover()
+    if games:
+        log.warning("Refunded %d berries held by %d unfinished games", refunded, games)
+    server = StateServer(StateStore(data), path)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, server.stop)
+        await server.serve()
+
+    asyncio.run(run())
@@ -2,20 +2,45 @@ import json
 
 
 class GuildConfig:
-    """Class representing a guild configuration with species and afflictions."""
+    """
+    Class representing a guild configuration with species and afflictions.
+
+    Configs are frozen snapshots. The same one can be handed to every command and game without any of them changing
+    it under the others, and a change is made with `replace` and stored with `Data.set_guild_config`.
+    """
 
     AFFLICTION_CHANCE = 25  # Default chance for afflictions
+    FIELDS = ("species", "chance", "minor_chance", "starting_pay", "minimum_bet")
+
+    __slots__ = FIELDS
 
     def __init__(self, species: str, chance: int = AFFLICTION_CHANCE, minor_chance: int = AFFLICTION_CHANCE + 10, starting_pay = 100, minimum_bet: int = 100):
-        self.species = species
-        self.chance = chance
-        self.minor_chance = minor_chance
-        self.starting_pay = starting_pay
-        self.minimum_bet = minimum_bet
+        object.__setattr__(self, "species", species)
+        object.__setattr__(self, "chance", chance)
+        object.__setattr__(self, "minor_chance", minor_chance)
+        object.__setattr__(self, "starting_pay", starting_pay)
+        object.__setattr__(self, "minimum_bet", minimum_bet)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"GuildConfig is frozen, use replace() to change {name}")
+
+    def __eq__(self, other):
+        if not isinstance(other, GuildConfig):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.FIELDS)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, field) for field in self.FIELDS))
 
     def __str__(self):
         return f"{self.species.title()} ({self.chance}%)"
 
+    def replace(self, **changes) -> "GuildConfig":
+        """ A copy of the config with some fields changed. Fields given as None are left as they are """
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update((field, value) for field, value in changes.items() if value is not None)
+        return GuildConfig(**values)
+
     @classmethod
     def from_dict(cls, data: dict):
         """Create a GuildConfig instance from a dictionary."""
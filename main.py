@@ -1,26 +1,78 @@
+import time
+
+_started = time.perf_counter()  # Startup is timed from here, for --profile-startup
+
+import asyncio
 import atexit
 import math
 import os
 import random
+import signal
 import sys
-from typing import List, Optional, Literal
+import threading
+from typing import List, Optional, Literal, TYPE_CHECKING
 
 import discord
 import dotenv
-import requests
 from discord import app_commands
-from rich.console import Console
+
+_libraries_imported = time.perf_counter()
 
 from classes.afflictions import AfflictionController
-from classes.gambling import Roulette, Blackjack, Slots
-from classes.logger import Logger
-from classes.permissions import has_admin_check
+from classes.command_sync import CommandManifest
+from classes.engines import roulette as roulette_wheel
+from classes.engines import slots as slot_reels
+from classes.engines import triggers
+from classes.engines.cards import Shoe
+from classes.engines.rng import RngService
+from classes.gambling import Roulette, Blackjack, Slots, MessageUpdater, GameClock, SessionManager, Session, \
+    SessionLimitReached
+from classes.logger import Logger, get_logger, set_root_logger, DEBUG, INFO
+from classes.members import MemberCache, MEMBER_CACHE_POLICIES, DEFAULT_MEMBER_CACHE, member_cache_flags
+from classes.metrics import CommandStats, LoopLagMonitor, Metric, MetricsServer, StartupProfile
+from classes.permissions import cooldown
 from classes.saving import Data
+from classes.state import SharedData, SocketStateLink
 from classes.typepairs import Affliction, GuildConfig, GatherOutcome
 
+_classes_imported = time.perf_counter()
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
 # Constants
 DATA_DIRECTORY = "data"
 LOG_FILE = "log.txt"
+MESSAGE_CHARACTER_LIMIT = 2000
+SHUTDOWN_TIMEOUT = 10.0  # Default for --shutdown-timeout, in seconds
+GAME_GRACE = 5.0  # The longest running games are given to finish on their own when shutting down, in seconds
+
+# Users on_message listens to, everyone else is only checked for whispers
+FAVORED_ONES = frozenset({767047725333086209, 953401260306989118, 757757494192767017})
+LOVE_RESPONSES = [
+    ":heart:",
+    "Anything for you pookie :para_love:",
+    "Your welcome!",
+    "You too\n-# Shoot, wrong thing :para_sweat:",
+    "<a:para_dance:1349156824439324732>",
+    "<:para_sparkle:1349157954603061299>",
+    "<:para_cool:1349156483564310629>"
+]
+HATE_RESPONSES = [
+    ":sob:",
+    "<:para_sweat:1349157654433370174>",
+    "<:para_sob:1349156486529421352>",
+    "<:para_angy:1349156485044895774>",
+    "<:para_tears:1349156487976587304>"
+]
+BLESS_RESPONSES = [
+    "{name}, I bless you with {blessing} berries... and stuff :/",
+    "-# psst {name} I am giving you {blessing} out of the goodness of my heart, they dont really control me :wink:",
+    "The skies open above {name} and rains berries. {name} picks up {blessing}.",
+    "Hey {name}, catch!\n-# {blessing} berries fly towards {name}"
+]
+
+log = get_logger("Bot")
 
 
 async def read_error(interaction: List[discord.Interaction], error: app_commands.AppCommandError, logger: Logger):
@@ -30,8 +82,9 @@ async def read_error(interaction: List[discord.Interaction], error: app_commands
     elif isinstance(error, app_commands.CommandOnCooldown):
         await interaction[0].response.send_message(error, ephemeral=True)
     else:
-        logger.log(f"Error while processing command: {error}", "Bot")
-        print(error)
+        logger.error("Error while processing command: %s", error, component="Bot",
+                     command=interaction[0].command.qualified_name if interaction[0].command else None,
+                     guild=interaction[0].guild_id, user=interaction[0].user.id)
         await interaction[0].response.send_message("An error occurred while running the command",
                                                    ephemeral=True)
 
@@ -68,25 +121,22 @@ def get_outcome_embed(gather_type: Literal["hunt", "steal"], outcome: GatherOutc
     return embed
 
 
-def validate_discord_token(token: str) -> bool:
-    """ Validates a given Discord token """
-    if not token:
-        return False
+def chunk_lines(lines: List[str], limit: int = MESSAGE_CHARACTER_LIMIT) -> List[str]:
+    """ Joins lines into as few messages as possible while keeping each one under Discord's character limit """
+    chunks = []
+    current = ""
 
-    url = "https://discord.com/api/v10/users/@me"
-    headers = {"Authorization": f"Bot {token}"}
+    for line in lines:
+        # A single line that is too long on its own gets cut, there's no nice way to split it
+        line = line[:limit]
+        if current and len(current) + len(line) + 1 > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
 
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            return False
-
-        data = response.json()
-        print(f"Token is valid! Bot name: {data.get('username')}")
-        return True
-    except Exception as e:
-        print("Error validating token:", e)
-        return False
+    if current:
+        chunks.append(current)
+    return chunks
 
 
 def organise_rarities(dictionary: dict[int, List[Affliction | GatherOutcome]], index: int):
@@ -105,15 +155,86 @@ class Pagget:
 
     def __init__(self):
         """Initialize the bot with required configurations and load afflictions."""
+        self.startup = StartupProfile(_started)
+        self.startup.mark("import libraries", _libraries_imported)
+        self.startup.mark("import classes", _classes_imported)
+
         # Load environment variables
         dotenv.load_dotenv()
 
-        # Setup console and logging
-        self.console = Console()
-        self.logger = Logger(LOG_FILE)
+        # Setup console and logging. rich is slow to import, so the console is only made once something is printed
+        self._console: Optional["Console"] = None
+
+        # Sharding, for running the bot as several processes with utils/launch.py. --shard-count=<count> makes the
+        # client an AutoShardedClient, --shards=<id,id,...> picks the shards this process runs, and --state=<socket>
+        # shares the data with the other processes through the state service
+        self.shard_count: Optional[int] = None
+        self.shard_ids: Optional[List[int]] = None
+        state_socket: Optional[str] = None
+        for arg in sys.argv:
+            if arg.startswith("--shard-count="):
+                try:
+                    self.shard_count = int(arg.split("=")[1])
+                except ValueError:
+                    self.console.print(f"[red]Invalid shard count '{arg.split('=')[1]}', Discord will pick one[/]")
+            elif arg.startswith("--shards="):
+                try:
+                    self.shard_ids = [int(shard_id) for shard_id in arg.split("=")[1].split(",")]
+                except ValueError:
+                    self.console.print(f"[red]Invalid shard IDs '{arg.split('=')[1]}', running every shard[/]")
+            elif arg.startswith("--state="):
+                state_socket = arg.split("=", 1)[1]
+        if self.shard_ids is not None and self.shard_count is None:
+            self.console.print("[red]--shards needs --shard-count as well, running every shard[/]")
+            self.shard_ids = None
+        # Names this process's log and checkpoint files when it's one of several
+        self.instance_name = "main" if self.shard_ids is None else "shards-" + "-".join(map(str, self.shard_ids))
+
+        log_file = LOG_FILE if self.shard_ids is None else f"log.{self.instance_name}.txt"
+        self.logger = Logger(log_file, level=DEBUG if any(arg == "--debug" for arg in sys.argv) else INFO)
+        set_root_logger(self.logger)
 
         # Data class
-        self.data: Data = Data()
+        if state_socket is not None:
+            self.data: Data = SharedData(SocketStateLink(state_socket), self.instance_name)
+        else:
+            self.data: Data = Data()
+
+        # All the gambling games edit their messages through this, so they don't run into rate limits
+        self.message_updater = MessageUpdater()
+        # Runs the countdowns of every roulette table from one loop
+        self.game_clock = GameClock()
+        # (config version, return to player, variance) of each guild's slot machine for /house-edge, by guild ID
+        self.house_edges: dict[int, tuple[int, float, float]] = {}
+        # Each guild deals blackjack from its own shoe, indexed by guild ID
+        self.blackjack_shoes: dict[int, Shoe] = {}
+        # Holds every bet placed in a running game, and limits how many games each user can have going
+        self.sessions = SessionManager(self.data)
+        # Every game and roll gets its own seeded generator. The seeds go in the log, so outcomes can be replayed
+        self.rng = RngService(record=lambda message, **fields: self.logger.info(message, component="RNG", **fields))
+        # How long every command takes, for /command-stats
+        self.command_stats = CommandStats()
+        # Prometheus metrics on localhost, only served when started with --metrics-port=<port>
+        self.metrics_server: Optional[MetricsServer] = None
+        self.loop_lag = LoopLagMonitor()
+        # How long shutting down can take before the bot closes anyway, set with --shutdown-timeout=<seconds>
+        self.shutdown_timeout = SHUTDOWN_TIMEOUT
+        for arg in sys.argv:
+            if arg.startswith("--metrics-port="):
+                try:
+                    self.metrics_server = MetricsServer(self._collect_metrics, int(arg.split("=")[1]))
+                except ValueError:
+                    self.console.print(f"[red]Invalid metrics port '{arg.split('=')[1]}', metrics are disabled[/]")
+            elif arg.startswith("--shutdown-timeout="):
+                try:
+                    self.shutdown_timeout = float(arg.split("=")[1])
+                except ValueError:
+                    self.console.print(f"[red]Invalid shutdown timeout '{arg.split('=')[1]}', using "
+                                       f"{SHUTDOWN_TIMEOUT} seconds[/]")
+
+        # The running event loop, and the shutdown once it's started. Set while the bot is running
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._shutdown_task: Optional[asyncio.Task] = None
 
         self.roulette_bet_types: dict[str, str] = {
             "red": "Red",
@@ -125,24 +246,60 @@ class Pagget:
             "high": "19-36",
             "dozen1": "1-12",
             "dozen2": "13-24",
-            "dozen3": "25-36"
+            "dozen3": "25-36",
+            "column1": "1st Column",
+            "column2": "2nd Column",
+            "column3": "3rd Column",
+            "straight": "Straight Up",
+            "split": "Split",
+            "street": "Street",
+            "corner": "Corner",
+            "line": "Line"
         }
 
         # Configure Discord client
         intents = discord.Intents(messages=True, guilds=True, members=True)
         intents.message_content = True
-        self.client = discord.Client(intents=intents)
+        # Which members the client holds in memory, set with --member-cache=<all|lazy|none>. Only "all" fetches every
+        # member of every guild when the bot connects. Members that aren't held are found through self.members
+        member_cache = DEFAULT_MEMBER_CACHE
+        for arg in sys.argv:
+            if arg.startswith("--member-cache="):
+                if arg.split("=")[1] in MEMBER_CACHE_POLICIES:
+                    member_cache = arg.split("=")[1]
+                else:
+                    self.console.print(f"[red]Unknown member cache policy '{arg.split('=')[1]}', using "
+                                       f"'{DEFAULT_MEMBER_CACHE}'[/]")
+        cache_flags, chunk_at_startup = member_cache_flags(member_cache, intents)
+        client_options = {"intents": intents, "member_cache_flags": cache_flags,
+                          "chunk_guilds_at_startup": chunk_at_startup}
+        if self.shard_count is not None:
+            self.client = discord.AutoShardedClient(shard_count=self.shard_count, shard_ids=self.shard_ids,
+                                                    **client_options)
+        else:
+            self.client = discord.Client(**client_options)
+        self.members = MemberCache()
+        # Commands are global, so when there are several processes only the one running shard 0 syncs them
+        self.syncs_commands = self.shard_ids is None or 0 in self.shard_ids
         self.tree = app_commands.CommandTree(self.client)
-
-        # Clear any existing commands if we're syncing
-        if any(arg == "--sync" for arg in sys.argv):
-            self.tree.clear_commands(guild=None)
+        # The registered commands, hashed. Built once the bot is ready, and compared with the last sync's
+        self.command_manifest: Optional[CommandManifest] = None
+        # Set by the first on_ready, the ones after a reconnect don't do anything
+        self._ready = False
 
         if any(arg == "--no" for arg in sys.argv):
             return
         # Register commands and events
         self._register_commands()
         self._register_events()
+        self.startup.mark("set up bot")
+
+    @property
+    def console(self) -> "Console":
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
 
     def _register_commands(self):
         """Register all Discord slash commands."""
@@ -153,23 +310,14 @@ class Pagget:
                                chance="Percent chance of rolling afflictions (0-100)",
                                minor_chance="Percent chance of rolling minor afflictions (0-100)")
         @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
         async def set_configs(interaction: discord.Interaction, species: str = None, chance: int = None,
                               minor_chance: bool = None, starting_pay: int = None, minimum_bet: int = None):
             try:
-                guild_config: GuildConfig = self.data.get_guild_config(interaction.guild_id)
-
-                if species is not None:
-                    guild_config.species = species
-                if chance is not None:
-                    guild_config.chance = chance
-                if minor_chance is not None:
-                    guild_config.minor_chance = minor_chance
-                if starting_pay is not None:
-                    guild_config.starting_pay = starting_pay
-                if minimum_bet is not None:
-                    guild_config.minimum_bet = minimum_bet
-
-                self.data.set_guild_config(interaction.guild_id, guild_config)
+                # Only saved if something changed, so viewing the config doesn't write anything
+                guild_config: GuildConfig = self.data.update_guild_config(
+                    interaction.guild_id, species=species, chance=chance, minor_chance=minor_chance,
+                    starting_pay=starting_pay, minimum_bet=minimum_bet)
 
                 embed = discord.Embed(title=f"{interaction.guild.name}'s Configuration",
                                       description="Guild configuration has been updated.")
@@ -184,16 +332,68 @@ class Pagget:
                                 inline=False)
 
                 await interaction.response.send_message(f"Guild configuration updated.", embed=embed, ephemeral=True)
-                self.logger.log(f"{interaction.user.name} updated guild configuration for guild {interaction.guild_id}",
-                                "Bot")
+                self.logger.info("%s updated the guild configuration", interaction.user.name, component="Bot",
+                                 command="set-configs", guild=interaction.guild_id, user=interaction.user.id)
 
             except Exception as e:
-                self.logger.log(f"Error in set_configs: {e}", "Bot")
+                self.logger.error("Error in set_configs: %s", e, component="Bot", command="set-configs",
+                                  guild=interaction.guild_id, user=interaction.user.id)
                 await interaction.response.send_message("An error occurred while setting the guild configuration",
                                                         ephemeral=True)
 
         set_configs.error(self.command_error_handler)
 
+        @self.tree.command(name="house-edge", description="Shows the exact odds of the slot machine in this guild")
+        @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
+        async def house_edge(interaction: discord.Interaction):
+            minimum_bet = self.data.get_guild_config(interaction.guild_id).minimum_bet
+            # Working the odds out exactly is slow, so they're kept until the guild's config changes
+            version = self.data.config_version(interaction.guild_id)
+            cached = self.house_edges.get(interaction.guild_id)
+            if cached is None or cached[0] != version:
+                cached = self.house_edges[interaction.guild_id] = (version, *slot_reels.return_to_player(minimum_bet))
+            _, rtp, variance = cached
+
+            embed = discord.Embed(title=f"{interaction.guild.name}'s Slot Machine",
+                                  description=f"Exact odds at the minimum bet of {minimum_bet} berries.",
+                                  color=discord.Color.blue())
+            embed.add_field(name="Return to Player", value=f"{rtp:.2%}", inline=True)
+            embed.add_field(name="House Edge", value=f"{1 - rtp:.2%}", inline=True)
+            embed.add_field(name="Hit Frequency", value=f"{slot_reels.HIT_FREQUENCY:.2%}", inline=True)
+            embed.add_field(name="Standard Deviation", value=f"{variance ** 0.5:.2f} bets per spin", inline=False)
+            embed.set_footer(text="A negative house edge means players win berries over time.")
+
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        house_edge.error(self.command_error_handler)
+
+        @self.tree.command(name="command-stats", description="Shows how long the bot's commands are taking")
+        @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
+        async def command_stats(interaction: discord.Interaction):
+            stats = self.command_stats
+            embed = discord.Embed(title="Command Stats",
+                                  description=f"Times since the bot started, as p50 / p95 / p99. Discord gives up on "
+                                              f"a command that isn't acknowledged within {stats.ACK_DEADLINE:.0f} "
+                                              f"seconds.",
+                                  color=discord.Color.blue())
+
+            for command in stats.busiest():
+                ack, total = stats.percentiles(command)
+                value = (f"Calls: {stats.calls[command]}, errors: {stats.errors[command]}, "
+                         f"late: {stats.late_acks[command]}\n"
+                         f"Acknowledged: {' / '.join(f'{seconds * 1000:.0f}' for seconds in ack)} ms\n"
+                         f"Total: {' / '.join(f'{seconds * 1000:.0f}' for seconds in total)} ms")
+                embed.add_field(name=f"/{command}", value=value, inline=False)
+
+            if not stats.calls:
+                embed.add_field(name="No commands yet", value="Nothing has been run since the bot started.")
+
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        command_stats.error(self.command_error_handler)
+
         # Add affliction commands to the tree
         self.tree.add_command(self._register_affliction_commands())
 
@@ -207,7 +407,10 @@ class Pagget:
 
         async def roll(interaction: discord.Interaction, dino: str, chance: float, roll_type: str, season: str):
             afflictions = AfflictionController.roll(self.data.get_affliction_list(interaction.guild_id), chance,
-                                                    roll_type, season)
+                                                    roll_type, season,
+                                                    self.rng.stream("affliction", user=interaction.user.id,
+                                                                    guild=interaction.guild_id, chance=chance,
+                                                                    type=roll_type, season=season))
             dino = dino.capitalize()
 
             if not afflictions:
@@ -237,7 +440,8 @@ class Pagget:
                 app_commands.Choice(name="Minor", value="minor"),
                 app_commands.Choice(name="Birth Defect", value="birth"),
             ])
-        @app_commands.checks.cooldown(1, 3600, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @cooldown(self.data.cooldowns, "affliction roll", 3600)
+        @self.command_stats.timed
         async def roll_general(interaction: discord.Interaction, dino: str, roll_type: app_commands.Choice[str],
                                season: app_commands.Choice[str]):
             await roll(interaction, dino, self.data.get_guild_config(interaction.guild_id).chance, roll_type.value,
@@ -245,6 +449,7 @@ class Pagget:
 
         @group.command(name="list", description="Lists all available afflictions")
         @app_commands.describe(page="What page to display")
+        @self.command_stats.timed
         async def list_afflictions(interaction: discord.Interaction, page: int = 1):
             sorted_afflictions = AfflictionController.list_afflictions(
                 self.data.get_affliction_list(interaction.guild_id),
@@ -272,7 +477,8 @@ class Pagget:
 
             await interaction.response.send_message(f"**Available Afflictions:** (Page {page}/{pages})",
                                                     embeds=embeds)
-            self.logger.log(f"{interaction.user.name} listed all afflictions", "Bot")
+            self.logger.info("%s listed all afflictions", interaction.user.name, component="Bot",
+                             command="affliction list", guild=interaction.guild_id, user=interaction.user.id)
 
         @group.command(name="add", description="Adds a new affliction to the database")
         @app_commands.describe(name="Name of the affliction", description="Description of the affliction",
@@ -294,6 +500,7 @@ class Pagget:
             ]
         )
         @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
         async def add_affliction(interaction: discord.Interaction, name: str, description: str,
                                  rarity: app_commands.Choice[str], is_minor: bool = False,
                                  is_birth_defect: bool = False,
@@ -307,15 +514,18 @@ class Pagget:
                                         is_birth_defect=is_birth_defect,
                                         season=season.value if season.value != "any" else None)
             self.data.get_affliction_list(interaction.guild_id).append(new_affliction)
+            self.data.mark_dirty("afflictions.json", interaction.guild_id)
 
             await interaction.response.send_message(f"Affliction '{name}' added successfully.",
                                                     embed=AfflictionController.get_embed(new_affliction),
                                                     ephemeral=True)
-            self.logger.log(f"{interaction.user.name} added affliction {name}", "Bot")
+            self.logger.info("%s added affliction %s", interaction.user.name, name, component="Bot",
+                             command="affliction add", guild=interaction.guild_id, user=interaction.user.id)
 
         @group.command(name="remove", description="Removes an affliction from the list")
         @app_commands.describe(name="Name of the affliction")
         @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
         async def remove_affliction(interaction: discord.Interaction, name: str):
             # Check if the affliction does not exist
             if not self._if_affliction_exists(name, interaction.guild_id):
@@ -324,13 +534,15 @@ class Pagget:
 
             affliction_to_remove = self._get_affliction_from_name(name, interaction.guild_id)[0]
             self.data.get_affliction_list(interaction.guild_id).remove(affliction_to_remove)
+            self.data.mark_dirty("afflictions.json", interaction.guild_id)
 
             embed = AfflictionController.get_embed(affliction_to_remove)
             embed.set_footer(text="Affliction removed")
 
             await interaction.response.send_message(f"Affliction '{name}' removed successfully.", embed=embed,
                                                     ephemeral=True)
-            self.logger.log(f"{interaction.user.name} removed affliction {name}", "Bot")
+            self.logger.info("%s removed affliction %s", interaction.user.name, name, component="Bot",
+                             command="affliction remove", guild=interaction.guild_id, user=interaction.user.id)
 
         @group.command(name="edit", description="Edits an affliction from the list")
         @app_commands.describe(affliction="Current name of the affliction",
@@ -354,6 +566,7 @@ class Pagget:
             ]
         )
         @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
         async def edit_affliction(interaction: discord.Interaction, affliction: str, name: str = None,
                                   description: str = None, rarity: app_commands.Choice[str] = None,
                                   is_minor: bool = False, is_birth_defect: bool = False,
@@ -386,11 +599,13 @@ class Pagget:
                 affliction_to_edit.season = season
 
             self.data.get_affliction_list(interaction.guild_id)[index] = affliction_to_edit
+            self.data.mark_dirty("afflictions.json", interaction.guild_id)
 
             await interaction.response.send_message(f"Affliction '{affliction}' edited successfully.",
                                                     embed=AfflictionController.get_embed(affliction_to_edit),
                                                     ephemeral=True)
-            self.logger.log(f"{interaction.user.name} edited affliction {affliction}", "Bot")
+            self.logger.info("%s edited affliction %s", interaction.user.name, affliction, component="Bot",
+                             command="affliction edit", guild=interaction.guild_id, user=interaction.user.id)
 
         # --- Handling Errors --- #
         # roll_general.error(self.command_error_handler)
@@ -433,9 +648,9 @@ class Pagget:
                     actual_steal_amount = outcome.value
                 target_new_balance = target_balance - actual_steal_amount
 
-                print(
-                    f"Target balance: {target_balance}, Attempted steal: {outcome.value}, Actual steal: {actual_steal_amount}")
-                print(f"Target new balance: {target_new_balance}")
+                log.debug("Steal worked out", command="berries steal", guild=interaction.guild_id,
+                          user=interaction.user.id, target=target.id, target_balance=target_balance,
+                          attempted=outcome.value, stolen=actual_steal_amount, target_new_balance=target_new_balance)
 
                 # Update the outcome value to reflect what was actually stolen
                 outcome.value = actual_steal_amount
@@ -452,18 +667,21 @@ class Pagget:
                 ephemeral=False)
 
         @berries_group.command(name="hunt", description="Hunt for some berries")
-        @app_commands.checks.cooldown(1, 43200, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @cooldown(self.data.cooldowns, "berries hunt", 43200)
+        @self.command_stats.timed
         async def hunt(interaction: discord.Interaction):
             await gather(interaction, "hunt", None)
 
         @berries_group.command(name="steal", description="Attempt to steal berries from the herd")
         @app_commands.describe(target="User to steal from")
-        @app_commands.checks.cooldown(1, 43200, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @cooldown(self.data.cooldowns, "berries steal", 43200)
+        @self.command_stats.timed
         async def steal(interaction: discord.Interaction, target: discord.Member):
             await gather(interaction, "steal", target)
 
         @berries_group.command(name="balance", description="Check your berry balance")
         @app_commands.checks.cooldown(5, 120, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @self.command_stats.timed
         async def balance(interaction: discord.Interaction):
             # Retrieve user's current balance
             current_balance = self._validate_user(interaction.user.id, interaction.guild_id)
@@ -479,6 +697,7 @@ class Pagget:
         @berries_group.command(name="gift", description="Gift berries to another user")
         @app_commands.describe(user="User to gift berries to", amount="Amount of berries to gift")
         @app_commands.checks.cooldown(5, 60, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @self.command_stats.timed
         async def gift_berries(interaction: discord.Interaction, user: discord.Member, amount: int):
             # Initialize user
             self._validate_user(user.id, interaction.guild_id)
@@ -508,6 +727,7 @@ class Pagget:
         @berries_group.command(name="set", description="Set the balance of a user")
         @app_commands.describe(user="User to edit balance", new_balance="New balance")
         @app_commands.checks.has_permissions(administrator=True)
+        @self.command_stats.timed
         async def set_berries(interaction: discord.Interaction, user: discord.Member, new_balance: int):
             # Initialize user
             self._validate_user(user.id, interaction.guild_id)
@@ -521,30 +741,40 @@ class Pagget:
         @berries_group.command(name="leaderboard", description="Show the leaderboard of who has the most berries")
         @app_commands.describe(count="The amount of leaderboard slots shown. use a number less than 0 to show all rankings")
         @app_commands.checks.cooldown(5, 60, key=lambda i: i.user.id)
+        @self.command_stats.timed
         async def leaderboard(interaction: discord.Interaction, count: int = 10):
             embed = discord.Embed(title="=== Berries Leaderboard ===", description="", color=discord.Color.blue())
+            # Members that aren't cached have to be asked for, which can take longer than Discord waits for a reply
+            await interaction.response.defer()
 
-            sorted_berries = dict(sorted(self.data.balances.items(), key=lambda x: x[1], reverse=True))
+            sorted_berries = sorted(self.data.balances.items(), key=lambda x: x[1], reverse=True)
             
             if count < 0:
                 count = len(sorted_berries)
 
             i = 0
-            for key, value in sorted_berries.items():
+            # Members are looked up a batch at a time, only as far down the balances as the leaderboard reaches
+            for start in range(0, len(sorted_berries), MemberCache.QUERY_LIMIT):
                 if i >= count:
                     break
+                batch = sorted_berries[start:start + MemberCache.QUERY_LIMIT]
+                members = await self.members.resolve(interaction.guild, [key for key, _ in batch])
+
+                for key, value in batch:
+                    if i >= count:
+                        break
 
-                # Checking if member is in the guild
-                member = interaction.guild.get_member(key)
-                if not member:
-                    continue
-                elif member.name == "pagget":
-                    continue
-
-                embed.description += f"{i + 1}: {":crown:" if i == 0 else ""} {member.display_name.split(" |")[0]} {value}\n"
-                # Increase iteration counter
-                i += 1
-            await interaction.response.send_message(embed=embed)
+                    # Checking if member is in the guild
+                    member = members.get(key)
+                    if not member:
+                        continue
+                    elif member.name == "pagget":
+                        continue
+
+                    embed.description += f"{i + 1}: {":crown:" if i == 0 else ""} {member.display_name.split(" |")[0]} {value}\n"
+                    # Increase iteration counter
+                    i += 1
+            await interaction.followup.send(embed=embed)
           
         # Handling errors
         hunt.error(self.command_error_handler)
@@ -561,72 +791,102 @@ class Pagget:
         gambling_group = app_commands.Group(name="gambling", description="Gambling commands")
 
         @gambling_group.command(name="roulette", description="Play roulette with your berries")
-        @app_commands.describe(bet="Amount of berries to bet")
+        @app_commands.describe(bet="Amount of berries to bet",
+                               numbers="The numbers to bet on, for straight up, split, street, corner and line bets")
         @app_commands.choices(
             bet_type=[
                 app_commands.Choice(name=name, value=value) for value, name in self.roulette_bet_types.items()
             ]
         )
         @app_commands.checks.cooldown(1, 10, key=lambda i: i.user.id)  # Uncomment to enable cooldown
-        async def roulette(interaction: discord.Interaction, bet: int, bet_type: str):
+        @self.command_stats.timed
+        async def roulette(interaction: discord.Interaction, bet: int, bet_type: str, numbers: str = None):
+            guild_config = self.data.get_guild_config(interaction.guild_id)
+            bet_key = roulette_wheel.parse_bet(bet_type, numbers)
+            if bet_key is None:
+                await interaction.response.send_message(
+                    f"*{numbers}* isn't a {self.roulette_bet_types[bet_type]} bet you can place. Give the numbers you want to bet on, like `17 18`.",
+                    ephemeral=True)
+                return
             if bet > self._validate_user(interaction.user.id, interaction.guild_id):
                 await interaction.response.send_message(
                     f"You don't have enough berries to bet that much.\n-# Your balance: {self._validate_user(interaction.user.id, interaction.guild_id)}.",
                     ephemeral=True)
                 return
-            if self.data.get_guild_config(interaction.guild_id).minimum_bet > bet:
+            if bet < max(1, guild_config.minimum_bet):
                 await interaction.response.send_message(
-                    f"You bet *{bet}*, but the minimum bet is **{self.data.get_guild_config(interaction.guild_id).minimum_bet}**.")
+                    f"You bet *{bet}*, but the minimum bet is **{max(1, guild_config.minimum_bet)}**.")
                 return
 
-            balance = self.data.get_user_balance(interaction.user.id)
-
-            self.data.set_user_balance(interaction.user.id, balance - bet)
+            session = await self._open_session(interaction, "roulette", bet)
+            if session is None:
+                return
 
-            game = Roulette(interaction.user, bet, bet_type, self.roulette_bet_types, self.data,
+            game = Roulette(interaction.user, bet, bet_key, self.roulette_bet_types, self.data,
                             self._validate_user,
-                            self.data.get_guild_config(interaction.guild_id).minimum_bet)
+                            guild_config.minimum_bet, self.message_updater,
+                            self.game_clock, self.sessions, session,
+                            self.rng.stream("roulette", session=session.id, guild=interaction.guild_id))
             await game.run(interaction)
 
         @gambling_group.command(name="slots", description="Play slots with your berries")
         @app_commands.describe(bet="Amount of berries to bet")
         @app_commands.checks.cooldown(1, 10, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @self.command_stats.timed
         async def slots(interaction: discord.Interaction, bet: int):
+            guild_config = self.data.get_guild_config(interaction.guild_id)
             if bet > self._validate_user(interaction.user.id, interaction.guild_id):
                 await interaction.response.send_message(
                     f"You don't have enough berries to bet that much.\n-# Your balance: {self._validate_user(interaction.user.id, interaction.guild_id)}.",
                     ephemeral=True)
                 return
-            if self.data.get_guild_config(interaction.guild_id).minimum_bet > bet:
+            if bet < max(1, guild_config.minimum_bet):
                 await interaction.response.send_message(
-                    f"You bet *{bet}*, but the minimum bet is **{self.data.get_guild_config(interaction.guild_id).minimum_bet}**.",
+                    f"You bet *{bet}*, but the minimum bet is **{max(1, guild_config.minimum_bet)}**.",
                     ephemeral=True)
                 return
 
+            try:
+                # Slots holds each spin's bet itself, so the session starts out empty
+                session = self.sessions.open("slots", interaction.user.id, interaction.guild_id)
+            except SessionLimitReached as e:
+                await interaction.response.send_message(str(e), ephemeral=True)
+                return
+
             game = Slots(interaction.user, bet, self.data,
-                         self.data.get_guild_config(interaction.guild_id).minimum_bet)
+                         guild_config.minimum_bet, self.message_updater,
+                         self.sessions, session,
+                         self.rng.stream("slots", session=session.id, user=interaction.user.id))
             await game.run(interaction)
 
         @gambling_group.command(name="blackjack", description="Play blackjack with your berries")
         @app_commands.describe(bet="Amount of berries to bet")
         @app_commands.checks.cooldown(1, 10, key=lambda i: i.user.id)  # Uncomment to enable cooldown
+        @self.command_stats.timed
         async def blackjack(interaction: discord.Interaction, bet: int):
+            guild_config = self.data.get_guild_config(interaction.guild_id)
             # If the minimum bet is greater than the bet, or the bet is greater than the user's balance, return an error
             if bet > self._validate_user(interaction.user.id, interaction.guild_id):
                 await interaction.response.send_message(
                     f"You don't have enough berries to bet that much.\n-# Your balance: {self._validate_user(interaction.user.id, interaction.guild_id)}.",
                     ephemeral=True)
                 return
-            if self.data.get_guild_config(interaction.guild_id).minimum_bet > bet:
+            if bet < max(1, guild_config.minimum_bet):
                 await interaction.response.send_message(
-                    f"You bet *{bet}*, but the minimum bet is **{self.data.get_guild_config(interaction.guild_id).minimum_bet}**.",
+                    f"You bet *{bet}*, but the minimum bet is **{max(1, guild_config.minimum_bet)}**.",
                     ephemeral=True)
                 return
 
-            user_balance = self.data.get_user_balance(interaction.user.id)
-            self.data.set_user_balance(interaction.user.id, user_balance - bet)
+            session = await self._open_session(interaction, "blackjack", bet)
+            if session is None:
+                return
 
-            game = Blackjack(interaction.user, bet, self.data.balances)
+            if interaction.guild_id not in self.blackjack_shoes:
+                self.blackjack_shoes[interaction.guild_id] = Shoe(
+                    streams=lambda guild_id=interaction.guild_id: self.rng.stream("shoe", guild=guild_id))
+
+            game = Blackjack(interaction.user, bet, self.data, self.message_updater, self.sessions, session, self.rng,
+                             self.blackjack_shoes[interaction.guild_id])
             await game.run(interaction)
 
         @roulette.error
@@ -651,43 +911,42 @@ class Pagget:
 
         @self.client.event
         async def on_ready():
-            # Clear all commands and re-sync
+            if self._ready:
+                # on_ready fires again after every reconnect. The data is already loaded and everything below only
+                # needs doing once, so the data in memory is kept as it is
+                self.logger.info("Reconnected to the gateway", component="Bot")
+                return
+            self._ready = True
+            self.startup.mark("connect to gateway")
 
             self.console.clear()
             self.console.rule(f"[bold]{self.client.user.name}[/]")  # Added bold for emphasis
 
             self.console.print(f"Bot activated as {self.client.user}")
-            self.logger.log(f"{self.client.user.name} has logged in as {self.client.user}", "Bot")
+            self.logger.info(f"{self.client.user.name} has logged in as {self.client.user}", component="Bot")
 
             self.console.print("\nConnected Guilds:")
-            self.logger.log(f"{self.client.user.name} connected to {len(self.client.guilds)} guilds:", "Bot")
+            self.logger.info(f"{self.client.user.name} connected to {len(self.client.guilds)} guilds:",
+                             component="Bot")
 
             for guild in self.client.guilds:
                 member_str = f"{guild.member_count} member{'s' if guild.member_count > 1 else ''}"
                 self.console.print(f"  • [green]{guild.name}[/] ({guild.id}) - {member_str}")
-                self.logger.log(f"    * Guild: {guild.name} ({guild.id}) {member_str}", "Bot")
-
-            # If syncing is enabled, sync the command tree
-            # NOTE: Using 'bot.tree' in the guild sync section, ensure 'bot' is defined or use 'self.tree' consistently
-            if any(arg == "--sync" for arg in sys.argv):
-                self.console.print("\n[green]Syncing command tree globally...[/]")
-                self.logger.log("Syncing command tree globally...", "Bot")
-                self.console.print("[yellow]Warning: Avoid syncing commands too often to avoid rate limits...[/]")
-                self.console.print("[yellow]Warning: Syncing commands may take a while...[/]")
-                try:
-                    await self.tree.sync()
-                    self.console.print("[green]Command tree synced globally[/]")
-                    self.logger.log("Command tree synced globally", "Bot")
-                except Exception as e:
-                    self.console.print(f"[red]Error syncing command tree globally: {e}[/]")
-                    self.logger.log(f"Error syncing command tree globally: {e}", "BotError")
+                self.logger.info(f"    * Guild: {guild.name} ({guild.id}) {member_str}", component="Bot",
+                                 guild=guild.id)
 
+            # Sync the commands with Discord if they changed since the last sync
+            self.command_manifest = CommandManifest.from_tree(self.tree)
+            if self.syncs_commands:
+                await self._sync_commands(self.command_manifest)
+            else:
+                self.logger.info("Commands are synced by the process running shard 0", component="Bot")
 
-            elif any(arg == "--sync-guild" for arg in sys.argv):
+            if any(arg == "--sync-guild" for arg in sys.argv):
                 self.console.print("\nPlease select a guild to sync the command tree with:")
                 if not self.client.guilds:
                     self.console.print("[yellow]Bot is not in any guilds to sync with.[/]")
-                    self.logger.log("Sync-guild attempted but bot is not in any guilds.", "Bot")
+                    self.logger.info("Sync-guild attempted but bot is not in any guilds.", component="Bot")
                 else:
                     for i, guild in enumerate(self.client.guilds):
                         self.console.print(
@@ -698,276 +957,257 @@ class Pagget:
                         guild_index = int(guild_choice) - 1
                         if guild_choice == '0':
                             self.console.print("[yellow]Syncing cancelled.[/]")
-                            self.logger.log("Guild sync cancelled by user.", "Bot")
+                            self.logger.info("Guild sync cancelled by user.", component="Bot")
                         elif 0 <= guild_index < len(self.client.guilds):
                             guild = self.client.guilds[guild_index]
                             self.console.print(f"\n[green]Syncing command tree with {guild.name} ({guild.id})...[/]")
-                            self.logger.log(f"Syncing command tree with guild: {guild.name} ({guild.id})", "Bot")
+                            self.logger.info(f"Syncing command tree with guild: {guild.name} ({guild.id})",
+                                             component="Bot", guild=guild.id)
                             self.console.print(
                                 "[yellow]Clearing existing commands in guild and copying global commands...[/]")
 
-                            # Ensure using self.tree consistently
-                            self.tree.clear_commands(guild=guild)
-                            self.tree.copy_global_to(guild=guild)
-                            await self.tree.sync(guild=guild)
+                            await self._sync_guild(guild)
+                            self.command_manifest.guilds[guild.id] = self.command_manifest.tree_hash
+                            self.command_manifest.save()
 
                             self.console.print(f"[green]Command tree synced with {guild.name} ({guild.id})[/]")
-                            self.logger.log(f"Command tree synced with guild: {guild.name} ({guild.id})", "Bot")
+                            self.logger.info(f"Command tree synced with guild: {guild.name} ({guild.id})",
+                                             component="Bot", guild=guild.id)
                         else:
                             self.console.print("[red]Invalid guild number. Syncing aborted.[/]")
-                            self.logger.log("Invalid guild number provided for sync. Syncing aborted.", "Bot")
+                            self.logger.warning("Invalid guild number provided for sync. Syncing aborted.",
+                                                component="Bot")
                     except ValueError:
                         self.console.print("[red]Invalid input. Please enter a number. Syncing aborted.[/]")
-                        self.logger.log("Non-numeric input for guild sync selection. Syncing aborted.", "Bot")
+                        self.logger.warning("Non-numeric input for guild sync selection. Syncing aborted.",
+                                            component="Bot")
                     except Exception as e:
                         self.console.print(f"[red]Error syncing command tree with guild: {e}[/]")
-                        self.logger.log(f"Error syncing command tree with guild: {e}", "BotError")
+                        self.logger.error(f"Error syncing command tree with guild: {e}", component="Bot")
 
             self.console.print("\n[bold underline]Registered Commands:[/]")
-            self.logger.log("Registered Commands:", "Bot")
-
-            # Separate top-level groups and standalone commands
-            groups = {}
-            standalone_commands = []
+            self.logger.info("Registered Commands:", component="Bot")
 
-            # Initial categorization of top-level commands
-            for command in self.tree.get_commands():
-                if isinstance(command, app_commands.Group):
-                    groups[command.name] = command
-                else:
-                    standalone_commands.append(command)
+            # The report comes from the manifest, which already knows each command's description and admin check
+            groups = [entry for entry in self.command_manifest.entries if "commands" in entry]
+            standalone_commands = [entry for entry in self.command_manifest.entries if "commands" not in entry]
 
             # Print command groups (top-level)
             if groups:
                 self.console.print("\n[green bold]Command Groups:[/]")
-                for group_name, group in sorted(groups.items()):  # Sort top-level groups
-                    try:
-                        # Assuming has_admin_check is defined elsewhere and accessible
-                        is_admin_group = has_admin_check(group)
-                    except NameError:
-                        self.logger.log(
-                            f"Warning: has_admin_check function not found for group '{group_name}'. Assuming USER.",
-                            "Bot")
-                        is_admin_group = False
-
-                    admin_status_group = "[purple]ADMIN[/]" if is_admin_group else "[green]USER[/]"
-                    self.console.print(f"  [bold]/{group.name}[/] {admin_status_group} - {group.description}")
-                    self.logger.log(f"  Group: /{group.name} {admin_status_group} - {group.description}",
-                                    "Bot")  # Added status to log
+                for group in groups:
+                    admin_status_group = "[purple]ADMIN[/]" if group["admin"] else "[green]USER[/]"
+                    self.console.print(f"  [bold]/{group['name']}[/] {admin_status_group} - {group['description']}")
+                    self.logger.info(f"  Group: /{group['name']} {admin_status_group} - {group['description']}",
+                                     component="Bot")  # Added status to log
 
                     # Sets the initial indentation and path for items under this top-level group.
-                    initial_sub_item_indent = "    "
-                    sorted_sub_items = sorted(group.commands, key=lambda c: c.name)  # Sort sub-items
-                    for sub_item in sorted_sub_items:
+                    for sub_item in group["commands"]:
                         # Pass the group's name as the initial part of the path
-                        self._print_command_item_recursive(sub_item, initial_sub_item_indent, [group.name])
+                        self._print_command_item_recursive(sub_item, "    ", [group["name"]])
 
             if standalone_commands:
                 self.console.print("\n[green bold]Standalone Commands:[/]")
-                for command in sorted(standalone_commands, key=lambda x: x.name):  # Sort standalone commands
-                    try:
-                        is_admin_cmd = has_admin_check(command)
-                    except NameError:
-                        self.logger.log(
-                            f"Warning: has_admin_check function not found for command '{command.name}'. Assuming USER.",
-                            "Bot")
-                        is_admin_cmd = False
-
-                    admin_status_cmd = "[purple]ADMIN[/]" if is_admin_cmd else "[green]USER[/]"
-                    self.console.print(f"  [bold]/{command.name}[/] {admin_status_cmd} - {command.description}")
-                    self.logger.log(f"  Command: /{command.name} {admin_status_cmd} - {command.description}",
-                                    "Bot")  # Added status to log
+                for command in standalone_commands:
+                    admin_status_cmd = "[purple]ADMIN[/]" if command["admin"] else "[green]USER[/]"
+                    self.console.print(f"  [bold]/{command['name']}[/] {admin_status_cmd} - {command['description']}")
+                    self.logger.info(f"  Command: /{command['name']} {admin_status_cmd} - {command['description']}",
+                                     component="Bot")  # Added status to log
 
             if not groups and not standalone_commands:
                 self.console.print("  [yellow]No application commands found or registered.[/]")
-                self.logger.log("No application commands found or registered.", "Bot")
+                self.logger.info("No application commands found or registered.", component="Bot")
+
+            self.startup.mark("sync and list commands")
 
-            # Load data and start autosaving
-            self.data.load()
-            self.data.start_autosave_thread()
+            # Serve the metrics, if they're enabled
+            if self.metrics_server is not None:
+                try:
+                    await self.metrics_server.start()
+                    self.loop_lag.start()
+                    self.logger.info("Serving metrics on http://%s:%d/metrics", self.metrics_server.host,
+                                     self.metrics_server.port, component="Bot")
+                except OSError as e:
+                    self.console.print(f"[red]Couldn't serve metrics on port {self.metrics_server.port}: {e}[/]")
+                    self.logger.error("Couldn't serve metrics: %s", e, component="Bot",
+                                      port=self.metrics_server.port)
 
             # Final ready message
             self.console.print("\n[bold green]Bot is ready and online![/]")
-            self.logger.log("Bot is ready and online!", "Bot")
+            self.startup.mark("finish getting ready")
+            profile = self.startup.finish()
+            self.logger.info("Bot is ready and online!", component="Bot", startup=round(self.startup.total, 3))
+            if any(arg == "--profile-startup" for arg in sys.argv):
+                self.console.print("\n[bold underline]Startup Profile:[/]")
+                self.console.print("\n".join(profile), highlight=False)
 
         @self.client.event
-        async def on_message(message: discord.Message):
-            favored_ones = [767047725333086209, 953401260306989118, 757757494192767017]
+        async def on_member_remove(member: discord.Member):
+            self.members.forget(member.guild.id, member.id)
 
-            love_message_flags = [
-                "thx",
-                "thanks",
-                "thank",
-                "love"
-            ]
-            love_responses = [
-                ":heart:",
-                "Anything for you pookie :para_love:",
-                "Your welcome!",
-                "You too\n-# Shoot, wrong thing :para_sweat:",
-                "<a:para_dance:1349156824439324732>",
-                "<:para_sparkle:1349157954603061299>",
-                "<:para_cool:1349156483564310629>"
-            ]
-
-            hate_message_flags = [
-                "suck",
-                "die",
-                "bozo",
-                "loser",
-                "stupid",
-                "hate"
-            ]
-            hate_responses = [
-                ":sob:",
-                "<:para_sweat:1349157654433370174>",
-                "<:para_sob:1349156486529421352>",
-                "<:para_angy:1349156485044895774>",
-                "<:para_tears:1349156487976587304>"
-            ]
-
-            bless_responses = [
-                "{name}, I bless you with {blessing} berries... and stuff :/",
-                "-# psst {name} I am giving you {blessing} out of the goodness of my heart, they dont really control me :wink:",
-                "The skies open above {name} and rains berries. {name} picks up {blessing}.",
-                "Hey {name}, catch!\n-# {blessing} berries fly towards {name}"
-            ]
+        @self.client.event
+        async def on_member_update(before: discord.Member, after: discord.Member):
+            self.members.forget(after.guild.id, after.id)
 
+        @self.client.event
+        async def on_message(message: discord.Message):
             if message.author == self.client.user:
                 return
 
             # Handle messages here if needed
-            if (any(mention.id == self.client.user.id for mention in message.mentions) and
-                    message.content.startswith("-#")):
+            if message.content.startswith("-#") and any(mention.id == self.client.user.id
+                                                        for mention in message.mentions):
                 await message.channel.send("-# What was that? I couldn't hear you.")
 
             # Only listen to the favored ones 😇
-            if message.author.id in favored_ones:
-                split_message = message.content.split(" ")
-                if "berries pls" in message.content.lower():
-                    if random.random() < 0.5:
-                        amount = random.randint(1, 1000)
-                        self.data.balances[message.author.id] = + amount
-                        await message.channel.send(f"Ok poor boy, I'll give you *{amount}* berries")
-                    else:
-                        await message.channel.send(f"Bro, stop being such a whiner. Just work :skull:")
-
-                for index, word in enumerate(split_message):
-                    if (word == "bless" and
-                            index + 2 < len(split_message) and
-                            split_message[index + 1].strip() and
-                            split_message[index + 2] == "with"):
-
-                        blessed_one: int = 0
-
-                        try:
-                            # Striping the users id out of the mention
-                            blessed_one = int(split_message[index + 1].translate(str.maketrans('', '', '<>@!')))
-                            if blessed_one == message.author.id:
-                                await message.channel.send(
-                                    f"What on earth are you trying to do? Blessing your self?? smh")
-                                break
-                            if blessed_one == self.client.user.id:
-                                await message.channel.send(
-                                    "I really love that you are trying to bless me, it really is nice... but I dont need them.")
-                                break
-
-                        except ValueError:
-                            print("Invalid mention")
-                            break
-
-                        if self._get_user_from_id(blessed_one, message.guild) is None:
-                            print("Mentioned non existent user.")
-
-                        blessing = split_message[index + 3]
-
-                        try:
-                            blessing = int(blessing)
-
-                            self._validate_user(blessed_one, message.guild.id)
-                            self.data.balances[blessed_one] += blessing
-
-                            await message.channel.send(random.choice(bless_responses).format(
-                                name=self._name_from_user(self._get_user_from_id(blessed_one, message.guild)),
-                                blessing=blessing))
-                        except ValueError:
-                            await message.channel.send(
-                                f"{self._name_from_user(self._get_user_from_id(blessed_one, message.guild))}, I bless you with {blessing}")
-
-                # Helpful for seeing how many berries people have
-                if "list berries" in message.content.lower():
-                    channel = message.channel
-                    send = ""
-                    for key in self.data.balances.keys():
-                        for user in message.guild.members:
-                            if user.id == key:
-                                send += f"{user.display_name.split(" |")[0]} has {self.data.balances[key]} berries\n"
-                    await channel.send(send)
-
-                for mean_word in hate_message_flags:
-                    if mean_word in message.content.lower() and "pagget" in message.content.lower():
-                        channel = message.channel
-                        await channel.send(random.choice(hate_responses))
-                        break
+            if message.author.id not in FAVORED_ONES:
+                return
 
-                for mean_word in love_message_flags:
-                    if mean_word in message.content.lower() and "pagget" in message.content.lower():
-                        channel = message.channel
-                        await channel.send(random.choice(love_responses))
+            found = triggers.scan(message.content)
+            if found.begging:
+                if random.random() < 0.5:
+                    amount = random.randint(1, 1000)
+                    self.data.set_user_balance(message.author.id, amount)
+                    await message.channel.send(f"Ok poor boy, I'll give you *{amount}* berries")
+                else:
+                    await message.channel.send(f"Bro, stop being such a whiner. Just work :skull:")
+
+            for mention, blessing in found.blessings:
+                blessed_one: int = 0
+
+                try:
+                    # Striping the users id out of the mention
+                    blessed_one = int(mention.translate(str.maketrans('', '', '<>@!')))
+                    if blessed_one == message.author.id:
+                        await message.channel.send(
+                            f"What on earth are you trying to do? Blessing your self?? smh")
                         break
+                    if blessed_one == self.client.user.id:
+                        await message.channel.send(
+                            "I really love that you are trying to bless me, it really is nice... but I dont need them.")
+                        break
+
+                except ValueError:
+                    log.debug("Invalid mention in a blessing", guild=message.guild.id, user=message.author.id)
+                    break
+
+                blessed_member = await self.members.fetch(message.guild, blessed_one)
+                if blessed_member is None:
+                    log.debug("Blessing mentioned a user that isn't in the guild", guild=message.guild.id,
+                              user=message.author.id, mentioned=blessed_one)
+                blessed_name = self._name_from_user(blessed_member) if blessed_member is not None else mention
+
+                try:
+                    blessing = int(blessing)
+
+                    self._validate_user(blessed_one, message.guild.id)
+                    self.data.add_user_balances({blessed_one: blessing})
+
+                    await message.channel.send(random.choice(BLESS_RESPONSES).format(
+                        name=blessed_name, blessing=blessing))
+                except ValueError:
+                    await message.channel.send(f"{blessed_name}, I bless you with {blessing}")
+
+            # Helpful for seeing how many berries people have
+            if found.list_berries:
+                channel = message.channel
+                lines = []
+                balances = list(self.data.balances.items())
+                members = await self.members.resolve(message.guild, [user_id for user_id, _ in balances])
+                for user_id, balance in balances:
+                    member = members.get(user_id)
+                    if member is not None:
+                        lines.append(f"{self._name_from_user(member)} has {balance} berries")
+
+                for chunk in chunk_lines(lines):
+                    await channel.send(chunk)
+
+            if found.pagget and found.hate:
+                await message.channel.send(random.choice(HATE_RESPONSES))
+
+            if found.pagget and found.love:
+                await message.channel.send(random.choice(LOVE_RESPONSES))
 
     @staticmethod
     def _name_from_user(user: discord.User | discord.Member) -> str:
         return user.display_name.split(" |")[0]
 
-    @staticmethod
-    def _get_user_from_id(user_id: int, guild: discord.Guild) -> Optional[discord.Member]:
-        for member in guild.members:
-            print(member.display_name, ":", member.id)
-            if member.id == user_id:
-                return member
-
-        return None
-
-    def _print_command_item_recursive(self, command_item, base_indent_str, parent_group_path_parts_for_log):
+    def _print_command_item_recursive(self, entry: dict, base_indent_str: str,
+                                      parent_group_path_parts_for_log: List[str]):
         """
-        Recursively prints a command item (command or group) and its children if it's a group.
+        Recursively prints a command's manifest entry, and the entries under it if it's a group.
         This is the core logic for handling nested groups.
         """
         prefix = "• "
 
-        current_full_path_parts = parent_group_path_parts_for_log + [command_item.name]
+        current_full_path_parts = parent_group_path_parts_for_log + [entry["name"]]
         log_full_path = " ".join(current_full_path_parts)
 
-        # Determine if the command requires admin privileges (ensure has_admin_check is accessible)
-        try:
-            # Assuming has_admin_check is defined elsewhere and accessible
-            is_admin = has_admin_check(command_item)
-        except NameError:
-            # Fallback or default if it has_admin_check is not found - adjust as needed
-            self.logger.log(
-                f"Warning: has_admin_check function not found for command '{log_full_path}'. Assuming USER.", "Bot")
-            is_admin = False
-
-        admin_status = "[purple]ADMIN[/]" if is_admin else "[green]USER[/]"
-        description = getattr(command_item, 'description', 'No description available')
+        admin_status = "[purple]ADMIN[/]" if entry["admin"] else "[green]USER[/]"
+        description = entry["description"] or "No description available"
 
         self.console.print(
-            f"{base_indent_str}{prefix}[bold]{command_item.name}[/] {admin_status} - {description}"
+            f"{base_indent_str}{prefix}[bold]{entry['name']}[/] {admin_status} - {description}"
         )
 
-        item_type_for_log = "Sub-Group" if isinstance(command_item, app_commands.Group) else "Subcommand"
-        self.logger.log(
+        item_type_for_log = "Sub-Group" if "commands" in entry else "Subcommand"
+        self.logger.info(
             f"{base_indent_str}{prefix}{item_type_for_log}: /{log_full_path} {admin_status} - {description}",
-            "Bot"
+            component="Bot"
         )
 
-        if isinstance(command_item, app_commands.Group):
-            child_base_indent_str = base_indent_str + "  "
+        for sub_entry in entry.get("commands", []):
+            self._print_command_item_recursive(sub_entry, base_indent_str + "  ", current_full_path_parts)
 
-            sorted_sub_items = sorted(command_item.commands, key=lambda c: c.name)
-            for sub_item in sorted_sub_items:
-                self._print_command_item_recursive(sub_item, child_base_indent_str, current_full_path_parts)
+    async def _sync_commands(self, manifest: CommandManifest):
+        """
+        Syncs the command tree with Discord, but only the parts that changed since the last sync: the global commands
+        if the tree's hash is different, and each guild given a copy of them with --sync-guild that was synced with
+        an older tree. --sync syncs the global commands even if nothing changed.
+        """
+        synced = CommandManifest.load()
+        manifest.guilds = dict(synced.guilds) if synced is not None else {}
+        forced = any(arg == "--sync" for arg in sys.argv)
+
+        if forced or synced is None or synced.tree_hash != manifest.tree_hash:
+            added, changed, removed = manifest.diff(synced)
+            self.console.print("\n[green]Syncing command tree globally...[/]")
+            self.logger.info("Syncing command tree globally", component="Bot", added=added, changed=changed,
+                             removed=removed, forced=forced)
+            try:
+                await self.tree.sync()
+            except Exception as e:
+                # Not only HTTP errors, a missing application ID and the like too. Anything raised here would escape
+                # on_ready. The manifest isn't saved, so the next start tries again
+                self.console.print(f"[red]Error syncing command tree globally: {e}[/]")
+                self.logger.error("Error syncing command tree globally: %s", e, component="Bot")
+                return
+            self.console.print("[green]Command tree synced globally[/]")
+            self.logger.info("Command tree synced globally", component="Bot")
+        else:
+            self.logger.info("Commands unchanged since the last sync, not syncing", component="Bot")
+
+        for guild_id in manifest.stale_guilds():
+            guild = self.client.get_guild(guild_id)
+            if guild is None:
+                # The bot has left the guild, its commands went with it
+                manifest.guilds.pop(guild_id)
+                continue
+            try:
+                await self._sync_guild(guild)
+                manifest.guilds[guild_id] = manifest.tree_hash
+                self.logger.info("Command tree synced with guild: %s", guild.name, component="Bot", guild=guild_id)
+            except Exception as e:
+                # Left out of the manifest, so it's tried again next start
+                self.logger.error("Error syncing command tree with guild: %s", e, component="Bot", guild=guild_id)
+
+        manifest.save()
+
+    async def _sync_guild(self, guild: discord.Guild):
+        """ Replaces the guild's commands with a copy of the global ones """
+        self.tree.clear_commands(guild=guild)
+        self.tree.copy_global_to(guild=guild)
+        await self.tree.sync(guild=guild)
 
     def _roll_for_gathering_occurrence(self, guild_id: int, gather_type: Literal["hunt", "steal"]) -> GatherOutcome:
         """
@@ -991,37 +1231,98 @@ class Pagget:
         :param guild_id: The ID of the guild to search in
         :return: Returns the affliction object and its index in the afflictions list
         """
-        return next(
-            (a, i) for i, a in enumerate(self.data.get_affliction_list(guild_id)) if
-            a.name.lower() == affliction_name.lower())
+        return self.data.find_affliction(guild_id, affliction_name)
 
     def _if_affliction_exists(self, affliction: str, guild_id: int) -> bool:
         """ Checks if affliction exists in the guild's affliction list """
-        return any(a.name.lower() == affliction.lower() for a in self.data.get_affliction_list(guild_id))
+        return self.data.find_affliction(guild_id, affliction) is not None
 
     def _validate_directory(self, directory: str) -> bool:
         if not os.path.exists(directory):
             self.console.print(
                 f"[yellow]Warning: Directory not found. Creating directory: {directory}.")
-            self.logger.log(f"Directory not found. Creating directory: {directory}", "Json")
+            self.logger.info(f"Directory not found. Creating directory: {directory}", component="Json")
             try:
                 os.makedirs(directory)
                 return True
             except Exception as e:
                 self.console.print(f"[red bold]Error creating directory: {e}")
-                self.logger.log(f"Error creating directory: {e}", "Json")
+                self.logger.error(f"Error creating directory: {e}", component="Json")
                 return False  # Return if directory creation fails
         return True
 
+    async def _open_session(self, interaction: discord.Interaction, game: str, bet: int) -> Optional[Session]:
+        """
+        Opens a session for a new game and holds the host's bet in it.
+        :return: The session, or None if the game can't start. The user has already been told why
+        """
+        try:
+            session = self.sessions.open(game, interaction.user.id, interaction.guild_id)
+        except SessionLimitReached as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return None
+
+        if not await self.sessions.hold(session, interaction.user.id, bet):
+            await self.sessions.close(session)
+            await interaction.response.send_message("You don't have enough berries to bet that much.", ephemeral=True)
+            return None
+        return session
+
+    def _collect_metrics(self) -> List[Metric]:
+        """ Everything served at /metrics. Runs on the event loop, so it only reads what's already counted """
+        last_save = self.data.last_saved_at or self.data.loaded_at
+        stats = self.command_stats
+        latency = self.client.latency
+
+        return [
+            ("pagget_balances", "gauge", "Users with a balance", [({}, len(self.data.balances))]),
+            ("pagget_guilds", "gauge", "Guilds with a config or affliction list", [({}, self.data.guild_count())]),
+            ("pagget_dirty_entries", "gauge", "Entries changed since the last save",
+             [({"file": file_name}, count) for file_name, count in self.data.dirty_counts().items()]),
+            ("pagget_last_save_duration_seconds", "gauge", "How long the last save took",
+             [({}, self.data.last_save_duration)]),
+            ("pagget_last_save_bytes", "gauge", "Size of the files written by the last save",
+             [({}, self.data.last_save_bytes)]),
+            ("pagget_seconds_since_save", "gauge", "Seconds since the data was last saved, or loaded if it hasn't been",
+             [({}, time.time() - last_save)] if last_save is not None else []),
+            ("pagget_active_sessions", "gauge", "Games that are running",
+             [({"game": game}, self.sessions.active_sessions(game)) for game in ("roulette", "blackjack", "slots")]),
+            ("pagget_held_berries", "gauge", "Berries held by running games", [({}, self.sessions.held_total)]),
+            ("pagget_live_views", "gauge", "Game views still in memory", [({}, self.sessions.live_views)]),
+            ("pagget_view_memory_bytes", "gauge", "Rough size of the game views still in memory",
+             [({}, self.sessions.view_memory())]),
+            ("pagget_clocked_games", "gauge", "Roulette tables counting down", [({}, self.game_clock.active_games)]),
+            ("pagget_event_loop_lag_seconds", "gauge", "Worst event loop wake up delay since the last scrape",
+             [({}, self.loop_lag.take_max_lag())]),
+            ("pagget_gateway_latency_seconds", "gauge", "Time between a gateway heartbeat and its acknowledgement",
+             [({}, latency)] if math.isfinite(latency) else []),
+            ("pagget_config_changes_total", "counter", "Guild config changes, counting each time they're loaded",
+             [({}, self.data.config_changes)]),
+            ("pagget_member_lookups_total", "counter", "Member lookups, by where they were answered",
+             [({"source": source}, count) for source, count in self.members.lookups.items()]),
+            ("pagget_cached_member_lookups", "gauge", "Member lookups held by the member cache",
+             [({}, len(self.members))]),
+            ("pagget_shard_latency_seconds", "gauge", "Gateway latency of each shard this process runs",
+             [({"shard": str(shard_id)}, shard_latency)
+              for shard_id, shard_latency in getattr(self.client, "latencies", []) if math.isfinite(shard_latency)]),
+            ("pagget_log_pending_lines", "gauge", "Log lines waiting to be written", [({}, self.logger.pending)]),
+            ("pagget_command_calls_total", "counter", "Command calls",
+             [({"command": command}, count) for command, count in stats.calls.items()]),
+            ("pagget_command_errors_total", "counter", "Command calls that raised an error",
+             [({"command": command}, count) for command, count in stats.errors.items()]),
+            ("pagget_command_late_acks_total", "counter", "Command calls acknowledged after Discord's deadline",
+             [({"command": command}, count) for command, count in stats.late_acks.items()]),
+        ]
+
     def _validate_user(self, user_id: int, guild_id: int) -> int:
         """ Returns the balance of the user, and sets users balance to the guilds starting balance from configs """
         if user_id in self.data.balances:
             return self.data.balances[user_id]
 
-        self.data.balances[user_id] = self.data.get_guild_config(guild_id).starting_pay
-        self.console.print("User balance created:", user_id)
-        self.logger.log(f"User balance created: {user_id}", "Bot")
-        return self.data.get_guild_config(guild_id).starting_pay
+        starting_pay = self.data.get_guild_config(guild_id).starting_pay
+        self.data.set_user_balance(user_id, starting_pay)
+        self.logger.info("User balance created", component="Bot", user=user_id, guild=guild_id)
+        return starting_pay
 
     def _write_token_file(self, token: str):
         if not self._validate_directory("data/"):
@@ -1031,71 +1332,183 @@ class Pagget:
             with open("data/bot_token.txt", "w") as f:
                 f.write(token)
             self.console.print("[green]Token saved to data/bot_token.txt[/]")
-            self.logger.log("Token saved to data/bot_token.txt", "Bot")
+            self.logger.info("Token saved to data/bot_token.txt", component="Bot")
         except Exception as e:
             self.console.print(f"[red]Error saving token to data/bot_token.txt: {e}")
-            self.logger.log(f"Error saving token to data/bot_token.txt: {e}", "Bot")
+            self.logger.error(f"Error saving token to data/bot_token.txt: {e}", component="Bot")
 
     def _exit_handler(self):
-        self.console.print("\n[red]Bot shutting down...[/]")
-        self.logger.log("Bot shutting down...", "Bot")
+        # A signal or exit() already saved everything, or ran out of time trying to
+        if self._shutdown_task is None:
+            self.console.print("\n[red]Bot shutting down...[/]")
+            self.logger.info("Bot shutting down...", component="Bot")
+            self._flush()
 
-        # Stop autosave thread if running
+        # Write out whatever is still queued in the log
+        self.logger.close()
+
+    def _flush(self):
+        """ Stops autosaving and saves the data. If the data never finished loading, there's nothing to save """
         self.data.stop_autosave_thread()
-        self.data.save()
+        if self.data.loaded_at is not None:
+            self.data.save()
+
+    # --- Shutting down --- #
+    def request_shutdown(self, reason: str = "exit"):
+        """ Starts shutting down the bot. Safe to call from any thread """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._begin_shutdown, reason)
+
+    def _begin_shutdown(self, reason: str):
+        if self._shutdown_task is not None:
+            self.logger.info("Already shutting down, ignoring %s", reason, component="Bot")
+            return
+        self._shutdown_task = asyncio.get_running_loop().create_task(self.shutdown(reason))
+
+    async def shutdown(self, reason: str):
+        """
+        Shuts the bot down without losing anything: no new games start, running games get a few seconds to finish and
+        the rest are refunded, the data is saved, and then the gateway is closed. It all has to fit in
+        `shutdown_timeout` seconds, so a deploy never waits on it forever. If saving runs out of time, the files are
+        left as they were last saved, since they're written atomically.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.shutdown_timeout
+        self.console.print(f"\n[red]Bot shutting down ({reason})...[/]")
+        self.logger.info("Bot shutting down", component="Bot", reason=reason, timeout=self.shutdown_timeout)
+
+        games, refunded = await self.sessions.drain(min(GAME_GRACE, self.shutdown_timeout / 2))
+        if games:
+            self.logger.warning("Refunded %d berries held by %d games that were still running", refunded, games,
+                                component="Bot")
+
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        self.loop_lag.stop()
+
+        # Saved on a daemon thread rather than the default executor, which asyncio.run waits on with no time limit
+        saved = loop.create_future()
+
+        def save():
+            try:
+                self._flush()
+            finally:
+                loop.call_soon_threadsafe(lambda: saved.done() or saved.set_result(None))
+
+        self.logger.info("Saving data", component="Bot", dirty=self.data.dirty_counts())
+        threading.Thread(target=save, name="Shutdown save", daemon=True).start()
+        try:
+            await asyncio.wait_for(saved, max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.console.print("[red]Saving didn't finish in time, closing anyway[/]")
+            self.logger.error("Saving didn't finish within the shutdown timeout, closing anyway", component="Bot",
+                              timeout=self.shutdown_timeout)
+
+        await self.client.close()
+
+    def _install_signal_handlers(self):
+        """ Shuts down cleanly on SIGTERM (what process supervisors send) and SIGINT (Ctrl+C) """
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                self._loop.add_signal_handler(sig, self._begin_shutdown, sig.name)
+            except (NotImplementedError, RuntimeError):
+                # Windows event loops can't handle signals themselves, so the handler passes them over to the loop
+                signal.signal(sig, lambda signum, frame: self.request_shutdown(signal.Signals(signum).name))
 
     def run(self):
         """Run the Discord bot."""
         atexit.register(self._exit_handler)
         token = None
-
-        # First try to get token from data/bot_token.txt
-        try:
-            with open("data/bot_token.txt", "r") as f:
-                token = f.read().strip()
-                if not validate_discord_token(token):
-                    self.console.print(
-                        "[red]Token file holds invalid Discord token, checking args. If args do not contain '--token=' then collecting manual input.[/]")
-                    token = None
-        except FileNotFoundError:
-            self.console.print(
-                "[yellow]Token file not found, checking args. If args do not contain '--token=' then collecting manual input.[/]")
+        save_token = False
 
         for arg in sys.argv:
             if arg == "--debug":
                 self.console.print("[yellow]Debug mode enabled[/]")
-                self.logger.log("Debug mode enabled", "Bot")
+                self.logger.info("Debug mode enabled, logging debug lines", component="Bot")
                 self.client.debug = True
             elif arg.startswith("--token="):
                 token = arg.split("=")[1]
+                save_token = True
 
-                if not validate_discord_token(token):
-                    token = None
-                    self.console.print("[red]Invalid token. Please enter your token.[/]")
-                    break
-
-                self._write_token_file(token)
-                break
+        # Otherwise use the token in data/bot_token.txt. It's checked when the bot logs in, not before
+        if token is None:
+            try:
+                with open("data/bot_token.txt", "r") as f:
+                    token = f.read().strip() or None
+            except FileNotFoundError:
+                self.console.print("[yellow]Token file not found and args do not contain '--token=', "
+                                   "collecting manual input.[/]")
 
         if token is None:
+            token = self._ask_for_token()
+            save_token = True
+        self.startup.mark("read token")
+
+        # The same logging discord.py sets up in Client.run
+        discord.utils.setup_logging()
+        try:
+            asyncio.run(self._start(token, save_token))
+        except KeyboardInterrupt:
+            # Client.run ignores these too, the exit handler still runs
+            return
+
+    async def _start(self, token: str, save_token: bool):
+        """
+        Logs in and connects to the gateway. Logging in is what checks the token, so an invalid one is asked for again
+        without an extra request to Discord
+        """
+        self._loop = asyncio.get_running_loop()
+        # The data is changed on this loop, so saves from other threads copy it here
+        self.data.loop = self._loop
+        self._install_signal_handlers()
+
+        async with self.client:
+            # The data doesn't need Discord, so it's loaded while logging in. Commands can only arrive once the bot is
+            # connected, which waits for it
+            bootstrap = asyncio.create_task(asyncio.to_thread(self._bootstrap))
+
             while True:
-                token = input("Enter your bot token > ")
-                if token == "":
-                    self.console.print("[red]Error: No token provided")
-                    self.logger.log("No token provided", "Bot")
-                    continue
-
-                if validate_discord_token(token):
-                    self._write_token_file(token)
+                try:
+                    await self.client.login(token)
                     break
-                print("Invalid token")
+                except discord.LoginFailure:
+                    self.console.print("[red]Invalid token. Please enter your token.[/]")
+                    self.logger.warning("Login failed, the token is invalid", component="Bot")
+                    token = await asyncio.to_thread(self._ask_for_token)
+                    save_token = True
 
-        self.client.run(token)
+            if save_token:
+                self._write_token_file(token)
+            await bootstrap
+            self.startup.mark("log in and load data")
+            await self.client.connect()
+
+    def _bootstrap(self):
+        """ Loads the data and gets everything commands need ready. Runs on its own thread, before connecting """
+        self.data.load()
+        self.data.warm()
+
+        # Give back the bets of any games that were still running when the bot last stopped. This has to happen before
+        # autosaving starts: a save clears the checkpoints' unsaved bets, and would make this refund bets that were
+        # never taken out of the saved balances
+        games, refunded = self.sessions.recover()
+        if games:
+            self.console.print(f"[yellow]Refunded {refunded} berries held by {games} unfinished games.[/]")
+            self.logger.warning("Refunded %d berries held by %d unfinished games", refunded, games, component="Bot")
+
+        self.data.start_autosave_thread()
+
+    def _ask_for_token(self) -> str:
+        while True:
+            token = input("Enter your bot token > ").strip()
+            if token:
+                return token
+            self.console.print("[red]Error: No token provided")
+            self.logger.warning("No token provided", component="Bot")
 
     def exit(self):
-        """Exit the bot gracefully."""
-        self._exit_handler()
-        self.client.close()
+        """Exit the bot gracefully. Returns straight away, the bot shuts down on its event loop"""
+        self.request_shutdown("exit")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+"""
+Runs the bot as several processes, each running some of its shards, that share their data through one state service.
+
+The state service (classes/state.py) is started first. It loads the data, and is the only process that saves it. Then
+one bot process is started for each group of shards, with --shard-count, --shards and --state set. Any other arguments
+are passed on to every bot process, and --metrics-port=<port> is counted up from for each one.
+
+SIGTERM or Ctrl+C stops the bot processes, which save through the state service as they shut down, and then the state
+service, which saves the files.
+
+The bot processes can't ask for a token, so it has to be in data/bot_token.txt or given with --token=<token>.
+
+Run from the repository root, for example:
+    python -m utils.launch --processes 2 --shard-count 4
+    python -m utils.launch --processes 3 --shard-count 6 -- --metrics-port=9100 --debug
+    python -m utils.launch --serve-state    (just the state service)
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import List
+
+from classes.state import SOCKET_PATH
+
+SERVICE_START_TIMEOUT = 30.0  # How long the state service gets to load the data and start listening, in seconds
+
+
+def shard_groups(shard_count: int, processes: int) -> List[List[int]]:
+    """ Splits the shards into one group of neighbouring shards for each process, as evenly as they go """
+    base, extra = divmod(shard_count, processes)
+    groups, start = [], 0
+    for process in range(processes):
+        size = base + (1 if process < extra else 0)
+        groups.append(list(range(start, start + size)))
+        start += size
+    return [group for group in groups if group]
+
+
+def bot_arguments(passed: List[str], process: int) -> List[str]:
+    """ The arguments passed on to a bot process, with its own metrics port """
+    arguments = []
+    for arg in passed:
+        if arg.startswith("--metrics-port="):
+            try:
+                arg = f"--metrics-port={int(arg.split('=')[1]) + process}"
+            except ValueError:
+                pass
+        arguments.append(arg)
+    return arguments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=2, help="How many bot processes to run")
+    parser.add_argument("--shard-count", type=int, default=None, help="How many shards in total (default: one per "
+                                                                        "process)")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Where the state service listens")
+    parser.add_argument("--serve-state", action="store_true", help="Only run the state service")
+    args, passed = parser.parse_known_args()
+    passed = [arg for arg in passed if arg != "--"]
+
+    if args.serve_state:
+        from classes.logger import Logger, set_root_logger
+        from classes.state import serve
+
+        logger = Logger("log.state.txt")
+        set_root_logger(logger)
+        try:
+            serve(args.socket)
+        finally:
+            logger.close()
+        return
+
+    shard_count = args.shard_count or args.processes
+    if args.processes < 1 or shard_count < args.processes:
+        parser.error("Every process needs at least one shard")
+    if not os.path.exists(os.path.join("data", "bot_token.txt")) and not any(arg.startswith("--token=")
+                                                                             for arg in passed):
+        parser.error("The bot processes can't ask for a token, put it in data/bot_token.txt or pass --token=<token>")
+
+    # In its own session, so Ctrl+C in the terminal only reaches the bot processes and the service outlives them
+    service = subprocess.Popen([sys.executable, "-m", "utils.launch", "--serve-state", "--socket", args.socket],
+                               start_new_session=True)
+    started = time.monotonic()
+    while not os.path.exists(args.socket):
+        if service.poll() is not None:
+            sys.exit(f"The state service stopped while starting (exit code {service.returncode}), see log.state.txt")
+        if time.monotonic() - started > SERVICE_START_TIMEOUT:
+            service.terminate()
+            sys.exit("The state service didn't start in time, see log.state.txt")
+        time.sleep(0.1)
+
+    bots = []
+    for process, shards in enumerate(shard_groups(shard_count, args.processes)):
+        command = [sys.executable, "main.py", f"--shard-count={shard_count}",
+                   f"--shards={','.join(map(str, shards))}", f"--state={args.socket}"]
+        bots.append(subprocess.Popen(command + bot_arguments(passed, process)))
+        print(f"Started shards {shards} (process {bots[-1].pid})")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        print("Stopping the bot processes...")
+        for bot in bots:
+            if bot.poll() is None:
+                bot.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Runs until every bot process has stopped, however they stopped. The state service goes last, so it has
+    # everything they saved on the way out
+    for bot in bots:
+        while bot.poll() is None:
+            time.sleep(0.5)
+        if not stopping:
+            print(f"Process {bot.pid} stopped (exit code {bot.returncode})")
+
+    service.send_signal(signal.SIGTERM)
+    service.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Replays a game or roll from the seed written to the log, to check a disputed outcome.
+
+Every game and affliction roll is given its own seeded generator (see classes/engines/rng.py), and the seed is logged
+on a line with the "RNG" component. Rolling the same generator again gives the same outcome, without connecting to
+Discord.
+
+Run from the repository root, for example:
+    python -m utils.replay roulette 1234567890
+    python -m utils.replay slots 1234567890 --spins 20 --bet 100
+    python -m utils.replay blackjack 1234567890:48,1234567890:49,1234567890:53,1234567890:54 --player-cards 2
+    python -m utils.replay affliction 1234567890 --guild 1234 --chance 25 --type general --season wet
+"""
+import argparse
+from typing import List
+
+from classes.engines import cards
+from classes.engines import roulette as wheel
+from classes.engines import slots as reels
+from classes.engines.rng import Stream
+
+
+def replay_roulette(seed: int) -> List[str]:
+    # Roulette._roll_values is the only roll a table makes
+    number = Stream(seed).randint(0, wheel.POCKETS - 1)
+    return [f"The ball landed on {wheel.pocket_color(number)} {number}"]
+
+
+def replay_slots(seed: int, spins: int, bet: int) -> List[str]:
+    # Single spins and auto spins both draw from the game's generator in order, so this is every spin of the game
+    outcomes = reels.spin_batch(spins, Stream(seed))
+    lines = []
+    for spin, outcome in enumerate(outcomes, start=1):
+        symbols = " | ".join(reels.SYMBOLS[symbol] for symbol in reels.outcome_reels(outcome))
+        lines.append(f"Spin {spin}: {symbols} ({reels.net_result(outcome, bet):+})")
+    return lines
+
+
+def replay_blackjack(draws: str, player_cards: int, decks: int) -> List[str]:
+    """
+    The cards a blackjack game drew, from the shuffle seed and position of each one. A guild's games share a shoe, so
+    a game's cards aren't always next to each other, and can come from more than one shuffle
+    """
+    shuffles = {}
+    lines = []
+    for index, draw in enumerate(draws.split(",")):
+        seed, position = (int(part) for part in draw.split(":"))
+        if seed not in shuffles:
+            # A shoe shuffles with a fresh generator from the seed, so this is the same order it dealt from
+            shuffles[seed] = cards.Shoe(decks, rng=Stream(seed)).cards
+        # The player's first two cards, then the dealer's two, then the player's hits, then the dealer's draws
+        role = "Player" if index < 2 or 4 <= index < player_cards + 2 else "Dealer"
+        lines.append(f"{role}: {cards.card_name(shuffles[seed][position])}")
+    return lines
+
+
+def replay_affliction(seed: int, guild_id: int, chance: float, roll_type: str, season: str) -> List[str]:
+    """ Rolls against the guild's affliction list as it is now. If the list has changed since, so can the result """
+    from classes.afflictions import AfflictionController
+    from classes.saving import Data
+
+    data = Data()
+    data.load()
+    afflictions = AfflictionController.roll(data.get_affliction_list(guild_id), chance, roll_type, season,
+                                            Stream(seed))
+    return [affliction.name for affliction in afflictions] or ["No afflictions"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a game or roll from its logged seed.")
+    subparsers = parser.add_subparsers(dest="game", required=True)
+
+    roulette_parser = subparsers.add_parser("roulette", help="The pocket a roulette table landed on")
+    roulette_parser.add_argument("seed", type=int)
+
+    slots_parser = subparsers.add_parser("slots", help="Every spin of a slots game, in order")
+    slots_parser.add_argument("seed", type=int)
+    slots_parser.add_argument("--spins", type=int, default=10)
+    slots_parser.add_argument("--bet", type=int, default=1)
+
+    blackjack_parser = subparsers.add_parser("blackjack", help="The cards of a blackjack game, from its logged draws")
+    blackjack_parser.add_argument("draws", help="The draws logged with the game, seed:position pairs split by commas")
+    blackjack_parser.add_argument("--player-cards", type=int, required=True, help="The player_cards logged with the "
+                                                                                  "game")
+    blackjack_parser.add_argument("--decks", type=int, default=cards.Shoe.DECKS)
+
+    affliction_parser = subparsers.add_parser("affliction", help="The afflictions an affliction roll gave")
+    affliction_parser.add_argument("seed", type=int)
+    affliction_parser.add_argument("--guild", type=int, required=True)
+    affliction_parser.add_argument("--chance", type=float, required=True)
+    affliction_parser.add_argument("--type", choices=["general", "minor", "birth"], default="general")
+    affliction_parser.add_argument("--season", choices=["wet", "dry"], required=True)
+
+    args = parser.parse_args()
+    if args.game == "roulette":
+        lines = replay_roulette(args.seed)
+    elif args.game == "slots":
+        lines = replay_slots(args.seed, args.spins, args.bet)
+    elif args.game == "blackjack":
+        lines = replay_blackjack(args.draws, args.player_cards, args.decks)
+    else:
+        lines = replay_affliction(args.seed, args.guild, args.chance, args.type, args.season)
+
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()